@@ -18,6 +18,8 @@ from .cmds.cmd_build import CmdBuild
 from .cmds.cmd_cache import CmdCache
 from .cmds.cmd_init import CmdInit
 from .cmds.cmd_update import CmdUpdate
+from .cache import parse_size
+from .ref_cache import parse_duration
 from .cmds.cmd_clone import CmdClone
 from .cmds.cmd_git_status import CmdGitStatus
 from .cmds.cmd_git_update import CmdGitUpdate
@@ -119,6 +121,23 @@ def get_parser(parser_ext : List = None, options_ext : List = None):
     cache_clean_cmd.add_argument("-d", "--days", dest="days", type=int, default=7,
         help="Remove entries older than this many days (default: 7)")
 
+    cache_gc_cmd = cache_subparser.add_parser("gc",
+        help="Remove least-recently-used cache entries until the cache fits a size budget")
+    cache_gc_cmd.add_argument("-c", "--cache-dir", dest="cache_dir",
+        help="Cache directory (default: $IVPM_CACHE)")
+    cache_gc_cmd.add_argument("--max-size", dest="max_size", type=parse_size, required=True,
+        help="Size budget for the cache on disk, git mirrors included (eg 500M, 200G, 1.5T)")
+    cache_gc_cmd.add_argument("--keep-referenced", dest="keep_referenced", nargs="+",
+        action="extend", default=[], metavar="LOCK_FILE",
+        help="Also keep the versions these package-lock.json files resolve to, those their deps directories link to, "
+             "and the git mirrors clones there borrow from. Workspaces last updated by an older IVPM are not "
+             "recorded in the cache, so the versions they use are otherwise removable")
+
+    cache_reindex_cmd = cache_subparser.add_parser("reindex",
+        help="Rebuild the cache's metadata index from the cached versions")
+    cache_reindex_cmd.add_argument("-c", "--cache-dir", dest="cache_dir",
+        help="Cache directory (default: $IVPM_CACHE)")
+
     _finalize_subparser_help(cache_subparser)
 
     cache_cmd.set_defaults(func=CmdCache())
@@ -177,6 +196,20 @@ def get_parser(parser_ext : List = None, options_ext : List = None):
         help="Uses dependencies from specified dep-set instead of default")
     update_cmd.add_argument("-j", "--jobs", dest="jobs", type=int, default=None,
         help="Maximum number of parallel package fetches (default: number of CPU cores)")
+    update_cmd.add_argument("--net-jobs", dest="net_jobs", type=int, default=None,
+        help="Maximum concurrent network operations (clone, download, ref lookup)")
+    update_cmd.add_argument("--unpack-jobs", dest="unpack_jobs", type=int, default=None,
+        help="Maximum concurrent archive extractions and cache stores")
+    update_cmd.add_argument("--handler-jobs", dest="handler_jobs", type=int, default=None,
+        help="Maximum concurrent per-package handler runs")
+    update_cmd.add_argument("--profile-out", dest="profile_out", default=None,
+        metavar="FILE",
+        help="Write a per-package phase timing profile (Chrome trace JSON, viewable in Perfetto) to FILE")
+    update_cmd.add_argument("--ref-ttl", dest="ref_ttl", type=parse_duration,
+        default=None, metavar="DURATION",
+        help="Re-use cached branch/tag resolutions of cache: true git packages checked within DURATION (eg 90s, 10m, 2h) without network access")
+    update_cmd.add_argument("--dissociate", dest="dissociate", action="store_true",
+        help="Copy objects borrowed from the cache's git mirrors into editable clones, so they do not depend on the cache")
     update_cmd.add_argument("-a", "--anonymous-git", dest="anonymous", 
         action="store_true",
         help="Clones git repositories in 'anonymous' mode")
@@ -218,6 +251,9 @@ def get_parser(parser_ext : List = None, options_ext : List = None):
     update_cmd.add_argument("--force", dest="force",
         action="store_true", default=False,
         help="Suppress safety errors during refresh; implies --refresh-all")
+    update_cmd.add_argument("--verify", dest="verify",
+        action="store_true",
+        help="Always run the full update, even if the workspace fingerprint shows nothing changed")
     update_cmd.add_argument("-v", "--verbose", action="count", default=0,
         help="Increase transcript output detail (-v: activity, -vv: subprocess lines)")
     subcommands["update"] = update_cmd
@@ -272,6 +308,8 @@ def get_parser(parser_ext : List = None, options_ext : List = None):
         help="Show modified/untracked files (-v); also show pypi packages (-v -v)")
     status_cmd.add_argument("--no-rich", action="store_true", default=False,
         help="Plain-text output without Rich formatting")
+    status_cmd.add_argument("-j", "--jobs", dest="jobs", type=int, default=0,
+        help="Number of packages to query in parallel (default: CPU count)")
 
     show_cmd = subparser.add_parser("show",
         help="Introspect registered package sources, content types, and handlers")
@@ -16,15 +16,68 @@
 #* limitations under the License.
 #*
 #****************************************************************************
+import errno
+import hashlib
+import json
+import logging
 import os
+import re
+import sqlite3
 import stat
 import shutil
+import threading
+import time
 import dataclasses as dc
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+from .cache_index import CacheIndex
+from .cache_lock import DEFAULT_TIMEOUT, CacheLock
 from .msg import note
+from .utils import make_tree_readonly
 from .site_config import get_site_config
 
 
+_logger = logging.getLogger("ivpm.cache")
+
+# Bare git mirrors, one per remote, that cache misses fetch into
+MIRRORS_DIR = ".mirrors"
+
+# Content-addressed file store: each distinct file content is kept once,
+# and cached versions are assembled from hardlinks to it
+OBJECTS_DIR = ".objects"
+
+# Each version directory <pkg>/<version> has a manifest <pkg>/<version>.manifest.json
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_FORMAT = 1
+
+# Errors from os.link() meaning the file system does not do hardlinks
+_NO_HARDLINK_ERRNOS = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP)
+
+_WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_size(text: str) -> int:
+    """Parse a size such as ``500M``, ``200G``, ``1.5T`` or ``1048576``
+    (bytes) into bytes. Units are binary; a trailing ``B``/``iB`` is
+    accepted."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*", str(text),
+                     re.IGNORECASE)
+    if m is None:
+        raise ValueError(
+            "invalid size %r (expected eg 500M, 200G, 1.5T)" % text)
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).lower()])
+
+
 @dc.dataclass
 class CacheResult:
     """Result of a cache operation."""
@@ -51,10 +104,17 @@ class Cache:
             else:
                 default = get_site_config().get_default_cache_dir()
                 self.cache_dir = default if default else None
+        # Seconds to wait for another process caching the same version
+        self.lock_timeout = DEFAULT_TIMEOUT
     
     def is_enabled(self) -> bool:
         """Check if the cache is properly configured and enabled."""
         return self.cache_dir is not None
+
+    @property
+    def index(self) -> CacheIndex:
+        """The cache's metadata index (see cache_index)."""
+        return CacheIndex(self.cache_dir)
     
     def get_package_cache_dir(self, package_name: str) -> str:
         """Get the cache directory for a specific package."""
@@ -65,10 +125,41 @@ class Cache:
         return os.path.join(self.cache_dir, package_name, version)
     
     def has_version(self, package_name: str, version: str) -> bool:
-        """Check if a specific version is cached."""
+        """Check if a specific version is cached.
+
+        A complete index answers misses by itself. A version the index
+        lists is also looked for on disk, as its directory may have been
+        removed without updating the index (by hand, by an older IVPM or
+        by a process that died mid-removal); such a stale row is dropped.
+        """
+        indexed = self._index_op("lookup", self.index.has_version, package_name, version)
+        if indexed is False:
+            return False
         version_dir = self.get_version_cache_dir(package_name, version)
-        return os.path.isdir(version_dir)
+        if os.path.isdir(version_dir):
+            return True
+        if indexed:
+            _logger.debug("Dropping stale index entry %s/%s", package_name, version)
+            self._index_op("drop", self.index.remove_version, package_name, version)
+        return False
     
+    def version_lock(self, package_name: str, version: str) -> CacheLock:
+        """Get the lock that a process holds while fetching and storing a
+        version, so that others wait for it rather than fetch it too."""
+        return CacheLock(self.cache_dir, package_name, version, self.lock_timeout)
+
+    def get_mirror_dir(self, url: str) -> str:
+        """Get the bare mirror repository for a git remote.
+
+        Mirrors live in ``.mirrors/`` and are keyed by URL, so packages
+        of different names that share a remote share its mirror.
+        """
+        base = url.rstrip("/").split("/")[-1].split(":")[-1]
+        if base.endswith(".git"):
+            base = base[:-4]
+        key = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, MIRRORS_DIR, "%s-%s.git" % (base, key))
+
     def ensure_cache_dir(self, package_name: str) -> str:
         """Ensure the package cache directory exists (with setgid)."""
         pkg_cache_dir = self.get_package_cache_dir(package_name)
@@ -80,13 +171,15 @@ class Cache:
                 pass
         return pkg_cache_dir
     
-    def store_version(self, package_name: str, version: str, source_path: str) -> str:
+    def store_version(self, package_name: str, version: str, source_path: str,
+                      source_url: Optional[str] = None) -> str:
         """Store a package version in the cache.
         
         Args:
             package_name: Name of the package
             version: Version identifier (e.g., commit hash)
             source_path: Path to the source directory to cache
+            source_url: Where the version was fetched from (for the index)
             
         Returns:
             Path to the cached version directory
@@ -97,6 +190,9 @@ class Cache:
             # Already cached — clean up the source that is no longer needed
             if os.path.exists(source_path):
                 shutil.rmtree(source_path)
+            if not self.has_version(package_name, version):
+                # Stored without updating the index (eg by an older IVPM)
+                self._index_version(package_name, version, source_url)
             return version_dir
         
         self.ensure_cache_dir(package_name)
@@ -105,8 +201,11 @@ class Cache:
         # This prevents a race where two parallel workers both pass
         # the existence check and try to populate the same directory.
         staging_dir = version_dir + ".staging.%d" % os.getpid()
+        # Before the first version lands, so a new index starts complete
+        self._index_op("create", self.index.create)
         try:
             shutil.move(source_path, staging_dir)
+            manifest, blobs, unshared = self._dedup_tree(staging_dir)
             os.rename(staging_dir, version_dir)
         except OSError:
             # Another process won the race — clean up our staging copy
@@ -118,11 +217,253 @@ class Cache:
                 return version_dir
             raise
         
-        # Make all files read-only
-        self._make_readonly(version_dir)
+        self._write_manifest(package_name, version, manifest)
+
+        # _dedup_tree() made the tree read-only and gathered its index
+        # data as it went, so the tree is not walked again here
+        files = sum(1 for f in manifest["files"].values() if "digest" in f)
+        record = self._version_record(
+            package_name, version, time.time(), manifest["logical_size"],
+            files, unshared, source_url, manifest)
+        self._index_op("store", self.index.add_version, record, blobs)
         
         note(f"Cached {package_name} version {version}")
         return version_dir
+
+    def _index_version(self, package_name: str, version: str,
+                       source_url: Optional[str] = None,
+                       manifest: Optional[dict] = None):
+        record, blobs = self._scan_version(
+            package_name, version, time.time(), source_url, manifest)
+        self._index_op("store", self.index.add_version, record, blobs)
+
+    def _scan_version(self, package_name: str, version: str, created: float,
+                      source_url: Optional[str] = None,
+                      manifest: Optional[dict] = None) -> Tuple[dict, Dict[str, int]]:
+        """Build the index record of a cached version from its files.
+
+        Files with other links (to the object store) are returned as blobs
+        keyed by inode, so the index can count each of them once; inode
+        numbers alone are used, as the device number of a network file
+        system differs between clients.
+        """
+        version_dir = self.get_version_cache_dir(package_name, version)
+        size = files = unshared = 0
+        blobs = {}
+        for root, dirs, names in os.walk(version_dir):
+            for name in names:
+                st = os.lstat(os.path.join(root, name))
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                size += st.st_size
+                files += 1
+                if st.st_nlink > 1:
+                    blobs[str(st.st_ino)] = st.st_size
+                else:
+                    unshared += st.st_size
+        if manifest is None:
+            manifest = self.read_manifest(package_name, version)
+        record = self._version_record(package_name, version, created, size,
+                                      files, unshared, source_url, manifest)
+        return record, blobs
+
+    @staticmethod
+    def _version_record(package_name: str, version: str, created: float,
+                        size: int, files: int, unshared: int,
+                        source_url: Optional[str],
+                        manifest: Optional[dict]) -> dict:
+        digest = None
+        if manifest is not None:
+            digest = hashlib.sha256(
+                json.dumps(manifest["files"], sort_keys=True).encode()).hexdigest()
+        return {
+            "package": package_name,
+            "version": version,
+            "size": size,
+            "files": files,
+            "unshared_size": unshared,
+            "created": created,
+            "last_used": created,
+            "source_url": source_url,
+            "digest": digest,
+        }
+
+    def _index_op(self, what: str, op, *args):
+        """Run an index operation, returning None if the index cannot be
+        used: a cache the user cannot write to works without it."""
+        try:
+            return op(*args)
+        except (sqlite3.Error, OSError) as e:
+            _logger.debug("Cache index not used for %s: %s", what, e)
+            return None
+
+    def reindex(self) -> int:
+        """Rebuild the index from the version directories. Returns the
+        number of versions indexed.
+
+        Last-use times and source URLs already in the index are kept.
+        """
+        index = self.index
+        known = {}
+        if index.exists():
+            known = {(r["package"], r["version"]): r for r in index.versions()}
+        entries = []
+        for pkg_name, version, version_dir in self._version_dirs():
+            old = known.get((pkg_name, version), {})
+            record, blobs = self._scan_version(
+                pkg_name, version, old.get("created", os.path.getmtime(version_dir)),
+                old.get("source_url"))
+            record["last_used"] = max(record["created"], old.get("last_used", 0))
+            entries.append((record, blobs))
+        index.rebuild(entries)
+        return len(entries)
+
+    def _version_dirs(self):
+        """Yield (package, version, path) of each version directory."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for pkg_name in sorted(os.listdir(self.cache_dir)):
+            pkg_dir = os.path.join(self.cache_dir, pkg_name)
+            if not os.path.isdir(pkg_dir) or pkg_name.startswith("."):
+                # Dot-entries hold cache metadata (eg .refs), not packages
+                continue
+            for version in sorted(os.listdir(pkg_dir)):
+                version_dir = os.path.join(pkg_dir, version)
+                # Skip versions still being stored
+                if os.path.isdir(version_dir) and ".staging." not in version:
+                    yield pkg_name, version, version_dir
+
+    def get_manifest_path(self, package_name: str, version: str) -> str:
+        """Get the manifest file of a cached package version."""
+        return self.get_version_cache_dir(package_name, version) + MANIFEST_SUFFIX
+
+    def read_manifest(self, package_name: str, version: str) -> Optional[dict]:
+        """Return the manifest of a cached version, or None if it has none
+        (eg it was stored by an older IVPM).
+
+        The manifest maps each file's path within the version to its
+        ``digest`` (sha256), ``size`` and ``x`` (executable) flag, or a
+        symlink to its ``link`` target.
+        """
+        try:
+            with open(self.get_manifest_path(package_name, version)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def get_object_path(self, digest: str, executable: bool = False) -> str:
+        """Get the content-addressed store path of a file's content.
+
+        Executable and plain files are stored apart: hardlinks share
+        their permission bits.
+        """
+        name = digest[2:] + ("-x" if executable else "")
+        return os.path.join(self.cache_dir, OBJECTS_DIR, digest[:2], name)
+
+    def _dedup_tree(self, path: str) -> Tuple[dict, Dict[str, int], int]:
+        """Hash each file in the tree at 'path', replacing it with a
+        hardlink to the identical file already in the object store, or
+        adding it there. Returns the tree's manifest, and its index data:
+        the shared files ({inode key: size}) and the bytes not shared.
+
+        Where hardlinks are not possible (another file system, or files
+        of another user on a kernel with protected hardlinks) files are
+        simply left in place.
+
+        The tree is locked down in the same pass (see ``_make_readonly``):
+        store objects are read-only already, files left in place have
+        their write bits cleared, and directories are set to 2775.
+        """
+        files = {}
+        blobs = {}
+        logical_size = unshared = 0
+        linking = True
+        for root, dirs, names in os.walk(path):
+            try:
+                os.chmod(root, self._DIR_MODE)
+            except OSError:
+                pass
+            for name in names:
+                file_path = os.path.join(root, name)
+                rel = os.path.relpath(file_path, path)
+                st = os.lstat(file_path)
+                if stat.S_ISLNK(st.st_mode):
+                    files[rel] = {"link": os.readlink(file_path)}
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                digest = _file_digest(file_path)
+                executable = bool(st.st_mode & stat.S_IXUSR)
+                files[rel] = {"digest": digest, "size": st.st_size}
+                if executable:
+                    files[rel]["x"] = True
+                logical_size += st.st_size
+                inode = None
+                if linking:
+                    inode, linking = self._link_object(file_path, digest, executable, st)
+                if inode is not None:
+                    blobs[str(inode)] = st.st_size
+                    continue
+                unshared += st.st_size
+                if st.st_mode & _WRITE_BITS:
+                    try:
+                        os.chmod(file_path, stat.S_IMODE(st.st_mode) & ~_WRITE_BITS)
+                    except OSError:
+                        pass
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "logical_size": logical_size,
+            "files": files,
+        }
+        return manifest, blobs, unshared
+
+    def _link_object(self, file_path: str, digest: str, executable: bool,
+                     st: os.stat_result) -> Tuple[Optional[int], bool]:
+        """Share 'file_path' (whose lstat() is 'st') through the object
+        store. Returns the inode it now shares (None if it was not
+        shared) and whether the file system supports hardlinks."""
+        obj = self.get_object_path(digest, executable)
+        mode = 0o555 if executable else 0o444
+        tmp = None
+        try:
+            try:
+                obj_st = os.stat(obj)
+            except FileNotFoundError:
+                obj_st = None
+            if obj_st is not None:
+                tmp = file_path + ".ivpm-link"
+                os.link(obj, tmp)
+                os.replace(tmp, file_path)
+                return obj_st.st_ino, True
+            self._ensure_dir(os.path.dirname(obj))
+            os.chmod(file_path, mode)
+            tmp = obj + ".tmp.%d.%d" % (os.getpid(), threading.get_ident())
+            os.link(file_path, tmp)
+            os.replace(tmp, obj)
+            return st.st_ino, True
+        except OSError as e:
+            if tmp is not None and os.path.lexists(tmp):
+                os.unlink(tmp)
+            _logger.debug("Not sharing %s: %s", file_path, e)
+            return None, e.errno not in _NO_HARDLINK_ERRNOS
+
+    def _write_manifest(self, package_name: str, version: str, manifest: dict):
+        path = self.get_manifest_path(package_name, version)
+        tmp = path + ".tmp.%d.%d" % (os.getpid(), threading.get_ident())
+        with open(tmp, "w") as fp:
+            json.dump(manifest, fp, sort_keys=True)
+        os.replace(tmp, path)
+
+    def _ensure_dir(self, path: str):
+        """Create a cache-internal directory with the shared-cache mode."""
+        if os.path.isdir(path):
+            return
+        os.makedirs(path, exist_ok=True)
+        for d in (os.path.dirname(path), path):
+            try:
+                os.chmod(d, self._DIR_MODE)
+            except OSError:
+                pass
     
     def link_to_deps(self, package_name: str, version: str, deps_dir: str) -> str:
         """Create a symlink from the deps directory to the cached version.
@@ -144,9 +485,39 @@ class Cache:
             shutil.rmtree(link_path)
         
         os.symlink(version_dir, link_path)
+        self.record_use(package_name, version, deps_dir)
         note(f"Linked {package_name} from cache")
         return link_path
-    
+
+    def record_use(self, package_name: str, version: str,
+                   deps_dir: Optional[str] = None):
+        """Record that a cached version was just used, and (if given) that
+        'deps_dir' links into the cache, so ``gc`` keeps what it links to.
+
+        Usage records are best-effort: a cache the user cannot write to
+        is used without them.
+        """
+        if deps_dir is not None:
+            deps_dir = os.path.realpath(deps_dir)
+        self._index_op("usage", self.index.record_use,
+                       package_name, version, time.time(), deps_dir)
+
+    def record_path_use(self, path: str, deps_dir: Optional[str] = None):
+        """Record a use of the cached version 'path' resolves into (eg a
+        deps-source entry that links to the cache). Other paths are ignored."""
+        ref = self._version_of_path(path)
+        if ref is not None:
+            self.record_use(ref[0], ref[1], deps_dir)
+
+    def _version_of_path(self, path: str) -> Optional[Tuple[str, str]]:
+        """Return the (package, version) 'path' resolves into, or None."""
+        rel = os.path.relpath(os.path.realpath(path),
+                              os.path.realpath(self.cache_dir))
+        parts = rel.split(os.sep)
+        if len(parts) < 2 or parts[0] == os.pardir or parts[0].startswith("."):
+            return None
+        return parts[0], parts[1]
+
     # Permission bits used for shared-cache directories.
     # rwxrwsr-x: owner+group can read/write/traverse, setgid propagates
     # group ownership to new entries, others can read/traverse.
@@ -165,52 +536,95 @@ class Cache:
           cleanup.  The setgid bit ensures new entries inherit the
           directory's group.
 
-        Silently skips entries that cannot be ``chmod``-ed (e.g. owned
-        by another user in a shared cache).
+        ``store_version`` does this as part of ``_dedup_tree``; this
+        full (parallel) walk is for trees stored otherwise.  Silently
+        skips entries that cannot be ``chmod``-ed (e.g. owned by another
+        user in a shared cache).
         """
-        for root, dirs, files in os.walk(path):
-            for d in dirs:
-                try:
-                    os.chmod(os.path.join(root, d), self._DIR_MODE)
-                except OSError:
-                    pass
-            for f in files:
-                try:
-                    fp = os.path.join(root, f)
-                    mode = os.stat(fp).st_mode
-                    os.chmod(fp, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
-                except OSError:
-                    pass
-        try:
-            os.chmod(path, self._DIR_MODE)
-        except OSError:
-            pass
+        make_tree_readonly(path, dir_mode=self._DIR_MODE)
     
     def get_cache_info(self) -> dict:
         """Get information about the cache.
         
         Returns dict with:
         - packages: list of package info dicts with name, versions, total_size
+          and physical_size
         - total_size: total size of cache in bytes
+        - physical_size: bytes actually used on disk, counting each file
+          shared through the object store once
+
+        Sizes of versions and packages are logical: the bytes a copy of
+        their files would take.
+
+        The information comes from the index, which is rebuilt first if
+        it is incomplete. If the index cannot be used the cache is scanned.
         """
         result = {
             "packages": [],
-            "total_size": 0
+            "total_size": 0,
+            "physical_size": 0
         }
         
         if not os.path.isdir(self.cache_dir):
             return result
+
+        try:
+            if not self.index.is_complete():
+                self.reindex()
+            records = self.index.versions()
+            result["physical_size"], pkg_physical = self.index.physical_sizes()
+        except (sqlite3.Error, OSError) as e:
+            _logger.debug("Scanning the cache, as its index cannot be used: %s", e)
+            return self._scan_cache_info()
+
+        packages = {}
+        for r in records:
+            pkg_info = packages.get(r["package"])
+            if pkg_info is None:
+                pkg_info = packages[r["package"]] = {
+                    "name": r["package"],
+                    "versions": [],
+                    "total_size": 0,
+                    "physical_size": pkg_physical.get(r["package"], 0)
+                }
+                result["packages"].append(pkg_info)
+            pkg_info["versions"].append({
+                "version": r["version"],
+                "size": r["size"],
+                "mtime": r["created"],
+                "last_used": r["last_used"],
+                "files": r["files"],
+                "source_url": r["source_url"],
+                "digest": r["digest"]
+            })
+            pkg_info["total_size"] += r["size"]
+            result["total_size"] += r["size"]
+        return result
+
+    def _scan_cache_info(self) -> dict:
+        """Get the information of ``get_cache_info`` by walking the cache."""
+        result = {
+            "packages": [],
+            "total_size": 0,
+            "physical_size": 0
+        }
+
+        # Inodes counted towards the cache's physical size
+        seen = set()
         
         for pkg_name in os.listdir(self.cache_dir):
             pkg_dir = os.path.join(self.cache_dir, pkg_name)
-            if not os.path.isdir(pkg_dir):
+            if not os.path.isdir(pkg_dir) or pkg_name.startswith("."):
+                # Dot-entries hold cache metadata (eg .refs), not packages
                 continue
             
             pkg_info = {
                 "name": pkg_name,
                 "versions": [],
-                "total_size": 0
+                "total_size": 0,
+                "physical_size": 0
             }
+            pkg_seen = set()
             
             for version in os.listdir(pkg_dir):
                 version_dir = os.path.join(pkg_dir, version)
@@ -219,6 +633,8 @@ class Cache:
                 
                 size = self._get_dir_size(version_dir)
                 mtime = os.path.getmtime(version_dir)
+                pkg_info["physical_size"] += self._get_physical_size(version_dir, pkg_seen)
+                result["physical_size"] += self._get_physical_size(version_dir, seen)
                 
                 pkg_info["versions"].append({
                     "version": version,
@@ -229,8 +645,28 @@ class Cache:
             
             result["packages"].append(pkg_info)
             result["total_size"] += pkg_info["total_size"]
+
+        # Objects no version links to any more
+        objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR)
+        if os.path.isdir(objects_dir):
+            result["physical_size"] += self._get_physical_size(objects_dir, seen)
         
         return result
+
+    def _get_physical_size(self, path: str, seen: set) -> int:
+        """Get the size of the files under 'path' whose inodes are not yet
+        in 'seen', adding them to it."""
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                st = os.lstat(os.path.join(root, f))
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                key = (st.st_dev, st.st_ino)
+                if key not in seen:
+                    seen.add(key)
+                    total += st.st_size
+        return total
     
     def _get_dir_size(self, path: str) -> int:
         """Get total size of a directory in bytes."""
@@ -256,7 +692,8 @@ class Cache:
         
         for pkg_name in os.listdir(self.cache_dir):
             pkg_dir = os.path.join(self.cache_dir, pkg_name)
-            if not os.path.isdir(pkg_dir):
+            if not os.path.isdir(pkg_dir) or pkg_name.startswith("."):
+                # Dot-entries hold cache metadata (eg .refs), not packages
                 continue
             
             for version in list(os.listdir(pkg_dir)):
@@ -266,43 +703,270 @@ class Cache:
                 
                 mtime = os.path.getmtime(version_dir)
                 if mtime < cutoff:
-                    # Need to make writable before removing
-                    self._make_writable(version_dir)
-                    shutil.rmtree(version_dir)
+                    if self.index.exists():
+                        self._index_op("clean", self.index.remove_version, pkg_name, version)
+                    self._remove_tree(version_dir)
+                    manifest = version_dir + MANIFEST_SUFFIX
+                    if os.path.isfile(manifest):
+                        os.unlink(manifest)
                     removed += 1
                     note(f"Removed cached {pkg_name}/{version}")
             
             # Remove empty package directories
             if not os.listdir(pkg_dir):
                 os.rmdir(pkg_dir)
+
+        if removed > 0:
+            self._prune_objects()
         
         return removed
-    
-    def _make_writable(self, path: str):
-        """Restore write permission before ``shutil.rmtree``.
 
-        Directories in the cache are already writable (2775), so only
-        files need the write bit restored.  Skips entries that cannot
-        be modified (owned by another user).
+    def gc(self, max_size: int,
+           keep_versions: Optional[Dict[str, List[str]]] = None,
+           keep_deps_dirs: Iterable[str] = ()) -> dict:
+        """Remove the least-recently-used versions until the cache takes at
+        most 'max_size' bytes on disk.
+
+        A version's last use is the later of its last recorded use (see
+        ``record_use``) and the time it was stored. Never removed are:
+
+        * versions linked from the registered workspaces' deps directories
+          that still exist, and from 'keep_deps_dirs';
+        * versions named in 'keep_versions' (package -> version keys, or
+          key prefixes such as a commit hash of a sparse version).
+
+        Git mirrors (``.mirrors/``) count toward the budget too, and are
+        removed in the same order by their last fetch, except those that
+        clones in the same deps directories borrow objects from. A removed
+        mirror is fetched again when next needed.
+
+        Returns a dict with ``removed`` (list of (package, version)),
+        ``mirrors_removed`` (list of mirror names), ``freed`` (bytes),
+        ``physical_size`` (bytes on disk afterwards) and ``mirror_size``
+        (the part of it taken by mirrors).
         """
-        for root, dirs, files in os.walk(path, topdown=False):
-            for f in files:
+        result = {"removed": [], "mirrors_removed": [], "freed": 0,
+                  "physical_size": 0, "mirror_size": 0}
+        if not os.path.isdir(self.cache_dir):
+            return result
+
+        self._prune_objects()
+        index = self.index
+        if not index.is_complete():
+            self.reindex()
+        keep_versions = keep_versions or {}
+        workspaces = index.workspaces()
+        live = [d for d in workspaces if os.path.isdir(d)]
+        index.remove_workspaces(set(workspaces) - set(live))
+        protected = self._linked_versions(live + list(keep_deps_dirs))
+        borrowed = self._borrowed_mirrors(live + list(keep_deps_dirs))
+
+        # The size and number of links from versions of each shared file:
+        # removing a version frees the files only it links to (the object
+        # store's link goes with them)
+        inodes = {}
+        version_blobs = {}
+        for pkg_name, version, inode, size in index.blobs():
+            entry = inodes.setdefault(inode, [size, 0])
+            entry[1] += 1
+            version_blobs.setdefault((pkg_name, version), []).append(inode)
+        records = index.versions()
+        mirrors = self._mirror_records()
+
+        size = (sum(entry[0] for entry in inodes.values())
+                + sum(r["unshared_size"] for r in records))
+        mirror_size = sum(m["size"] for m in mirrors)
+        size += mirror_size
+        for r in sorted(records + mirrors,
+                        key=lambda r: (r["last_used"], r["package"], r["version"])):
+            if size <= max_size:
+                break
+            pkg_name, version = r["package"], r["version"]
+            if pkg_name == MIRRORS_DIR:
+                if version in borrowed:
+                    continue
+                self._remove_mirror(version)
+                size -= r["size"]
+                mirror_size -= r["size"]
+                result["freed"] += r["size"]
+                result["mirrors_removed"].append(version)
+                note(f"Removed git mirror {version}")
+                continue
+            if ((pkg_name, version) in protected
+                    or _version_matches(version, keep_versions.get(pkg_name, ()))):
+                continue
+            # Unlisted first, so nothing links to a half-removed version
+            index.remove_version(pkg_name, version)
+            version_dir = self.get_version_cache_dir(pkg_name, version)
+            if os.path.isdir(version_dir):
+                self._remove_tree(version_dir)
+            manifest = version_dir + MANIFEST_SUFFIX
+            if os.path.isfile(manifest):
+                os.unlink(manifest)
+            freed = r["unshared_size"]
+            for inode in version_blobs.get((pkg_name, version), ()):
+                entry = inodes[inode]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    freed += entry[0]
+            size -= freed
+            result["freed"] += freed
+            result["removed"].append((pkg_name, version))
+            note(f"Removed cached {pkg_name}/{version}")
+            pkg_dir = self.get_package_cache_dir(pkg_name)
+            if os.path.isdir(pkg_dir) and not os.listdir(pkg_dir):
+                os.rmdir(pkg_dir)
+
+        if result["removed"]:
+            self._prune_objects()
+        result["physical_size"] = size
+        result["mirror_size"] = mirror_size
+        return result
+
+    def _mirror_records(self) -> List[dict]:
+        """Return the size and last fetch of each git mirror, as records
+        that sort with the index's version records."""
+        mirrors_dir = os.path.join(self.cache_dir, MIRRORS_DIR)
+        try:
+            names = os.listdir(mirrors_dir)
+        except OSError:
+            return []
+        records = []
+        for name in names:
+            path = os.path.join(mirrors_dir, name)
+            if not name.endswith(".git") or not os.path.isdir(path):
+                continue
+            size = 0
+            for root, _, files in os.walk(path):
+                for f in files:
+                    try:
+                        size += os.lstat(os.path.join(root, f)).st_size
+                    except OSError:
+                        pass
+            # Every fetch rewrites FETCH_HEAD
+            fetch_head = os.path.join(path, "FETCH_HEAD")
+            last_fetch = os.path.getmtime(
+                fetch_head if os.path.isfile(fetch_head) else path)
+            records.append({"package": MIRRORS_DIR, "version": name,
+                            "last_used": last_fetch, "size": size})
+        return records
+
+    def _borrowed_mirrors(self, deps_dirs: Iterable[str]) -> set:
+        """Return the names of the mirrors that clones in 'deps_dirs'
+        borrow objects from (see ``git clone --reference``)."""
+        mirrors_dir = os.path.realpath(os.path.join(self.cache_dir, MIRRORS_DIR))
+        borrowed = set()
+        for deps_dir in deps_dirs:
+            try:
+                names = os.listdir(deps_dir)
+            except OSError:
+                continue
+            for name in names:
+                info_dir = os.path.join(deps_dir, name, ".git", "objects", "info")
                 try:
-                    fp = os.path.join(root, f)
-                    mode = os.stat(fp).st_mode
-                    os.chmod(fp, mode | stat.S_IWUSR)
+                    with open(os.path.join(info_dir, "alternates")) as fp:
+                        lines = fp.read().splitlines()
                 except OSError:
-                    pass
-            for d in dirs:
+                    continue
+                for line in lines:
+                    # Relative entries are relative to the objects directory
+                    objects = os.path.realpath(
+                        os.path.join(os.path.dirname(info_dir), line.strip()))
+                    mirror = os.path.dirname(objects)
+                    if os.path.dirname(mirror) == mirrors_dir:
+                        borrowed.add(os.path.basename(mirror))
+        return borrowed
+
+    def _remove_mirror(self, name: str):
+        """Remove git mirror 'name'. It is first moved aside, so that a
+        fetch into it from another process fails rather than finding a
+        half-removed repository."""
+        path = os.path.join(self.cache_dir, MIRRORS_DIR, name)
+        doomed = os.path.join(self.cache_dir, MIRRORS_DIR,
+                              ".%s.removed.%d" % (name, os.getpid()))
+        try:
+            os.rename(path, doomed)
+        except OSError:
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    def register_workspace(self, deps_dir: str):
+        """Record that 'deps_dir' holds clones that borrow objects from
+        the cache's mirrors, so ``gc`` keeps those mirrors."""
+        self._index_op("usage", self.index.add_workspace, os.path.realpath(deps_dir))
+
+    def _linked_versions(self, deps_dirs: Iterable[str]) -> set:
+        """Return the (package, version)s the entries of 'deps_dirs' link to."""
+        linked = set()
+        for deps_dir in deps_dirs:
+            try:
+                names = os.listdir(deps_dir)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(deps_dir, name)
+                if os.path.islink(path):
+                    ref = self._version_of_path(path)
+                    if ref is not None:
+                        linked.add(ref)
+        return linked
+
+    def _prune_objects(self) -> int:
+        """Remove objects no cached version links to. Returns the number
+        of bytes freed."""
+        freed = 0
+        objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR)
+        if not os.path.isdir(objects_dir):
+            return freed
+        for shard in os.listdir(objects_dir):
+            shard_dir = os.path.join(objects_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                obj = os.path.join(shard_dir, name)
                 try:
-                    dp = os.path.join(root, d)
-                    os.chmod(dp, self._DIR_MODE)
+                    st = os.lstat(obj)
+                    if st.st_nlink == 1 and ".tmp." not in name:
+                        os.unlink(obj)
+                        freed += st.st_size
                 except OSError:
                     pass
-        try:
-            os.chmod(path, self._DIR_MODE)
-        except OSError:
-            pass
+            try:
+                os.rmdir(shard_dir)
+            except OSError:
+                pass
+        return freed
+    
+    def _remove_tree(self, path: str):
+        """Remove a cached tree.
+
+        Unlinking a read-only file only takes write permission on its
+        directory, and cache directories are writable (2775) already, so
+        files are never chmod-ed — which matters for files shared through
+        the object store, that other versions still use read-only.  A
+        directory locked down otherwise (eg by an older IVPM) is made
+        writable when removing an entry from it fails.
+        """
+        def fix_dir(func, p, exc_info):
+            parent = os.path.dirname(p)
+            if (func not in (os.unlink, os.rmdir)
+                    or not isinstance(exc_info[1], PermissionError)
+                    or parent in fixed):
+                raise exc_info[1]
+            fixed.add(parent)
+            os.chmod(parent, self._DIR_MODE)
+            func(p)
+        fixed = set()
+        shutil.rmtree(path, onerror=fix_dir)
+
+
+def _version_matches(version: str, keys: Iterable[str]) -> bool:
+    """Check whether cache version 'version' is one of 'keys', or a
+    variant of one (eg "<commit>-sparse-<digest>", "<tag>_<os>_<arch>")."""
+    for key in keys:
+        if key and (version == key or version.startswith((key + "-", key + "_"))):
+            return True
+    return False
 
 
 def is_github_url(url: str) -> bool:
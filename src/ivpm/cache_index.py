@@ -0,0 +1,251 @@
+#****************************************************************************
+#* cache_index.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+cache_index.py — SQLite index of the versions stored in an IVPM cache.
+
+Without an index, ``ivpm cache info`` and ``ivpm cache gc`` stat every
+file of every cached version, which takes minutes on a large cache on
+NFS.  The index (``<cache_dir>/.index.sqlite``) records, per version, its
+size, file count, store and last-use times, source URL and a digest of
+its manifest, plus the inodes of its files that are shared through the
+object store, from which sizes on disk are computed.
+
+``Cache.store_version``, ``Cache.gc`` and ``Cache.clean_older_than``
+update the index as they add and remove versions, one transaction per
+version; ``Cache.record_use`` records last uses and workspaces in it.
+An index created over a cache that already holds versions is marked
+incomplete until ``ivpm cache reindex`` (``Cache.reindex``) rebuilds it
+from the version directories.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_logger = logging.getLogger("ivpm.cache_index")
+
+INDEX_FILE = ".index.sqlite"
+SCHEMA_VERSION = 1
+
+# Seconds to wait for another process's write transaction
+_BUSY_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS versions (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    unshared_size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    source_url TEXT,
+    digest TEXT,
+    PRIMARY KEY (package, version)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    inode TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (package, version, inode)
+);
+CREATE INDEX IF NOT EXISTS blobs_inode ON blobs (inode);
+CREATE TABLE IF NOT EXISTS workspaces (
+    path TEXT PRIMARY KEY
+);
+"""
+
+# Columns of a version record, in table order
+VERSION_FIELDS = ("package", "version", "size", "files", "unshared_size",
+                  "created", "last_used", "source_url", "digest")
+
+
+class CacheIndex(object):
+    """The metadata index of the cache in 'cache_dir'.
+
+    Version records are dicts with the keys of ``VERSION_FIELDS``, where
+    ``size`` is the logical size and ``unshared_size`` the bytes of files
+    not shared through the object store. Shared files are listed as
+    ``blobs``: {inode key: size}.
+
+    Each operation opens its own connection, so an index may be used from
+    several threads and processes at once.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.path = os.path.join(cache_dir, INDEX_FILE)
+        self._cache_dir = cache_dir
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open the index (creating it if needed) for one transaction."""
+        created = not self.exists()
+        db = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT)
+        try:
+            if created:
+                self._create(db)
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _create(self, db: sqlite3.Connection):
+        db.executescript(_SCHEMA)
+        # Versions stored before the index existed are not in it yet
+        complete = not any(self._version_dirs())
+        with db:
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('schema', ?)",
+                       (str(SCHEMA_VERSION),))
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('complete', ?)",
+                       ("1" if complete else "0",))
+        try:
+            os.chmod(self.path, 0o664)
+        except OSError:
+            pass
+
+    def _version_dirs(self):
+        for pkg_name in os.listdir(self._cache_dir):
+            pkg_dir = os.path.join(self._cache_dir, pkg_name)
+            if pkg_name.startswith(".") or not os.path.isdir(pkg_dir):
+                continue
+            for version in os.listdir(pkg_dir):
+                if ".staging." not in version and os.path.isdir(os.path.join(pkg_dir, version)):
+                    yield version
+
+    def create(self):
+        """Create the index if it does not exist yet."""
+        if not self.exists():
+            with self._connect():
+                pass
+
+    def is_complete(self) -> bool:
+        """Check whether the index lists every version in the cache."""
+        if not self.exists():
+            return False
+        with self._connect() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone()
+        return row is not None and row[0] == "1"
+
+    def has_version(self, package: str, version: str) -> Optional[bool]:
+        """Return whether 'package'/'version' is cached, or None if the
+        index cannot tell (it is missing or incomplete)."""
+        if not self.exists():
+            return None
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT (SELECT value FROM meta WHERE key = 'complete'),"
+                " EXISTS (SELECT 1 FROM versions WHERE package = ? AND version = ?)",
+                (package, version)).fetchone()
+        if row[1]:
+            return True
+        return False if row[0] == "1" else None
+
+    def add_version(self, record: dict, blobs: Dict[str, int]):
+        """Add (or replace) a version and its shared files."""
+        with self._connect() as db:
+            self._insert(db, record, blobs)
+
+    def _insert(self, db: sqlite3.Connection, record: dict, blobs: Dict[str, int]):
+        key = (record["package"], record["version"])
+        db.execute("DELETE FROM blobs WHERE package = ? AND version = ?", key)
+        db.execute(
+            "INSERT OR REPLACE INTO versions VALUES (%s)" % ",".join("?" * len(VERSION_FIELDS)),
+            tuple(record[f] for f in VERSION_FIELDS))
+        db.executemany(
+            "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)",
+            ((key[0], key[1], inode, size) for inode, size in blobs.items()))
+
+    def remove_version(self, package: str, version: str):
+        with self._connect() as db:
+            db.execute("DELETE FROM blobs WHERE package = ? AND version = ?", (package, version))
+            db.execute("DELETE FROM versions WHERE package = ? AND version = ?", (package, version))
+
+    def record_use(self, package: str, version: str, when: float,
+                   workspace: Optional[str] = None):
+        """Set the last use of a version, and register 'workspace'."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE versions SET last_used = ?"
+                " WHERE package = ? AND version = ? AND last_used < ?",
+                (when, package, version, when))
+            if workspace is not None:
+                db.execute("INSERT OR IGNORE INTO workspaces VALUES (?)", (workspace,))
+
+    def versions(self) -> List[dict]:
+        """Return the records of all indexed versions."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT %s FROM versions ORDER BY package, version"
+                % ", ".join(VERSION_FIELDS)).fetchall()
+        return [dict(zip(VERSION_FIELDS, row)) for row in rows]
+
+    def blobs(self) -> Iterable[Tuple[str, str, str, int]]:
+        """Return the (package, version, inode, size) of all shared files."""
+        with self._connect() as db:
+            return db.execute("SELECT package, version, inode, size FROM blobs").fetchall()
+
+    def physical_sizes(self) -> Tuple[int, Dict[str, int]]:
+        """Return the bytes on disk of the whole cache and of each package,
+        counting each shared file once."""
+        with self._connect() as db:
+            shared = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM"
+                " (SELECT MAX(size) AS size FROM blobs GROUP BY inode)").fetchone()[0]
+            unshared = db.execute(
+                "SELECT COALESCE(SUM(unshared_size), 0) FROM versions").fetchone()[0]
+            per_pkg = dict(db.execute(
+                "SELECT package, SUM(unshared_size) FROM versions GROUP BY package"))
+            for pkg, size in db.execute(
+                    "SELECT package, SUM(size) FROM"
+                    " (SELECT package, MAX(size) AS size FROM blobs GROUP BY package, inode)"
+                    " GROUP BY package"):
+                per_pkg[pkg] = per_pkg.get(pkg, 0) + size
+        return shared + unshared, per_pkg
+
+    def add_workspace(self, workspace: str):
+        with self._connect() as db:
+            db.execute("INSERT OR IGNORE INTO workspaces VALUES (?)", (workspace,))
+
+    def workspaces(self) -> List[str]:
+        with self._connect() as db:
+            return [row[0] for row in db.execute("SELECT path FROM workspaces ORDER BY path")]
+
+    def remove_workspaces(self, paths: Iterable[str]):
+        with self._connect() as db:
+            db.executemany("DELETE FROM workspaces WHERE path = ?", ((p,) for p in paths))
+
+    def rebuild(self, entries: Iterable[Tuple[dict, Dict[str, int]]]):
+        """Replace the index's versions with 'entries' ((record, blobs)
+        pairs) and mark it complete. Registered workspaces are kept."""
+        with self._connect() as db:
+            db.execute("DELETE FROM blobs")
+            db.execute("DELETE FROM versions")
+            for record, blobs in entries:
+                self._insert(db, record, blobs)
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
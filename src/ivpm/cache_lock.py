@@ -0,0 +1,263 @@
+#****************************************************************************
+#* cache_lock.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+cache_lock.py — cross-process locks for populating cache entries.
+
+When many processes (eg CI jobs started on the same new commit) miss the
+cache on the same package version, the first to take the version's lock
+fetches it; the others wait, then find it cached and link to it.  Locks
+are advisory and only save work: ``Cache.store_version`` stays safe
+against concurrent stores, so a process that gives up waiting simply
+fetches a private copy.
+
+Locks are ``fcntl`` record locks on ``.locks/<package>/<version>.lock``,
+which the kernel (or NFS lock manager) releases when the holder dies.
+Where those are not available (no ``fcntl``, or an NFS mount without
+locking) the lock is the existence of ``<version>.lck``, created with the
+NFS-safe link(2) method.  Its holder touches it periodically; a lock file
+left by a dead process on the same host, or not touched for
+``STALE_AFTER`` seconds, is broken.
+"""
+
+import errno
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Optional
+
+from .msg import note
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_logger = logging.getLogger("ivpm.cache_lock")
+
+LOCKS_DIR = ".locks"
+
+# Seconds to wait for another process before fetching privately
+DEFAULT_TIMEOUT = 600
+
+# Lock-file fallback: how often the holder touches its lock file, and
+# after how long without a touch the lock is considered abandoned
+HEARTBEAT = 15
+STALE_AFTER = 120
+
+# lockf() errors meaning the file system does not do record locks
+_NO_LOCK_ERRNOS = (errno.ENOLCK, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS)
+
+# Threads of one process are not excluded by its own fcntl locks
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(path, threading.Lock())
+
+
+class CacheLock(object):
+    """The population lock of one cached package version.
+
+    ``acquire()`` waits up to 'timeout' seconds and returns whether the
+    lock was taken; ``release()`` is a no-op if it was not.
+    """
+
+    def __init__(self, cache_dir: str, package_name: str, version: str,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.name = "%s/%s" % (package_name, version)
+        self.path = os.path.join(cache_dir, LOCKS_DIR, package_name, version)
+        self.timeout = timeout
+        self.acquired = False
+        self._thread_lock = _thread_lock(self.path)
+        self._fd = None
+        self._heartbeat = None
+
+    def acquire(self) -> bool:
+        deadline = time.monotonic() + self.timeout
+        if self._thread_lock.acquire(timeout=max(self.timeout, 0)):
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.acquired = self._acquire(deadline)
+            except OSError as e:
+                _logger.debug("Not locking %s: %s", self.path, e)
+            if self.acquired:
+                return True
+            self._thread_lock.release()
+            if time.monotonic() >= deadline:
+                note("Timed out after %ds waiting for another process to cache %s;"
+                     " fetching a private copy" % (self.timeout, self.name))
+        return self.acquired
+
+    def release(self):
+        if not self.acquired:
+            return
+        self.acquired = False
+        try:
+            if self._fd is not None:
+                # Closing the file drops the record lock
+                os.close(self._fd)
+                self._fd = None
+            else:
+                self._heartbeat.set()
+                os.unlink(self.path + ".lck")
+        except OSError as e:
+            _logger.debug("Releasing %s: %s", self.path, e)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def _acquire(self, deadline: float) -> bool:
+        if fcntl is not None:
+            locked = self._acquire_fcntl(deadline)
+            if locked is not None:
+                return locked
+        return self._acquire_file(deadline)
+
+    def _acquire_fcntl(self, deadline: float) -> Optional[bool]:
+        """Take an fcntl lock. Returns None if the file system has none."""
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o664)
+        for delay in _backoff():
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._fd = fd
+                return True
+            except OSError as e:
+                if e.errno in _NO_LOCK_ERRNOS:
+                    os.close(fd)
+                    return None
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            if time.monotonic() + delay > deadline:
+                os.close(fd)
+                return False
+            time.sleep(delay)
+
+    def _acquire_file(self, deadline: float) -> bool:
+        """Take a lock-file lock, breaking one that is stale."""
+        lock_file = self.path + ".lck"
+        owner = "%s %d" % (socket.gethostname(), os.getpid())
+        tmp = "%s.%s.%d.%d" % (lock_file, socket.gethostname(), os.getpid(),
+                               threading.get_ident())
+        with open(tmp, "w") as fp:
+            fp.write(owner + "\n")
+        try:
+            for delay in _backoff():
+                try:
+                    os.link(tmp, lock_file)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    # The link may have been made though the reply was
+                    # lost; otherwise the file system has no hardlinks
+                    if os.stat(tmp).st_nlink != 2 and not os.path.exists(lock_file):
+                        raise
+                # On NFS, the link count tells whether link() succeeded
+                if os.stat(tmp).st_nlink == 2:
+                    self._start_heartbeat(lock_file)
+                    return True
+                if self._is_stale(lock_file):
+                    self._break(lock_file, tmp + ".broken")
+                    continue
+                if time.monotonic() + delay > deadline:
+                    return False
+                time.sleep(delay)
+        finally:
+            os.unlink(tmp)
+
+    @classmethod
+    def _break(cls, lock_file: str, broken: str):
+        """Break the lock file 'lock_file', found stale.
+
+        Between finding it stale and breaking it, another waiter may have
+        broken it too and a new holder taken the lock. So the lock file is
+        first renamed to 'broken', a name of this waiter's own, which
+        takes exactly the file then in place, and is checked again there.
+        A live holder's lock file is put back.
+        """
+        try:
+            os.rename(lock_file, broken)
+        except FileNotFoundError:
+            return
+        if cls._is_stale(broken):
+            _logger.debug("Breaking stale lock %s", lock_file)
+        else:
+            try:
+                os.link(broken, lock_file)
+            except FileExistsError:
+                # Taken by yet another waiter meanwhile: locks only save work
+                _logger.debug("Lock %s taken while restoring it", lock_file)
+        os.unlink(broken)
+
+    def _start_heartbeat(self, lock_file: str):
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(HEARTBEAT):
+                try:
+                    os.utime(lock_file)
+                except FileNotFoundError:
+                    # Moved aside for a moment by a waiter (see _break())
+                    continue
+                except OSError:
+                    return
+        threading.Thread(target=beat, daemon=True).start()
+        self._heartbeat = stop
+
+    @staticmethod
+    def _is_stale(lock_file: str) -> bool:
+        try:
+            with open(lock_file) as fp:
+                host, pid = fp.read().split()
+            age = time.time() - os.stat(lock_file).st_mtime
+        except (OSError, ValueError):
+            # Gone, or not yet written
+            return False
+        if host == socket.gethostname() and not _pid_alive(int(pid)):
+            return True
+        return age > STALE_AFTER
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but belongs to another user
+        pass
+    return True
+
+
+def _backoff():
+    """Yield poll delays: quick at first, then every 2 seconds."""
+    delay = 0.05
+    while True:
+        yield delay
+        delay = min(delay * 2, 2.0)
@@ -8,6 +8,7 @@ import stat
 import sys
 from ..cache import Cache
 from ..msg import note
+from ..package_lock import locked_cache_versions, read_lock
 
 
 def format_size(size_bytes: int) -> str:
@@ -32,6 +33,10 @@ class CmdCache:
             self._info(args)
         elif args.cache_cmd == "clean":
             self._clean(args)
+        elif args.cache_cmd == "gc":
+            self._gc(args)
+        elif args.cache_cmd == "reindex":
+            self._reindex(args)
         else:
             print(f"Unknown cache command: {args.cache_cmd}", file=sys.stderr)
             sys.exit(1)
@@ -79,14 +84,16 @@ class CmdCache:
         info = cache.get_cache_info()
         
         print(f"Cache directory: {cache_dir}")
-        print(f"Total size: {format_size(info['total_size'])}")
+        print(f"Total size: {format_size(info['total_size'])}"
+              f" ({format_size(info['physical_size'])} on disk)")
         print(f"Packages: {len(info['packages'])}")
         print()
         
         for pkg in info['packages']:
             print(f"  {pkg['name']}:")
             print(f"    Versions: {len(pkg['versions'])}")
-            print(f"    Size: {format_size(pkg['total_size'])}")
+            print(f"    Size: {format_size(pkg['total_size'])}"
+                  f" ({format_size(pkg['physical_size'])} on disk)")
             
             if args.verbose:
                 for ver in pkg['versions']:
@@ -111,3 +118,63 @@ class CmdCache:
         removed = cache.clean_older_than(args.days)
         
         print(f"Removed {removed} cache entries older than {args.days} days")
+
+    def _gc(self, args):
+        """Evict least-recently-used entries until the cache fits --max-size."""
+        cache_dir = args.cache_dir
+        
+        if cache_dir is None:
+            cache_dir = os.environ.get("IVPM_CACHE")
+        
+        if cache_dir is None:
+            print("Error: No cache directory specified. Use --cache-dir or set IVPM_CACHE", file=sys.stderr)
+            sys.exit(1)
+        
+        if not os.path.isdir(cache_dir):
+            print(f"Error: Cache directory does not exist: {cache_dir}", file=sys.stderr)
+            sys.exit(1)
+
+        keep_versions = {}
+        keep_deps_dirs = []
+        for lock_path in args.keep_referenced:
+            try:
+                lock = read_lock(lock_path)
+            except (OSError, ValueError) as e:
+                print(f"Error: Cannot read lock file {lock_path}: {e}", file=sys.stderr)
+                sys.exit(1)
+            for name, keys in locked_cache_versions(lock).items():
+                keep_versions.setdefault(name, []).extend(keys)
+            # The lock file sits in the deps directory it describes
+            keep_deps_dirs.append(os.path.dirname(os.path.abspath(lock_path)))
+        
+        cache = Cache(cache_dir)
+        result = cache.gc(args.max_size, keep_versions, keep_deps_dirs)
+        
+        print(f"Removed {len(result['removed'])} cache entries"
+              f" and {len(result['mirrors_removed'])} git mirrors"
+              f" ({format_size(result['freed'])} freed)")
+        print(f"Cache size on disk: {format_size(result['physical_size'])}"
+              f", of which git mirrors {format_size(result['mirror_size'])}"
+              f" (budget {format_size(args.max_size)})")
+        if result["physical_size"] > args.max_size:
+            print("Remaining entries are in use by workspaces or referenced lock files")
+
+    def _reindex(self, args):
+        """Rebuild the cache index from the version directories."""
+        cache_dir = args.cache_dir
+        
+        if cache_dir is None:
+            cache_dir = os.environ.get("IVPM_CACHE")
+        
+        if cache_dir is None:
+            print("Error: No cache directory specified. Use --cache-dir or set IVPM_CACHE", file=sys.stderr)
+            sys.exit(1)
+        
+        if not os.path.isdir(cache_dir):
+            print(f"Error: Cache directory does not exist: {cache_dir}", file=sys.stderr)
+            sys.exit(1)
+        
+        cache = Cache(cache_dir)
+        count = cache.reindex()
+        
+        print(f"Indexed {count} cache entries")
@@ -4,6 +4,7 @@ Created on Jun 8, 2021
 @author: mballance
 '''
 import os
+import subprocess
 import sys
 from ivpm.arg_utils import ensure_have_project_dir
 
@@ -23,10 +24,9 @@ class CmdGitStatus(object):
         for dir in os.listdir(packages_dir):
             if os.path.isdir(os.path.join(packages_dir, dir, ".git")):
                 print("Package: " + dir)
-                cwd = os.getcwd()
-                os.chdir(packages_dir + "/" + dir)
-                status = os.system("git status -s")
-                os.chdir(cwd)
+                sys.stdout.flush()
+                subprocess.run(["git", "status", "-s"],
+                               cwd=os.path.join(packages_dir, dir))
             elif dir != "python" and os.path.isdir(os.path.join(packages_dir, dir)):
                 print("Note: skipping non-Git package \"" + dir + "\"")
                 sys.stdout.flush()        
\ No newline at end of file
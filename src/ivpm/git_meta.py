@@ -0,0 +1,172 @@
+#****************************************************************************
+#* git_meta.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+git_meta.py — read HEAD and refs of a local repository without running git.
+
+Read-only queries such as "which commit is this package at?" are asked of
+every package by ``ivpm show deps``, lock-file updates and the end of each
+fetch.  ``git rev-parse HEAD`` costs a fork+exec per package; reading
+``.git/HEAD``, a loose ref file or ``packed-refs`` costs microseconds.
+
+The reader follows a ``.git`` file (``gitdir: ...``, as used by
+submodules and worktrees) and a worktree's ``commondir``, where shared
+refs live.  Anything it does not understand -- the reftable ref backend,
+a malformed file, a missing ref -- falls back to asking git itself.
+"""
+
+import logging
+import os
+import re
+import subprocess
+from typing import Optional, Tuple
+
+_logger = logging.getLogger("ivpm.git_meta")
+
+_OID_RE = re.compile(r"[0-9a-f]{40}|[0-9a-f]{64}")
+
+# Symbolic refs followed before giving up (as git does)
+_MAX_SYMREF_DEPTH = 5
+
+
+class _Unsupported(Exception):
+    """The repository layout is not handled by the in-process reader."""
+    pass
+
+
+def head_commit(repo_dir: str, timeout: float = 10) -> Optional[str]:
+    """Return the full hash of the commit checked out in 'repo_dir', or
+    None if there is none (not a repository, or no commit yet)."""
+    return read_ref(repo_dir, "HEAD", timeout)
+
+
+def read_ref(repo_dir: str, ref: str, timeout: float = 10) -> Optional[str]:
+    """Return the hash 'ref' ("HEAD" or a full ref name, eg
+    "refs/remotes/origin/main") points to in 'repo_dir', or None."""
+    try:
+        return _resolve(repo_dir, ref)
+    except (_Unsupported, OSError) as e:
+        _logger.debug("Reading %s of %s with git: %s", ref, repo_dir, e)
+    try:
+        r = subprocess.run(
+            ["git", "rev-parse", "--verify", "-q", ref],
+            cwd=repo_dir, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if r.returncode != 0:
+        return None
+    return r.stdout.strip()
+
+
+def head_branch(repo_dir: str) -> Optional[str]:
+    """Return the branch checked out in 'repo_dir', or None if HEAD is
+    detached or the branch cannot be determined without git."""
+    try:
+        git_dir, _ = git_dirs(repo_dir)
+        target = _read_ref_file(os.path.join(git_dir, "HEAD"))
+    except (_Unsupported, OSError):
+        return None
+    if target is not None and target.startswith("ref: refs/heads/"):
+        return target[len("ref: refs/heads/"):]
+    return None
+
+
+def git_dirs(repo_dir: str) -> Tuple[str, str]:
+    """Return the (git dir, common dir) of the work tree in 'repo_dir'.
+
+    The two differ for a linked worktree, whose HEAD is private but whose
+    branches and tags live in the main repository.
+    """
+    dot_git = os.path.join(repo_dir, ".git")
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        # Submodule or worktree: "gitdir: <path>"
+        with open(dot_git) as fp:
+            line = fp.readline().strip()
+        if not line.startswith("gitdir: "):
+            raise _Unsupported("unrecognized .git file")
+        git_dir = os.path.join(repo_dir, line[len("gitdir: "):])
+    else:
+        raise _Unsupported("no .git in %s" % repo_dir)
+
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        with open(commondir_file) as fp:
+            common_dir = os.path.join(git_dir, fp.read().strip())
+
+    if os.path.isfile(os.path.join(common_dir, "reftable", "tables.list")):
+        raise _Unsupported("reftable ref storage")
+    return os.path.normpath(git_dir), os.path.normpath(common_dir)
+
+
+def _resolve(repo_dir: str, ref: str) -> Optional[str]:
+    """Resolve 'ref' ("HEAD" or a full ref name) in 'repo_dir'."""
+    git_dir, common_dir = git_dirs(repo_dir)
+    for _ in range(_MAX_SYMREF_DEPTH):
+        value = _read_ref(git_dir, common_dir, ref)
+        if value is None:
+            # No such ref, or an unborn branch (HEAD naming a branch
+            # with no commits yet)
+            if ref.startswith("refs/"):
+                return None
+            raise _Unsupported("ref %s not found" % ref)
+        if value.startswith("ref: "):
+            ref = value[len("ref: "):]
+            continue
+        if _OID_RE.fullmatch(value):
+            return value
+        raise _Unsupported("unexpected content in ref %s" % ref)
+    raise _Unsupported("symbolic ref loop at %s" % ref)
+
+
+def _read_ref(git_dir: str, common_dir: str, ref: str) -> Optional[str]:
+    """Return the content of 'ref': a hash or "ref: <target>"."""
+    # Pseudo-refs, and refs private to a worktree, are in its git dir
+    per_worktree = "/" not in ref or ref.startswith(("refs/bisect/", "refs/worktree/"))
+    base = git_dir if per_worktree else common_dir
+    value = _read_ref_file(os.path.join(base, *ref.split("/")))
+    if value is not None or per_worktree:
+        return value
+    return _packed_refs(common_dir).get(ref)
+
+
+def _read_ref_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def _packed_refs(common_dir: str) -> dict:
+    """Parse the packed-refs file of a repository (ref name -> hash)."""
+    refs = {}
+    try:
+        with open(os.path.join(common_dir, "packed-refs")) as fp:
+            for line in fp:
+                # Comments ("# pack-refs with: ...") and peeled tags ("^<hash>")
+                if line.startswith(("#", "^")):
+                    continue
+                fields = line.split()
+                if len(fields) == 2:
+                    refs[fields[1]] = fields[0]
+    except FileNotFoundError:
+        pass
+    return refs
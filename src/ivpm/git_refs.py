@@ -0,0 +1,162 @@
+#****************************************************************************
+#* git_refs.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+git_refs.py — run-scoped resolution of git refs to commit hashes.
+
+Resolving a branch or tag used to cost up to three ``git ls-remote``
+calls per URL, repeated by every package (and every code path) that
+needed it.  ``RefResolver`` lists each remote's branches and tags once,
+then serves every lookup against that remote from the parsed table.
+The listing uses ``--heads --tags``, which protocol v2 turns into
+server-side ref-prefix filtering, so pull-request and other refs are
+never transferred.
+
+A resolver lives for one update (see ``ProjectUpdateInfo.ref_resolver``)
+and is safe to share between worker threads: concurrent lookups against
+the same remote wait for a single listing.
+"""
+
+import logging
+import subprocess
+import threading
+from typing import Callable, Dict, Optional
+
+_logger = logging.getLogger("ivpm.git_refs")
+
+# Seconds allowed for a single ls-remote
+LS_REMOTE_TIMEOUT = 30
+
+
+def lookup_ref(table: Dict[str, str], ref: str) -> Optional[str]:
+    """Find 'ref' in a ref table, as ``git ls-remote <url> <ref>`` would.
+
+    A full ref name is matched exactly; a short name is tried as a
+    branch, then as a tag. Annotated tags resolve to the commit they
+    point at rather than the tag object.
+    """
+    if ref.startswith("refs/") or ref == "HEAD":
+        candidates = [ref]
+    else:
+        candidates = ["refs/heads/" + ref, "refs/tags/" + ref]
+    for name in candidates:
+        for key in (name + "^{}", name):
+            if key in table.keys():
+                return table[key]
+    return None
+
+
+def parse_ls_remote(output: str) -> Dict[str, str]:
+    """Parse ``git ls-remote`` output into a {ref: hash} table."""
+    table = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            table[parts[1]] = parts[0]
+    return table
+
+
+class RefResolver(object):
+    """Memoizing, thread-safe ref resolver shared by one update.
+
+    'run' runs ls-remote in place of subprocess.run(), taking the same
+    arguments; an update passes its cancellable runner (see
+    ProjectUpdateInfo.run_subprocess()).
+    """
+
+    def __init__(self, run: Optional[Callable[..., subprocess.CompletedProcess]] = None):
+        self.run = run
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._memo = {}
+
+    def resolve(self, url: str, ref: str) -> Optional[str]:
+        """Return the commit hash 'ref' names in the remote 'url', or None."""
+        if ref == "HEAD":
+            return self._once(("head", url),
+                              lambda: lookup_ref(
+                                  self._ls_remote(url, patterns=["HEAD"]) or {}, "HEAD"))
+
+        table = self.refs(url)
+        if table is None:
+            return None
+        ret = lookup_ref(table, ref)
+        if ret is None and not ref.startswith(("refs/heads/", "refs/tags/")):
+            # Possibly outside the listed namespaces (eg refs/pull/...):
+            # ask the remote directly, taking the first match as
+            # 'git ls-remote <url> <ref>' does
+            ret = self._once(("ref", url, ref), lambda: next(iter(
+                (self._ls_remote(url, patterns=[ref]) or {}).values()), None))
+        return ret
+
+    def refs(self, url: str) -> Optional[Dict[str, str]]:
+        """Return the branch and tag table of 'url', listing it on first use.
+
+        Returns None if the remote could not be listed.
+        """
+        return self._once(("refs", url),
+                          lambda: self._ls_remote(url, flags=["--heads", "--tags"]))
+
+    def memoize(self, url: str, ref: str, fn: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return fn() for (url, ref), calling it at most once per resolver.
+
+        Used for resolution paths that go beyond ls-remote (eg the GitHub
+        API), so every package naming the same ref shares one answer.
+        """
+        return self._once(("memo", url, ref), fn)
+
+    def _once(self, key, fn):
+        with self._lock:
+            if key in self._memo.keys():
+                return self._memo[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._memo.keys():
+                    return self._memo[key]
+            value = fn()
+            with self._lock:
+                self._memo[key] = value
+            return value
+
+    def _ls_remote(self, url: str, flags=(), patterns=()) -> Optional[Dict[str, str]]:
+        cmd = ["git", "-c", "protocol.version=2", "ls-remote"]
+        cmd.extend(flags)
+        cmd.append(url)
+        cmd.extend(patterns)
+        _logger.debug("Listing refs: %s", " ".join(cmd))
+        try:
+            if self.run is not None:
+                result = self.run(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=LS_REMOTE_TIMEOUT)
+            else:
+                result = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=LS_REMOTE_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            _logger.debug("ls-remote of %s failed: %s", url, e)
+            return None
+        if result.returncode != 0:
+            _logger.debug("ls-remote of %s failed: %s", url, result.stderr.strip())
+            return None
+        return parse_ls_remote(result.stdout)
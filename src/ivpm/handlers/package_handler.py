@@ -173,6 +173,16 @@ class PackageHandler(object):
         """
         return {}
 
+    def get_fingerprint_paths(self) -> list:
+        """Return paths outside the deps-dir that this handler read or wrote.
+
+        Called after on_root_post_load() completes. The no-op update fast
+        path runs a full update if any of them changes: file content for
+        files, entry names and link targets for directories. Default
+        returns [].
+        """
+        return []
+
     def build(self, build_info: ProjectBuildInfo):
         pass
 
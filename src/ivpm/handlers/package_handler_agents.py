@@ -123,6 +123,7 @@ class PackageHandlerAgents(PackageHandler):
     # All discovered skills, with enough context to derive human-readable link names
     skill_entries: List[SkillEntry] = dc.field(default_factory=list)
     _managed_names: List[str] = dc.field(default_factory=list, init=False, repr=False)
+    _target_dirs: List[str] = dc.field(default_factory=list, init=False, repr=False)
     _prev_state: dict = dc.field(default_factory=dict, init=False, repr=False)
 
     def reset(self):
@@ -167,6 +168,8 @@ class PackageHandlerAgents(PackageHandler):
 
         # Remove entries created by the previous run before writing new ones
         self._remove_managed(project_dir, self._prev_state)
+        self._target_dirs = [os.path.join(project_dir, ".agents", "skills"),
+                             claude_skills_dir]
 
         self.skill_entries.extend(self._discover_project_skills(update_info, project_dir))
 
@@ -220,6 +223,9 @@ class PackageHandlerAgents(PackageHandler):
         # Store same names for both targets; _remove_managed checks what exists
         return {"agents_skills": self._managed_names, "claude_skills": self._managed_names}
 
+    def get_fingerprint_paths(self) -> list:
+        return list(self._target_dirs)
+
     # ------------------------------------------------------------------ #
 
     def _get_skill_patterns(self, pkg) -> Optional[List[str]]:
@@ -191,6 +191,7 @@ class PackageHandlerFuseSoC(PackageHandler):
     _core_dirs: Dict[str, List[str]] = dc.field(default_factory=dict, init=False, repr=False)
     _prev_state: dict = dc.field(default_factory=dict, init=False, repr=False)
     _output_written: bool = dc.field(default=False, init=False, repr=False)
+    _input_paths: List[str] = dc.field(default_factory=list, init=False, repr=False)
 
     @classmethod
     def handler_info(cls):
@@ -217,6 +218,7 @@ class PackageHandlerFuseSoC(PackageHandler):
     def reset(self):
         self._core_dirs = {}
         self._output_written = False
+        self._input_paths = []
 
     def on_root_pre_load(self, update_info: ProjectUpdateInfo):
         self.reset()
@@ -262,6 +264,11 @@ class PackageHandlerFuseSoC(PackageHandler):
                 if pkg_dirs:
                     active_pkg_map[name] = pkg_dirs
 
+        # The project's own .core files and fusesoc.conf are inputs
+        self._input_paths = [project_dir]
+        if cfg.get("update-conf", False):
+            self._input_paths.append(os.path.join(project_dir, "fusesoc.conf"))
+
         # Include project's own .core files
         if _has_cores_nonrecursive(project_dir):
             dirs = [project_dir] + dirs
@@ -379,6 +386,9 @@ class PackageHandlerFuseSoC(PackageHandler):
 
         return found
 
+    def get_fingerprint_paths(self) -> list:
+        return list(self._input_paths)
+
     def get_state_entries(self) -> dict:
         """Persist core dirs so the next run can clean up stale entries."""
         if not self._output_written and not self._prev_state:
@@ -95,6 +95,14 @@ class PackageHandlerList(PackageHandler):
                 result[h.name] = entries
         return result
 
+    def get_fingerprint_paths(self) -> list:
+        result = []
+        for h in self.handlers:
+            for p in h.get_fingerprint_paths():
+                if p not in result:
+                    result.append(p)
+        return result
+
     # ------------------------------------------------------------------ #
     # Condition helpers                                                    #
     # ------------------------------------------------------------------ #
@@ -162,6 +162,7 @@ class PackageHandlerNode(PackageHandler):
     _explicit_names:     set               = dc.field(default_factory=set)
     _prev_pkg_json_hash: str               = dc.field(default="")
     _current_pkg_json_hash: str            = dc.field(default="")
+    _input_files:        list              = dc.field(default_factory=list)
 
     def reset(self):
         self._npm_pkgs = {}
@@ -169,6 +170,7 @@ class PackageHandlerNode(PackageHandler):
         self._explicit_names = set()
         self._prev_pkg_json_hash = ""
         self._current_pkg_json_hash = ""
+        self._input_files = []
 
     @classmethod
     def handler_info(cls):
@@ -253,6 +255,9 @@ class PackageHandlerNode(PackageHandler):
                 path = path[len("file://"):]
             path = os.path.expandvars(path)
 
+        with self._lock:
+            self._input_files.append(path)
+
         if not os.path.isfile(path):
             _logger.warning("package.json not found at '%s' — skipping", path)
             return
@@ -428,6 +433,10 @@ class PackageHandlerNode(PackageHandler):
     # State persistence
     # ------------------------------------------------------------------
 
+    def get_fingerprint_paths(self) -> list:
+        # package.json files harvested for dependencies
+        return list(self._input_files)
+
     def get_state_entries(self) -> dict:
         installed = list(self._npm_pkgs.keys()) + list(self._source_pkgs.keys())
         return {
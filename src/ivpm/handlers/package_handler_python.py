@@ -226,6 +226,7 @@ class PackageHandlerPython(PackageHandler):
     src_pkg_s  : Set[str] = dc.field(default_factory=set)
     pypi_pkg_s : Set[str] = dc.field(default_factory=set)
     _pyproject_toml_pkgs : list = dc.field(default_factory=list)
+    _input_files : list = dc.field(default_factory=list)
     use_uv : bool = False
     debug : bool = True
 
@@ -234,6 +235,7 @@ class PackageHandlerPython(PackageHandler):
         self.src_pkg_s  = set()
         self.pypi_pkg_s = set()
         self._pyproject_toml_pkgs = []
+        self._input_files = []
 
     @classmethod
     def handler_info(cls):
@@ -324,6 +326,7 @@ class PackageHandlerPython(PackageHandler):
                 "(resolved from '%s')" % (path, source_ref)
             )
             return []
+        self._input_files.append(path)
 
         with open(path, "rb") as fp:
             try:
@@ -735,6 +738,10 @@ class PackageHandlerPython(PackageHandler):
             for skill_dir in item.get("dirs", []):
                 update_info.pending_skill_dirs.append((ep_name, os.path.normpath(skill_dir)))
 
+    def get_fingerprint_paths(self) -> list:
+        # pyproject.toml files harvested for dependencies
+        return list(self._input_files)
+
     def get_lock_entries(self, deps_dir: str) -> dict:
         """Return pip-resolved package versions from the managed venv.
 
@@ -0,0 +1,167 @@
+#****************************************************************************
+#* http_client.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+http_client.py — one pooled HTTP client per update.
+
+Module-level ``httpx.get()`` opens (and TLS-handshakes) a new connection
+for every request. A workspace with dozens of GitHub-hosted packages
+makes several requests per package to the same few hosts, so an update
+shares a single ``HttpClient`` (``ProjectUpdateInfo.http``) that keeps
+connections alive between requests.
+
+The client caps the connections open to any one host, so a wide update
+does not trip server-side abuse limits, and speaks HTTP/2 when the
+optional ``h2`` package is installed (``pip install ivpm[http2]``).
+"""
+
+import importlib.util
+import logging
+import threading
+from typing import Optional
+
+import httpx
+
+_logger = logging.getLogger("ivpm.http_client")
+
+# Concurrent requests (and so connections) allowed to a single host
+DEFAULT_MAX_PER_HOST = 8
+
+# Seconds an idle connection is kept open for re-use
+KEEPALIVE_EXPIRY = 30.0
+
+
+def http2_available() -> bool:
+    """True if the optional 'h2' package needed for HTTP/2 is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def client_for(update_info) -> object:
+    """Return the HTTP client to use for 'update_info': its shared
+    client, or the httpx module itself when there is no update."""
+    if update_info is None:
+        return httpx
+    return update_info.http
+
+
+class HttpClient(object):
+    """Thread-safe pooled HTTP client shared by one update.
+
+    Offers the ``get()``, ``head()`` and ``stream()`` calls of the httpx
+    module. The underlying ``httpx.Client`` is created on first use, so
+    updates that make no HTTP requests pay nothing.
+    """
+
+    def __init__(self,
+                 max_per_host: int = DEFAULT_MAX_PER_HOST,
+                 http2: Optional[bool] = None,
+                 verify=True):
+        self.max_per_host = max_per_host
+        self.http2 = http2_available() if http2 is None else http2
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._client = None
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                _logger.debug("Creating HTTP client (http2=%s, max_per_host=%d)",
+                              self.http2, self.max_per_host)
+                transport = httpx.HTTPTransport(
+                    verify=self.verify,
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=None,
+                        max_keepalive_connections=None,
+                        keepalive_expiry=KEEPALIVE_EXPIRY))
+                self._client = httpx.Client(
+                    transport=_HostLimitTransport(transport, self.max_per_host))
+            return self._client
+
+    def get(self, url, **kwargs) -> httpx.Response:
+        return self.client.get(url, **kwargs)
+
+    def head(self, url, **kwargs) -> httpx.Response:
+        return self.client.head(url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        """Return a context manager yielding a streamed response, as
+        ``httpx.stream()`` does."""
+        return self.client.stream(method, url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections. The client may be used again
+        afterwards; it then opens new connections."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+class _HostLimitTransport(httpx.BaseTransport):
+    """Transport wrapper holding a per-host slot from the time a request
+    is sent until its response is closed."""
+
+    def __init__(self, transport: httpx.BaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._sems = {}
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        sem = self._host_sem(request.url)
+        sem.acquire()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            sem.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, sem)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+    def _host_sem(self, url: httpx.URL):
+        key = (url.scheme, url.host, url.port)
+        with self._lock:
+            if key not in self._sems.keys():
+                self._sems[key] = threading.BoundedSemaphore(self._max_per_host)
+            return self._sems[key]
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response stream that releases a host slot when closed."""
+
+    def __init__(self, stream, sem):
+        self._stream = stream
+        self._sem = sem
+        self._released = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._sem.release()
@@ -44,7 +44,7 @@ class IvpmYamlReader(object):
     
     def __init__(self):
         self.debug = False
-        pass
+        self.source_files = []
     
     def read(self, fp, name, cli_overrides=None, persisted_vars=None) -> 'ProjInfo':
         from ivpm.proj_info import ProjInfo
@@ -59,7 +59,9 @@ class IvpmYamlReader(object):
         # Load the ``package:`` body, recursively merging any ``include:``
         # files first. Variables are resolved once, post-merge (so an include
         # may reference variables defined by the includer).
+        self.source_files = []
         pkg = self._load_merged_pkg(fp, name)
+        ret.source_files = list(self.source_files)
 
         # Resolve ${{var}} references before any other processing
         pkg, resolved_vars = resolve_variables(
@@ -145,6 +147,8 @@ class IvpmYamlReader(object):
             _visited = set()
         _visited = set(_visited)
         _visited.add(os.path.realpath(name))
+        if name not in self.source_files:
+            self.source_files.append(name)
 
         try:
             data = yaml_load(fp, name=name)
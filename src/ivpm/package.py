@@ -20,6 +20,7 @@
 #*
 #****************************************************************************
 
+import asyncio
 import logging
 import os
 import dataclasses as dc
@@ -141,6 +142,18 @@ class Package(object):
             skipped_reason=src,
         )
 
+    async def status_async(self, pkgs_info):
+        """Awaitable form of status(). Package types that run subprocesses
+        override this to await them on the event loop; the default runs
+        status() on a worker thread, since it may block."""
+        return await asyncio.get_event_loop().run_in_executor(
+            None, self.status, pkgs_info)
+
+    async def sync_async(self, sync_info):
+        """Awaitable form of sync(); see status_async()."""
+        return await asyncio.get_event_loop().run_in_executor(
+            None, self.sync, sync_info)
+
     def update(self, update_info : ProjectUpdateInfo) -> 'ProjInfo':
         from .proj_info import ProjInfo
 
@@ -30,9 +30,10 @@ import hashlib
 import json
 import logging
 import os
-import subprocess
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+
+from .git_meta import head_commit
 
 _logger = logging.getLogger("ivpm.package_lock")
 
@@ -75,6 +76,10 @@ def _entry_from_pkg(pkg) -> dict:
         entry["commit_requested"] = getattr(pkg, "commit", None)
         entry["commit_resolved"] = getattr(pkg, "resolved_commit", None)
         entry["cache"] = getattr(pkg, "cache", None)
+        # Partial-clone filter and sparse-checkout spec, recorded when set
+        for key in ("filter", "sparse"):
+            if getattr(pkg, key, None):
+                entry[key] = getattr(pkg, key)
 
     elif src == "gh-rls":
         entry["url"] = getattr(pkg, "url", None)
@@ -135,6 +140,8 @@ def _spec_matches_lock(pkg, lock_entry: dict) -> bool:
             and getattr(pkg, "tag", None) == lock_entry.get("tag")
             and getattr(pkg, "commit", None) == lock_entry.get("commit_requested")
             and getattr(pkg, "cache", None) == lock_entry.get("cache")
+            and (getattr(pkg, "filter", None) or None) == lock_entry.get("filter")
+            and (getattr(pkg, "sparse", None) or None) == lock_entry.get("sparse")
         )
     elif src == "gh-rls":
         return (
@@ -269,16 +276,10 @@ def patch_lock_after_sync(lock_path: str, sync_results) -> None:
         if entry.get("src") != "git":
             continue
         # Re-read full commit hash from the working directory
-        try:
-            r = subprocess.run(
-                ["git", "rev-parse", "HEAD"],
-                capture_output=True, text=True, cwd=result.path, timeout=10,
-            )
-            if r.returncode == 0:
-                entry["commit_resolved"] = r.stdout.strip()
-                changed = True
-        except Exception:
-            pass
+        commit = head_commit(result.path)
+        if commit is not None:
+            entry["commit_resolved"] = commit
+            changed = True
 
     if changed:
         _write_lock_dict(lock_path, lock)
@@ -314,6 +315,34 @@ def read_lock(lock_path: str) -> dict:
     return data
 
 
+def locked_cache_versions(lock: dict) -> Dict[str, List[str]]:
+    """Return, per package, the cache version keys of the resolved
+    versions in *lock*.
+
+    Git keys are commits (a sparse version adds a suffix to the commit) and
+    release keys are tags (a platform suffix is added), so callers match
+    keys as prefixes; see ``Cache.gc``.
+    """
+    from .pkg_types.package_http import PackageHttp
+
+    versions = {}
+    for name, entry in lock.get("packages", {}).items():
+        src = entry.get("src", "")
+        keys = []
+        if src == "git":
+            keys.append(entry.get("commit_resolved"))
+        elif src == "gh-rls":
+            keys.append(entry.get("version_resolved"))
+        elif src in ("http", "tgz", "txz", "zip", "jar"):
+            if entry.get("last_modified"):
+                keys.append(PackageHttp.last_modified_version(entry["last_modified"]))
+            keys.append(entry.get("etag"))
+        keys = [k for k in keys if k]
+        if keys:
+            versions[name] = keys
+    return versions
+
+
 def check_lock_changes(deps_dir: str, all_pkgs) -> Dict[str, dict]:
     """Compare *all_pkgs* against an existing lock file in *deps_dir*.
 
@@ -354,6 +383,96 @@ def check_lock_changes(deps_dir: str, all_pkgs) -> Dict[str, dict]:
 # IvpmLockReader — reconstruct Package objects from a lock file
 # ---------------------------------------------------------------------------
 
+def package_from_lock_entry(name: str, entry: dict, pinned: bool = True):
+    """Reconstruct a Package object from a lock-file entry.
+
+    With *pinned* (reproduction mode), git and release packages are pinned
+    to the resolved commit/version.  Otherwise the requested spec is used,
+    so the package fetches exactly what its ivpm.yaml entry would.
+    Returns None for an unknown ``src`` type.
+    """
+    from .pkg_types.package_git import PackageGit
+    from .pkg_types.package_gh_rls import PackageGhRls
+    from .pkg_types.package_http import PackageHttp
+    from .pkg_types.package_pypi import PackagePyPi
+    from .pkg_types.package_url import PackageURL
+
+    src = entry.get("src", "")
+    pkg = None
+
+    if src == "git":
+        p = PackageGit(name)
+        p.url = entry.get("url")
+        p.branch = entry.get("branch")
+        p.tag = entry.get("tag")
+        if pinned:
+            # Use resolved commit for exact reproduction
+            p.commit = entry.get("commit_resolved") or entry.get("commit_requested")
+            p.resolved_commit = entry.get("commit_resolved")
+        else:
+            p.commit = entry.get("commit_requested")
+        p.cache = entry.get("cache")
+        p.filter = entry.get("filter")
+        p.sparse = entry.get("sparse")
+        pkg = p
+
+    elif src == "gh-rls":
+        p = PackageGhRls(name)
+        p.url = entry.get("url")
+        if pinned:
+            # Pin to resolved version, not "latest" / requested spec
+            p.version = entry.get("version_resolved") or entry.get("version_requested")
+            p.resolved_version = entry.get("version_resolved")
+        else:
+            p.version = entry.get("version_requested") or p.version
+        p.cache = entry.get("cache")
+        pkg = p
+
+    elif src in ("http", "tgz", "txz", "zip", "jar"):
+        p = PackageHttp(name)
+        p.url = entry.get("url")
+        p.resolved_etag = entry.get("etag")
+        p.resolved_last_modified = entry.get("last_modified")
+        p.src_type = src
+        p.cache = entry.get("cache")
+        pkg = p
+
+    elif src == "pypi":
+        p = PackagePyPi(name)
+        if pinned:
+            # Pin to resolved version
+            p.version = entry.get("version_resolved") or entry.get("version_requested")
+            p.resolved_version = entry.get("version_resolved")
+        else:
+            p.version = entry.get("version_requested")
+        p.src_type = "pypi"
+        pkg = p
+
+    elif src in ("dir", "file"):
+        p = PackageURL(name)
+        path = entry.get("path", "")
+        p.url = "file://" + path if not path.startswith("file://") else path
+        p.src_type = src
+        pkg = p
+
+    elif src == "module":
+        from .pkg_types.package_module import PackageModule
+        p = PackageModule(name)
+        p.module = entry.get("module")
+        p.modulefile_path = entry.get("modulefile")
+        p.module_root = entry.get("root")
+        p.path = entry.get("root")
+        p.src_type = "module"
+        pkg = p
+
+    else:
+        return None
+
+    pkg.resolved_by = entry.get("resolved_by", "root")
+    pkg.dep_set = entry.get("dep_set")
+    return pkg
+
+
 class IvpmLockReader:
     """Reconstruct a list of Package objects from a lock file for reproduction mode."""
 
@@ -364,79 +483,16 @@ class IvpmLockReader:
     def build_packages_info(self):
         """Return a PackagesInfo built from the lock file's complete closure."""
         from .packages_info import PackagesInfo
-        from .pkg_types.package_git import PackageGit
-        from .pkg_types.package_gh_rls import PackageGhRls
-        from .pkg_types.package_http import PackageHttp
-        from .pkg_types.package_pypi import PackagePyPi
-        from .pkg_types.package_url import PackageURL
 
         packages = self._data.get("packages", {})
         pkgs_info = PackagesInfo("lock")
 
         for name, entry in packages.items():
-            src = entry.get("src", "")
-            pkg = None
-
-            if src == "git":
-                p = PackageGit(name)
-                p.url = entry.get("url")
-                p.branch = entry.get("branch")
-                p.tag = entry.get("tag")
-                # Use resolved commit for exact reproduction
-                p.commit = entry.get("commit_resolved") or entry.get("commit_requested")
-                p.resolved_commit = entry.get("commit_resolved")
-                p.cache = entry.get("cache")
-                pkg = p
-
-            elif src == "gh-rls":
-                p = PackageGhRls(name)
-                p.url = entry.get("url")
-                # Pin to resolved version, not "latest" / requested spec
-                p.version = entry.get("version_resolved") or entry.get("version_requested")
-                p.resolved_version = entry.get("version_resolved")
-                p.cache = entry.get("cache")
-                pkg = p
-
-            elif src in ("http", "tgz", "txz", "zip", "jar"):
-                p = PackageHttp(name)
-                p.url = entry.get("url")
-                p.resolved_etag = entry.get("etag")
-                p.resolved_last_modified = entry.get("last_modified")
-                p.src_type = src
-                p.cache = entry.get("cache")
-                pkg = p
-
-            elif src == "pypi":
-                p = PackagePyPi(name)
-                # Pin to resolved version
-                p.version = entry.get("version_resolved") or entry.get("version_requested")
-                p.resolved_version = entry.get("version_resolved")
-                p.src_type = "pypi"
-                pkg = p
-
-            elif src in ("dir", "file"):
-                p = PackageURL(name)
-                path = entry.get("path", "")
-                p.url = "file://" + path if not path.startswith("file://") else path
-                p.src_type = src
-                pkg = p
-
-            elif src == "module":
-                from .pkg_types.package_module import PackageModule
-                p = PackageModule(name)
-                p.module = entry.get("module")
-                p.modulefile_path = entry.get("modulefile")
-                p.module_root = entry.get("root")
-                p.path = entry.get("root")
-                p.src_type = "module"
-                pkg = p
-
-            else:
-                _logger.warning("Unknown src type %r for package %s — skipping", src, name)
+            pkg = package_from_lock_entry(name, entry)
+            if pkg is None:
+                _logger.warning("Unknown src type %r for package %s — skipping",
+                                entry.get("src", ""), name)
                 continue
-
-            pkg.resolved_by = entry.get("resolved_by", "root")
-            pkg.dep_set = entry.get("dep_set")
             pkgs_info[name] = pkg
 
         return pkgs_info
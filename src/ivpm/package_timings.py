@@ -0,0 +1,167 @@
+#****************************************************************************
+#* package_timings.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+package_timings.py — read/write packages/package-timings.json.
+
+The timings file records how long each package took to fetch on the last
+run that actually fetched it, along with the package that pulled it in
+(``resolved_by``) and the size of the dependency subtree it gated.  It is
+kept beside ``package-lock.json`` rather than in it, so the lock stays
+stable from run to run.
+
+``PackageUpdater`` uses the recorded data to start the packages with the
+longest downstream critical path first when ``--jobs`` is narrower than
+the dependency graph.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+_logger = logging.getLogger("ivpm.package_timings")
+
+TIMINGS_VERSION = 1
+TIMINGS_FILE = "package-timings.json"
+
+
+def read_timings(path: str) -> dict:
+    """Read a timings file.  Returns an empty dict if it is absent or unusable."""
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except Exception as e:
+        _logger.debug("Could not read %s: %s", path, e)
+        return {}
+    if data.get("ivpm_timings_version") != TIMINGS_VERSION:
+        return {}
+    return data.get("packages", {})
+
+
+def find_timings(deps_dir: str, lock_file: Optional[str] = None) -> dict:
+    """Locate timing history for a workspace.
+
+    Uses ``<deps_dir>/package-timings.json`` when present. Otherwise, when
+    reproducing from ``--lock-file``, a timings file next to that lock file
+    is used -- this lets a cold CI workspace benefit from timings committed
+    alongside the lock.
+    """
+    timings = read_timings(os.path.join(deps_dir, TIMINGS_FILE))
+    if not timings and lock_file is not None:
+        timings = read_timings(os.path.join(
+            os.path.dirname(os.path.abspath(lock_file)), TIMINGS_FILE))
+    return timings
+
+
+def write_timings(deps_dir: str, all_pkgs, durations: Dict[str, float],
+                  previous: Optional[dict] = None) -> None:
+    """Write ``<deps_dir>/package-timings.json`` atomically.
+
+    *durations* holds the fetch time of each package fetched in this run.
+    Packages that were already present keep their duration from *previous*,
+    since re-using an existing directory says nothing about fetch cost.
+    """
+    previous = previous or {}
+    pkg_dict = getattr(all_pkgs, "packages", all_pkgs)
+
+    packages = {}
+    for name, pkg in pkg_dict.items():
+        if pkg is None:
+            continue
+        if name in durations.keys():
+            duration = durations[name]
+        elif name in previous.keys():
+            duration = previous[name].get("duration")
+        else:
+            continue
+        packages[name] = {
+            "duration": round(duration, 3) if duration is not None else None,
+            "resolved_by": pkg.resolved_by or "root",
+        }
+
+    for name, size in subtree_sizes(packages).items():
+        packages[name]["subtree_size"] = size
+
+    data = {
+        "ivpm_timings_version": TIMINGS_VERSION,
+        "packages": packages,
+    }
+
+    os.makedirs(deps_dir, exist_ok=True)
+    path = os.path.join(deps_dir, TIMINGS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, indent=2, sort_keys=True, fp=f)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def _children(timings: dict) -> Dict[str, list]:
+    ret = {}
+    for name, ent in timings.items():
+        parent = ent.get("resolved_by", "root")
+        if parent != name and parent in timings.keys():
+            ret.setdefault(parent, []).append(name)
+    return ret
+
+
+def subtree_sizes(timings: dict) -> Dict[str, int]:
+    """Return the number of transitive dependents each package gated."""
+    children = _children(timings)
+    memo = {}
+
+    def size(name, visiting):
+        if name in memo.keys():
+            return memo[name]
+        visiting.add(name)
+        n = 0
+        for c in children.get(name, []):
+            if c not in visiting:
+                n += 1 + size(c, visiting)
+        visiting.discard(name)
+        memo[name] = n
+        return n
+
+    return {name: size(name, set()) for name in timings.keys()}
+
+
+def critical_paths(timings: dict) -> Dict[str, float]:
+    """Return each package's downstream critical path in seconds.
+
+    The critical path of a package is its own fetch duration plus the
+    longest critical path among the packages it pulled in.
+    """
+    children = _children(timings)
+    memo = {}
+
+    def cp(name, visiting):
+        if name in memo.keys():
+            return memo[name]
+        visiting.add(name)
+        longest = 0.0
+        for c in children.get(name, []):
+            if c not in visiting:
+                longest = max(longest, cp(c, visiting))
+        visiting.discard(name)
+        memo[name] = (timings[name].get("duration") or 0.0) + longest
+        return memo[name]
+
+    return {name: cp(name, set()) for name in timings.keys()}
@@ -20,26 +20,190 @@
 #*
 #****************************************************************************
 import asyncio
+import concurrent.futures
+import heapq
 import logging
 import os
 import shutil
 import subprocess
 import sys
 import tarfile
+import threading
+import time
 import urllib
+import dataclasses as dc
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile
 
 from ivpm.msg import note, fatal, warning
 from ivpm.package import Package, SourceType, SourceType2Ext, PackageType
 from ivpm.packages_info import PackagesInfo
 from ivpm.proj_info import ProjInfo
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from ivpm.utils import get_venv_python
-from .project_ops_info import ProjectUpdateInfo
+from .package_timings import critical_paths
+from .project_ops_info import ProjectUpdateInfo, UpdateCancelled
 
 _logger = logging.getLogger("ivpm.package_updater")
 
 
+def _force_remove(func, path, exc_info):
+    """shutil.rmtree() error handler: make read-only entries writable and retry."""
+    import stat
+    os.chmod(os.path.dirname(path), stat.S_IRWXU)
+    if os.path.lexists(path) and not os.path.islink(path):
+        os.chmod(path, stat.S_IRWXU)
+    func(path)
+
+
+# Package attributes that select what is fetched
+_SPEC_FIELDS = ("src_type", "url", "branch", "tag", "commit", "version",
+                "dep_set", "cache", "filter", "sparse")
+
+
+def _same_spec(a : Package, b : Package) -> bool:
+    """Check whether two claims on a package ask for the same thing."""
+    from .package_lock import _entry_from_pkg
+
+    if type(a) is not type(b):
+        return False
+    # Package types with identity fields of their own compare themselves
+    match = a.spec_matches_lock(_entry_from_pkg(b))
+    if match is not None:
+        return match and a.dep_set == b.dep_set
+    return all(getattr(a, f, None) == getattr(b, f, None) for f in _SPEC_FIELDS)
+
+
+class _PrioritySlots(object):
+    """Bounded pool of worker slots handed out by priority, not arrival.
+
+    asyncio.Semaphore wakes waiters in FIFO order. Here each waiter
+    supplies a sort key, and free slots go to the lowest-keyed waiters.
+    Grants are deferred to the next loop iteration so that packages
+    queued together compete on priority rather than creation order.
+    """
+
+    def __init__(self, n):
+        self._free = n
+        self._waiters = []
+        self._seq = 0
+        self._dispatching = False
+
+    async def acquire(self, key):
+        fut = asyncio.get_event_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (key, self._seq, fut))
+        self._dispatch_soon()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Pass on a slot that was granted just as we were cancelled
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self._free += 1
+        self._dispatch_soon()
+
+    def _dispatch_soon(self):
+        if not self._dispatching:
+            self._dispatching = True
+            asyncio.get_event_loop().call_soon(self._dispatch)
+
+    def _dispatch(self):
+        self._dispatching = False
+        while self._free > 0 and len(self._waiters) > 0:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                self._free -= 1
+
+
+class _WorkerSlot(object):
+    """A package's slot in the _PrioritySlots pool of the update, as seen
+    from the worker thread loading the package.
+
+    While the thread works in a stage with its own limit, the slot is
+    lent back to the pool, so that packages held up on that stage do not
+    keep others from running (see ProjectUpdateInfo.stage()). Leaving the
+    stage, the thread takes a slot back ahead of any package not yet
+    started, which bounds the packages in flight by --jobs plus the stage
+    limits.
+    """
+
+    def __init__(self, slots : _PrioritySlots, loop):
+        self._slots = slots
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._lent = 0
+        self._held = True
+        self._done = False
+
+    def lend(self):
+        with self._lock:
+            self._lent += 1
+            if self._lent > 1 or self._done:
+                return
+            self._held = False
+        self._loop.call_soon_threadsafe(self._slots.release)
+
+    def reclaim(self):
+        with self._lock:
+            self._lent -= 1
+            if self._lent > 0 or self._done:
+                return
+        try:
+            asyncio.run_coroutine_threadsafe(
+                self._slots.acquire(_RECLAIM_KEY), self._loop).result()
+        except (concurrent.futures.CancelledError, RuntimeError):
+            # The update is shutting down
+            return
+        with self._lock:
+            if not self._done:
+                self._held = True
+                return
+        self._loop.call_soon_threadsafe(self._slots.release)
+
+    def release(self):
+        """Give the slot back for good. Called on the event loop once the
+        package's work is over."""
+        with self._lock:
+            self._done = True
+            held, self._held = self._held, False
+        if held:
+            self._slots.release()
+
+
+# Sorts before the start order of any package
+_RECLAIM_KEY = (-1,)
+
+
+# Lock-entry sources that are prefetched speculatively. Only git entries
+# record every field that decides what is fetched; archive entries lack
+# eg the unpack format.
+_SPECULATIVE_SRC = ("git",)
+
+# Fetch-affecting fields not recorded in the lock. A speculative fetch is
+# only adopted when the resolved spec leaves these as the lock-built
+# package does.
+_UNLOCKED_FIELDS = ("anonymous", "depth")
+
+
+@dc.dataclass
+class _Speculation(object):
+    """A prefetch of a locked package, started before any parent asks for it."""
+    name : str
+    entry : dict
+    pkg : Package
+    order : tuple
+    task : Optional[asyncio.Future] = None
+    started : bool = False
+    ok : bool = False
+    info : Optional[ProjectUpdateInfo] = None
+    duration : float = 0.0
+
+
 class PackageUpdater(object):
     
     def __init__(self, 
@@ -55,13 +219,39 @@ class PackageUpdater(object):
         self.args = object() if args is None else args
         self.load = load
         self.update_info = ProjectUpdateInfo(self.args, deps_dir)
+
+        # Fetch timings from a previous run (see package_timings), used to
+        # start packages with the longest downstream critical path first.
+        # 'durations' collects this run's timings for packages fetched.
+        self.timings = {}
+        self.durations = {}
+
+        # Prefetch the packages recorded in update_info.lock_data while
+        # their parents are still loading. 'prefetched' collects the names
+        # whose speculative fetch was adopted.
+        self.speculate = True
+        self.prefetched = set()
         
-        # Get max parallelism from args, default to CPU count
+        # Per-resource stage limits: network fetch, unpack/cache-store,
+        # and leaf handlers. Unset stages are bounded only by max_parallel.
+        stage_limits = {}
+        for stage, opt in (("net", "net_jobs"),
+                           ("unpack", "unpack_jobs"),
+                           ("handler", "handler_jobs")):
+            limit = getattr(args, opt, None)
+            if limit is not None and limit > 0:
+                stage_limits[stage] = limit
+        self.update_info.stage_limits = stage_limits
+
+        # Get max parallelism from args, default to CPU count. When only
+        # stage limits are given, allow enough packages in flight to keep
+        # every stage busy at once.
         if hasattr(args, 'jobs') and args.jobs is not None:
             self.max_parallel = args.jobs
         else:
             import multiprocessing
-            self.max_parallel = multiprocessing.cpu_count()
+            self.max_parallel = max(
+                multiprocessing.cpu_count(), sum(stage_limits.values()))
         self.update_info.max_parallel = self.max_parallel
         pass
     
@@ -70,120 +260,493 @@ class PackageUpdater(object):
         Updates the specified packages, handling dependencies.
         Uses async parallel fetching for efficiency.
         """
-        return asyncio.run(self._update_async(pkgs))
+        # Worker pool sized to match --jobs, plus the packages that may
+        # have lent their slot to others while in a limited stage (see
+        # _WorkerSlot; the default executor's size is unrelated to either)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_parallel + sum(self.update_info.stage_limits.values()),
+            thread_name_prefix="ivpm-update")
+        try:
+            return asyncio.run(self._update_async(pkgs))
+        finally:
+            self._executor.shutdown(wait=True)
     
     async def _update_async(self, pkgs: PackagesInfo) -> PackagesInfo:
         """
         Async implementation of update that processes packages in parallel.
         The 'pkgs' parameter holds the dependency information
         from the root project.
-        """
-        count = 1
 
-        pkg_q = []
-        
+        Packages are scheduled as a streaming work-queue over the
+        dependency DAG: as soon as a package's proj_info is available,
+        the members of its dep-set are queued. There is no per-level
+        barrier, so a slow fetch only delays its own sub-dependencies.
+
+        Each claim on a package name carries a BFS-order key (the path of
+        dep-set indices from the root). When several packages depend on
+        the same name, the claim with the lowest key wins -- the package
+        the level-by-level traversal would have picked -- so
+        ``resolved_by`` does not depend on fetch completion order. A
+        winning claim for a different spec that arrives once the package
+        is loading or loaded has the package reloaded with that spec, and
+        withdraws the claims made from the replaced package's deps (see
+        _settle()).
+        """
         if len(pkgs.keys()) == 0:
             _logger.info("No packages")
 
-        for key in pkgs.keys():
-            _logger.debug("Package: %s", key)
-            pkg_q.append(pkgs[key])
-
         if not os.path.isdir(self.deps_dir):
             os.makedirs(self.deps_dir)
 
-        # Create semaphore to limit parallelism
-        semaphore = asyncio.Semaphore(self.max_parallel)
-        
-        while True:        
-            pkg_deps = {}
-            
-            # Process this batch of packages in parallel
-            if len(pkg_q) > 0:
-                results = await self._process_batch_parallel(pkg_q, semaphore)
-                
-                # Collect dependencies from results
-                for pkg, proj_info in results:
-                    self.all_pkgs[pkg.name] = pkg
-                    
-                    # proj_info contains info on any setup-deps that
-                    # might be required
-                    if proj_info is not None:
-                        for sd in proj_info.setup_deps:
-                            _logger.debug("Add setup-dep %s to package %s", sd, pkg.name)
-                            if pkg.name not in self.all_pkgs.setup_deps.keys():
-                                self.all_pkgs.setup_deps[pkg.name] = set()
-                            self.all_pkgs.setup_deps[pkg.name].add(sd)
-
-                        if proj_info.process_deps:
-                            if not proj_info.has_dep_set(pkg.dep_set):
-                                fatal("package %s in %s does not contain specified dep-set %s" % (
-                                    proj_info.name, 
-                                    pkg.name,
-                                    pkg.dep_set))
-                                continue
-                            else:
-                                note("Loading package %s dependencies from dep-set %s" % (proj_info.name, pkg.dep_set))
-
-                            note("Processing dep-set %s of project %s" % (
-                                pkg.dep_set,
-                                pkg.name))                        
-
-                            ds : PackagesInfo = proj_info.get_dep_set(pkg.dep_set)
-                            for d in ds.packages.keys():
-                                dep = ds.packages[d]
-                        
-                                if dep.name not in pkg_deps.keys():
-                                    # Track which package caused this dependency to be resolved
-                                    dep.resolved_by = pkg.name
-                                    pkg_deps[dep.name] = dep
-                                else:
-                                    # Already resolved by a higher-level package - don't override
-                                    pass
-            
-            # Collect new dependencies and add to queue
-            pkg_q = []
-            for key in pkg_deps.keys():
-                if not key in self.all_pkgs.keys():
-                    # New package
-                    pkg_q.append(pkg_deps[key])
-            note("%d new dependencies from iteration %d" % (len(pkg_q), count))
-                    
-            if len(pkg_q) == 0:
-                # We're done
-                break
-            
-            count += 1
-            
+        # Fetch subprocesses (ProjectUpdateInfo.run_subprocess) run here
+        self.update_info.loop = asyncio.get_running_loop()
+
+        # Limit parallelism. When more packages are ready than there are
+        # slots, the one with the longest historical critical path goes
+        # first; without history this degrades to BFS order.
+        semaphore = _PrioritySlots(self.max_parallel)
+        self._critical = critical_paths(self.timings)
+
+        # Names present before the update starts (eg the root project)
+        # are never loaded as dependencies
+        preloaded = list(self.all_pkgs.keys())
+
+        # Every request for each name, as (key, package, parent); the
+        # winning one is in _claims
+        self._requests = {}
+        self._claims = {}
+        self._started = set()
+        # Loading packages whose result is to be thrown away, and loaded
+        # ones to remove; those still claimed are then loaded again
+        self._reload = set()
+        self._unload = []
+        pending : Dict[asyncio.Future, str] = {}
+        self._pending = pending
+        failed = []
+
+        self._speculations = {}
+        for spec in self._speculation_candidates(pkgs, preloaded):
+            spec.task = asyncio.ensure_future(
+                self._speculate_async(spec, semaphore))
+            self._speculations[spec.name] = spec
+
+        def fail(key, pkg, exc):
+            # Fetches stopped by the cancellation raise UpdateCancelled,
+            # a consequence of the failure rather than one to report
+            if not isinstance(exc, UpdateCancelled):
+                failed.append((key, pkg, exc))
+            self._cancel_update(pkg.name)
+
+        def schedule(pkg : Package, key : Tuple[int, ...]):
+            _logger.debug("Package: %s", pkg.name)
+            self._claims[pkg.name] = (key, pkg)
+            self._started.discard(pkg.name)
+            task = asyncio.ensure_future(
+                self._update_pkg_async(pkg.name, semaphore))
+            pending[task] = pkg.name
+
+        async def reload(name):
+            # Remove what the replaced spec fetched, then load the winner
+            if self.durations.pop(name, None) is not None:
+                await asyncio.get_event_loop().run_in_executor(
+                    self._executor, self._discard, name)
+            if name in self._claims.keys() and name not in pending.values() \
+                    and len(failed) == 0:
+                key, pkg = self._claims[name]
+                note("Loading package %s as requested by %s" % (
+                    name, pkg.resolved_by or "root"))
+                schedule(pkg, key)
+
+        for i, key in enumerate(pkgs.keys()):
+            self._requests[key] = [((i,), pkgs[key], pkgs[key].resolved_by)]
+            schedule(pkgs[key], (i,))
+
+        while len(pending) > 0:
+            done, _ = await asyncio.wait(
+                pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+
+            # Handle simultaneous completions in BFS order (withdrawn
+            # packages first)
+            for task in sorted(done, key=lambda t: self._claim_order(pending[t])
+                               if pending[t] in self._claims.keys() else (0, ())):
+                if task not in pending.keys():
+                    # Cancelled meanwhile by _replace()
+                    continue
+                name = pending.pop(task)
+
+                if name in self._reload:
+                    # Superseded while loading: its result and any
+                    # failure are moot
+                    self._reload.discard(name)
+                    if not task.cancelled():
+                        task.exception()
+                    await reload(name)
+                    continue
+
+                key, pkg = self._claims[name]
+
+                if task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    fail(key, pkg, task.exception())
+                    continue
+
+                pkg, proj_info = task.result()
+                self.all_pkgs[pkg.name] = pkg
+
+                # Once a package has failed, let running work stop but
+                # don't start anything new
+                if len(failed) > 0:
+                    continue
+
+                try:
+                    deps = self._get_deps(pkg, proj_info)
+                except Exception as e:
+                    fail(key, pkg, e)
+                    continue
+
+                n_new = 0
+                for i, dep in enumerate(deps):
+                    dep_key = key + (i,)
+                    if dep.name in preloaded:
+                        continue
+                    requests = self._requests.setdefault(dep.name, [])
+                    requests.append((dep_key, dep, pkg.name))
+                    if dep.name not in self._claims.keys():
+                        # Track which package caused this dependency to be resolved
+                        dep.resolved_by = pkg.name
+                        if dep.name in self._reload or dep.name in self._unload:
+                            # Loaded once its withdrawn load is undone
+                            self._claims[dep.name] = (dep_key, dep)
+                        else:
+                            schedule(dep, dep_key)
+                        n_new += 1
+                    else:
+                        self._settle(dep.name)
+                if n_new > 0:
+                    note("%d new dependencies from package %s" % (n_new, pkg.name))
+
+                while len(self._unload) > 0:
+                    await reload(self._unload.pop(0))
+
+        # Locked packages that nothing claimed are no longer needed
+        await self._discard_speculations()
+        if len(self.prefetched) > 0 and len(failed) == 0:
+            note("%d packages prefetched from package-lock.json" % len(self.prefetched))
+
+        if len(failed) > 0:
+            self._report_failures(failed)
+
+        # Present packages in BFS order regardless of completion order
+        loaded = sorted(
+            (n for n in self.all_pkgs.keys() if n not in preloaded),
+            key=self._claim_order)
+        ordered = {n : self.all_pkgs[n] for n in preloaded}
+        for n in loaded:
+            ordered[n] = self.all_pkgs[n]
+        self.all_pkgs.packages = ordered
+
         return self.all_pkgs
-    
-    async def _process_batch_parallel(self, pkg_q: List[Package], semaphore: asyncio.Semaphore) -> List[Tuple[Package, ProjInfo]]:
-        """Process a batch of packages in parallel."""
-        tasks = []
-        for pkg in pkg_q:
-            tasks.append(self._update_pkg_async(pkg, semaphore))
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Process results, handling any exceptions
-        processed = []
-        for i, result in enumerate(results):
-            pkg = pkg_q[i]
-            if isinstance(result, Exception):
-                # Notify listeners of failure
-                self.update_info.package_error(pkg.name, str(result))
-                fatal("Failed to update package %s: %s" % (pkg.name, str(result)))
+
+    def _cancel_update(self, name : str):
+        """Fail fast after 'name' failed: cancel queued packages and
+        terminate the subprocesses of running ones."""
+        if self.update_info.cancelled:
+            return
+        note("Cancelling remaining packages after failure in %s" % name)
+        self.update_info.cancel()
+        for task, n in self._pending.items():
+            if n not in self._started:
+                task.cancel()
+
+    def _report_failures(self, failed):
+        """Notify listeners of each failure, then raise a single fatal
+        error listing all of them in BFS order."""
+        failed.sort(key=lambda f: (len(f[0]), f[0]))
+        for key, pkg, exc in failed:
+            # Notify listeners of failure
+            self.update_info.package_error(pkg.name, str(exc))
+        if len(failed) == 1:
+            key, pkg, exc = failed[0]
+            fatal("Failed to update package %s: %s" % (pkg.name, str(exc)))
+        fatal("Failed to update %d packages:\n%s" % (
+            len(failed),
+            "\n".join("  %s: %s" % (pkg.name, str(exc)) for _, pkg, exc in failed)))
+
+    def _claim_order(self, name : str):
+        """Sort key placing a claimed package in BFS (level, then dep-set) order."""
+        key = self._claims[name][0]
+        return (len(key), key)
+
+    def _start_order(self, name : str):
+        """Sort key for queued packages: longest critical path, then BFS order.
+
+        Claimed packages always go ahead of speculative prefetches.
+        """
+        return (0, -self._critical.get(name, 0.0), self._claim_order(name))
+
+    def _speculation_candidates(self, pkgs : PackagesInfo, preloaded) -> List[_Speculation]:
+        """Select the locked packages worth fetching before they are claimed.
+
+        These are the transitive (not root-level) dependencies recorded in
+        package-lock.json that are missing from the deps directory and
+        that are still reachable from a current root-level dependency.
+        Each is rebuilt with its requested spec, not the resolved commit,
+        so it fetches what the normal path would.
+        """
+        from .package_lock import package_from_lock_entry
+
+        lock = self.update_info.lock_data
+        if not self.speculate or lock is None:
+            return []
+        locked = lock.get("packages", {})
+
+        def root_of(name):
+            seen = set()
+            while name in locked.keys() and name not in seen:
+                seen.add(name)
+                parent = locked[name].get("resolved_by") or "root"
+                if parent == "root":
+                    return name
+                name = parent
+            return None
+
+        ret = []
+        for i, (name, entry) in enumerate(locked.items()):
+            if name in pkgs.keys() or name in preloaded:
+                continue
+            if entry.get("src") not in _SPECULATIVE_SRC:
+                continue
+            if root_of(name) not in pkgs.keys():
+                continue
+            if os.path.lexists(os.path.join(self.deps_dir, name)):
+                continue
+            pkg = package_from_lock_entry(name, entry, pinned=False)
+            if pkg is None:
+                continue
+            order = (1, -self._critical.get(name, 0.0), i)
+            ret.append(_Speculation(name, entry, pkg, order))
+        return ret
+
+    async def _speculate_async(self, spec : _Speculation, semaphore : _PrioritySlots):
+        await semaphore.acquire(spec.order)
+        slot = _WorkerSlot(semaphore, asyncio.get_event_loop())
+        try:
+            spec.started = True
+            await asyncio.get_event_loop().run_in_executor(
+                self._executor, self._in_slot, slot, self._speculate, spec)
+        finally:
+            slot.release()
+
+    def _speculate(self, spec : _Speculation):
+        """Fetch a locked package ahead of its claim.
+
+        Runs on a fork of update_info, so the fetch emits no events and
+        its statistics count only if the result is adopted. Failures are
+        not reported: the normal path retries and reports them.
+        """
+        _logger.debug("Speculatively fetching %s", spec.name)
+        spec.info = self.update_info.fork()
+        t_start = time.monotonic()
+        try:
+            spec.pkg.update(spec.info)
+            spec.ok = True
+        except Exception as e:
+            _logger.debug("Speculative fetch of %s failed: %s", spec.name, e)
+            self._discard(spec.name)
+        spec.duration = time.monotonic() - t_start
+
+    async def _await_speculation(self, name : str) -> Optional[_Speculation]:
+        """Settle the prefetch of 'name' (if any) before its claim loads.
+
+        A prefetch still waiting for a slot is cancelled; one underway is
+        waited for. Returns the speculation if it ran.
+        """
+        spec = self._speculations.pop(name, None)
+        if spec is None:
+            return None
+        if not spec.started:
+            spec.task.cancel()
+        try:
+            await spec.task
+        except asyncio.CancelledError:
+            pass
+        return spec if spec.started else None
+
+    def _reconcile(self, pkg : Package, spec : _Speculation):
+        """Adopt a prefetch if the resolved spec matches the lock entry it
+        was built from; otherwise remove what it fetched."""
+        from .package_lock import _spec_matches_lock
+
+        if not spec.ok:
+            return
+        matches = _spec_matches_lock(pkg, spec.entry) and all(
+            getattr(pkg, f, None) == getattr(spec.pkg, f, None)
+            for f in _UNLOCKED_FIELDS)
+        if not matches:
+            note("Discarding prefetch of %s: spec differs from package-lock.json" % pkg.name)
+            self._discard(pkg.name)
+            return
+
+        _logger.debug("Adopting prefetch of %s", pkg.name)
+        self.prefetched.add(pkg.name)
+        self.update_info.merge_stats(spec.info)
+        self.durations[pkg.name] = spec.duration
+        for attr in ("resolved_commit", "from_deps_source"):
+            if getattr(spec.pkg, attr, None) is not None:
+                setattr(pkg, attr, getattr(spec.pkg, attr))
+
+    async def _discard_speculations(self):
+        """Cancel or wait out unclaimed prefetches and remove their results."""
+        loop = asyncio.get_event_loop()
+        for name in list(self._speculations.keys()):
+            spec = await self._await_speculation(name)
+            if spec is not None and spec.ok:
+                _logger.debug("Discarding unused prefetch of %s", name)
+                await loop.run_in_executor(self._executor, self._discard, name)
+
+    def _discard(self, name : str):
+        """Remove a package directory (or cache link) from the deps dir."""
+        for path in (os.path.join(self.deps_dir, name),
+                     os.path.join(self.deps_dir, ".cache_temp_%s" % name)):
+            if os.path.islink(path):
+                os.unlink(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path, onerror=_force_remove)
+
+    def _settle(self, name : str):
+        """Make the request for 'name' with the lowest BFS-order key the
+        claim, after a request was made or withdrawn.
+
+        If the package has not yet acquired a worker slot, the winning
+        spec replaces the queued one. Once it is loading or loaded, the
+        winner is credited if it asks for the same spec; otherwise the
+        package is loaded again with the winner's spec (once a loading
+        one finishes), and the requests made from its deps are withdrawn.
+        A package no longer requested at all is removed.
+        """
+        requests = self._requests.get(name, [])
+        key, claimed = self._claims[name]
+        if len(requests) == 0:
+            del self._claims[name]
+            self._replace(name, key)
+            return
+        dep_key, dep, parent = min(requests, key=lambda r: (len(r[0]), r[0]))
+        if dep_key == key:
+            return
+        if name not in self._started:
+            dep.resolved_by = parent
+            self._claims[name] = (dep_key, dep)
+        elif _same_spec(dep, claimed):
+            claimed.resolved_by = parent
+            self._claims[name] = (dep_key, claimed)
+        else:
+            dep.resolved_by = parent
+            self._claims[name] = (dep_key, dep)
+            self._replace(name, key)
+
+    def _replace(self, name : str, key : Tuple[int, ...]):
+        """Undo the load of 'name' as claimed with 'key': throw away the
+        result of a loading package, remove a loaded one and withdraw the
+        requests its deps made, and cancel a queued one no longer
+        claimed."""
+        if name not in self._started:
+            for task, n in list(self._pending.items()):
+                if n == name:
+                    task.cancel()
+                    del self._pending[task]
+        elif name in self._pending.values():
+            self._reload.add(name)
+        else:
+            self.all_pkgs.packages.pop(name, None)
+            self.all_pkgs.setup_deps.pop(name, None)
+            if name not in self._unload:
+                self._unload.append(name)
+            self._withdraw(key)
+
+    def _withdraw(self, key : Tuple[int, ...]):
+        """Withdraw the requests made from the subtree of the package
+        claimed with 'key', and settle the names they were for."""
+        for name in list(self._requests.keys()):
+            requests = self._requests[name]
+            kept = [r for r in requests
+                    if len(r[0]) <= len(key) or r[0][:len(key)] != key]
+            if len(kept) < len(requests):
+                self._requests[name] = kept
+                if name in self._claims.keys():
+                    self._settle(name)
+
+    def _get_deps(self, pkg : Package, proj_info : ProjInfo) -> List[Package]:
+        """Returns the dep-set members that loading 'pkg' brings in."""
+        ret = []
+        if proj_info is None:
+            return ret
+
+        # proj_info contains info on any setup-deps that
+        # might be required
+        for sd in proj_info.setup_deps:
+            _logger.debug("Add setup-dep %s to package %s", sd, pkg.name)
+            if pkg.name not in self.all_pkgs.setup_deps.keys():
+                self.all_pkgs.setup_deps[pkg.name] = set()
+            self.all_pkgs.setup_deps[pkg.name].add(sd)
+
+        if proj_info.process_deps:
+            if not proj_info.has_dep_set(pkg.dep_set):
+                fatal("package %s in %s does not contain specified dep-set %s" % (
+                    proj_info.name, 
+                    pkg.name,
+                    pkg.dep_set))
+                return ret
             else:
-                processed.append(result)
-        
-        return processed
-    
-    async def _update_pkg_async(self, pkg: Package, semaphore: asyncio.Semaphore) -> Tuple[Package, ProjInfo]:
-        """Async wrapper for updating a single package with semaphore limiting."""
-        async with semaphore:
-            return await asyncio.get_event_loop().run_in_executor(
-                None, self._update_pkg, pkg
+                note("Loading package %s dependencies from dep-set %s" % (proj_info.name, pkg.dep_set))
+
+            note("Processing dep-set %s of project %s" % (
+                pkg.dep_set,
+                pkg.name))                        
+
+            ds : PackagesInfo = proj_info.get_dep_set(pkg.dep_set)
+            for d in ds.packages.keys():
+                ret.append(ds.packages[d])
+
+        return ret
+
+    async def _update_pkg_async(self, name: str, semaphore: _PrioritySlots) -> Tuple[Package, ProjInfo]:
+        """Async wrapper for updating a single package with slot limiting.
+
+        The package spec is looked up only once a slot is available, so a
+        higher-priority claim made while queued is the one that is loaded.
+        Any prefetch of the package is settled first, then adopted or
+        discarded against that spec.
+        """
+        spec = await self._await_speculation(name)
+        await semaphore.acquire(self._start_order(name))
+        loop = asyncio.get_event_loop()
+        slot = _WorkerSlot(semaphore, loop)
+        try:
+            self._started.add(name)
+            pkg = self._claims[name][1]
+            if spec is not None:
+                await loop.run_in_executor(
+                    self._executor, self._reconcile, pkg, spec)
+            return await loop.run_in_executor(
+                self._executor, self._in_slot, slot, self._update_pkg, pkg
             )
+        except UpdateCancelled:
+            raise
+        except Exception:
+            # Cancel before the slot is released, so no queued package
+            # starts in the meantime. A superseded spec failing does not
+            # fail the update.
+            if name not in self._reload:
+                self._cancel_update(name)
+            raise
+        finally:
+            slot.release()
+
+    def _in_slot(self, slot : _WorkerSlot, fn, *args):
+        """Run fn(*args) on this worker thread, which holds 'slot'."""
+        with self.update_info.worker_slot(slot):
+            return fn(*args)
     
     def _update_pkg(self, pkg : Package) -> Tuple[Package, ProjInfo]:
         """Loads a single package. Returns the package and any dependencies."""
@@ -209,11 +772,19 @@ class PackageUpdater(object):
         pkg_dir = os.path.join(self.deps_dir, pkg.name)
         pkg.path = pkg_dir.replace("\\", "/")
 
+        # Only a real fetch says anything about how long this package takes
+        fetching = not os.path.lexists(pkg_dir)
+        fetched = False
+        t_start = time.monotonic()
+
         try:
+            self.update_info.check_cancelled()
+
             # Notify handler before the package is fetched
             self.pkg_handler.on_leaf_pre_load(pkg, self.update_info)
 
             pkg.proj_info = pkg.update(self.update_info)
+            fetched = True
 
             # Merge self-declared types from the dep's own ivpm.yaml into pkg.type_data.
             # Caller-specified types take priority; self-declared ones are appended only
@@ -229,7 +800,8 @@ class PackageUpdater(object):
             # Notify the package handlers after the source is loaded
             from .handlers.package_handler import HandlerFatalError
             try:
-                self.pkg_handler.on_leaf_post_load(pkg, self.update_info)
+                with self.update_info.phase("leaf-handlers", stage="handler"):
+                    self.pkg_handler.on_leaf_post_load(pkg, self.update_info)
             except HandlerFatalError:
                 raise
             except Exception as leaf_exc:
@@ -240,12 +812,19 @@ class PackageUpdater(object):
                 pkg.proj_info.target_dep_set = pkg.dep_set
                 pkg.proj_info.process_deps = pkg.process_deps
             
+            if fetching:
+                self.durations[pkg.name] = time.monotonic() - t_start
+
             # Signal package complete, passing resolved version if available (e.g., gh-rls)
             resolved_version = getattr(pkg, 'resolved_version', None)
             self.update_info.package_complete(pkg.name, version=resolved_version)
             
             return (pkg, pkg.proj_info)
         except Exception as e:
+            # Don't leave a half-cloned or half-extracted package behind:
+            # the next update would take it as already loaded
+            if fetching and not fetched:
+                self._discard(pkg.name)
             # Signal package error
             self.update_info.package_error(pkg.name, str(e))
             raise
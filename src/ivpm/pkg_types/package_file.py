@@ -21,6 +21,7 @@
 #****************************************************************************
 import os
 import shutil
+import stat
 import tarfile
 from zipfile import ZipFile
 import dataclasses as dc
@@ -29,6 +30,8 @@ from ..proj_info import ProjInfo
 from ..project_ops_info import ProjectUpdateInfo
 from ..utils import getlocstr
 
+_WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
 @dc.dataclass
 class PackageFile(PackageURL):
     unpack : bool = None
@@ -45,18 +48,22 @@ class PackageFile(PackageURL):
 
             # Install (unpack) the file 
             if self.unpack:
-                self._install(self.url, pkg_dir)
+                with update_info.phase("unpack", stage="unpack"):
+                    self._install(self.url, pkg_dir)
 
         if os.path.isdir(pkg_dir):
             return ProjInfo.mkFromProj(pkg_dir)
         else:
             return None
     
-    def _install(self, pkg_src, pkg_path):
+    def _install(self, pkg_src, pkg_path, readonly=False):
+        """Unpack the archive 'pkg_src' into 'pkg_path'. With readonly=True,
+        files are written without write permission (directories are left
+        for the caller), which saves a chmod pass over the tree."""
         if self.src_type in (".tar.gz", ".tar.xz", ".tar.bz2"):
-            self._install_tgz(pkg_src, pkg_path)
+            self._install_tgz(pkg_src, pkg_path, readonly)
         elif self.src_type in (".jar", ".zip"):
-            self._install_zip(pkg_src, pkg_path)
+            self._install_zip(pkg_src, pkg_path, readonly)
         else:
             hint = ""
             if self.url and ("github.com" in self.url or self.url.endswith(".git") or "/" in self.url.rstrip("/")):
@@ -67,7 +74,7 @@ class PackageFile(PackageURL):
                     self.name, self.src_type if self.src_type else "<none detected>",
                     self.url, getlocstr(self), hint))
 
-    def _install_tgz(self, pkg_src, pkg_path):
+    def _install_tgz(self, pkg_src, pkg_path, readonly=False):
         pkg_path = os.path.abspath(pkg_path)
         tf = tarfile.open(pkg_src)
 
@@ -83,10 +90,14 @@ class PackageFile(PackageURL):
                         first_slash_link = fi.linkname.find("/")
                         fi.linkname = fi.linkname[first_slash_link+1:]
 
+                if readonly and fi.isreg():
+                    # Applied by tarfile once the content is written
+                    fi.mode &= ~_WRITE_BITS
+
                 tf.extract(fi, path=pkg_path)
         tf.close()
 
-    def _install_zip(self, pkg_src, pkg_path):
+    def _install_zip(self, pkg_src, pkg_path, readonly=False):
         pkg_src = os.path.abspath(pkg_src)
         pkg_path = os.path.abspath(pkg_path)
 
@@ -94,7 +105,13 @@ class PackageFile(PackageURL):
             shutil.rmtree(pkg_path)
 
         with ZipFile(pkg_src, 'r') as zipObj:
-            zipObj.extractall(pkg_path)
+            if not readonly:
+                zipObj.extractall(pkg_path)
+            else:
+                for zi in zipObj.infolist():
+                    path = zipObj.extract(zi, pkg_path)
+                    if not zi.is_dir():
+                        os.chmod(path, 0o444)
 
     def process_options(self, opts, si):
         super().process_options(opts, si)
@@ -84,8 +84,8 @@ class PackageFuseSoC(Package):
 
     def _fetch_url_provider(self, update_info: ProjectUpdateInfo, core_path: str):
         """Handle FuseSoC 'url' providers: download a single file + place the .core file."""
-        import httpx
         import shutil
+        from ..http_client import client_for
         from ..proj_info import ProjInfo
 
         with open(core_path) as fh:
@@ -109,7 +109,8 @@ class PackageFuseSoC(Package):
         filename = os.path.basename(file_url.split("?")[0])
         dest_file = os.path.join(pkg_dir, filename)
         note("Downloading %s from %s" % (self.name, file_url))
-        r = httpx.get(file_url, follow_redirects=True)
+        with update_info.phase("download", stage="net"):
+            r = client_for(update_info).get(file_url, follow_redirects=True)
         if r.status_code < 200 or r.status_code >= 300:
             fatal("Failed to download %s: HTTP %d" % (file_url, r.status_code))
         with open(dest_file, "wb") as f:
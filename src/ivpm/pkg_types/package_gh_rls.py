@@ -21,7 +21,6 @@
 #****************************************************************************
 import os
 import fnmatch
-import httpx
 import json
 import logging
 import re
@@ -32,6 +31,7 @@ import dataclasses as dc
 from typing import Optional
 from ..proj_info import ProjInfo
 from ..cache import Cache
+from ..http_client import client_for
 from ..utils import note
 from .package_http import PackageHttp
 
@@ -95,7 +95,8 @@ class PackageGhRls(PackageHttp):
             return
 
         # Query release metadata
-        rls_info, rls, file_url, forced_ext = self._resolve_release()
+        with update_info.phase("resolve", stage="net"):
+            rls_info, rls, file_url, forced_ext = self._resolve_release(update_info)
         # Get version from release tag for caching
         release_tag = rls.get("tag_name", "")
         self.resolved_version = release_tag
@@ -127,10 +128,11 @@ class PackageGhRls(PackageHttp):
             headers["Authorization"] = "Bearer " + token
         return headers
 
-    def _fetch_tags(self):
+    def _fetch_tags(self, update_info=None):
         """Fetch tags from GitHub API and normalize them to release-like dicts."""
         tags_url = self._repo_base_url() + "/tags"
-        resp = httpx.get(tags_url, headers=self._github_headers(), follow_redirects=True)
+        resp = client_for(update_info).get(
+            tags_url, headers=self._github_headers(), follow_redirects=True)
         if resp.status_code != 200:
             return []
         tags = json.loads(resp.content)
@@ -148,14 +150,15 @@ class PackageGhRls(PackageHttp):
             })
         return normalized
 
-    def _resolve_release(self):
+    def _resolve_release(self, update_info=None):
         """Query GitHub API and resolve the release and asset to download.
         
         Returns:
             Tuple of (rls_info, rls, file_url, forced_ext)
         """
         releases_url = self._repo_base_url() + "/releases"
-        rls_info_resp = httpx.get(releases_url, headers=self._github_headers(), follow_redirects=True)
+        rls_info_resp = client_for(update_info).get(
+            releases_url, headers=self._github_headers(), follow_redirects=True)
 
         if rls_info_resp.status_code != 200:
             raise Exception("Failed to fetch release info: %d" % rls_info_resp.status_code)
@@ -175,7 +178,7 @@ class PackageGhRls(PackageHttp):
                 break
             if rls is None:
                 # No formal releases — fall back to most recent tag
-                tags = self._fetch_tags()
+                tags = self._fetch_tags(update_info)
                 if tags:
                     rls = tags[0]
                     rls_info = tags
@@ -189,7 +192,7 @@ class PackageGhRls(PackageHttp):
                 _logger.debug("%s: version '%s' not found in releases, falling back to tags",
                               self.name, self.version)
                 # Not found in releases — try tags
-                tags = self._fetch_tags()
+                tags = self._fetch_tags(update_info)
                 rls = self._select_release_by_version(tags)
                 if rls is None:
                     raise Exception(f"No release or tag matches version spec '{self.version}'")
@@ -307,12 +310,25 @@ class PackageGhRls(PackageHttp):
             update_info.report_cache_unconfigured()
             return self._update_no_cache_readonly(update_info, pkg_dir, file_url, forced_ext)
 
-        if cache.has_version(self.name, version):
-            note("Cache hit for %s at version %s" % (self.name, version))
-            cache.link_to_deps(self.name, version, update_info.deps_dir)
-            update_info.report_cache_hit()
-            return
+        # On a miss, wait for any other process downloading the same
+        # version, then check again
+        lock = cache.version_lock(self.name, version)
+        try:
+            if not cache.has_version(self.name, version):
+                with update_info.phase("cache-wait"):
+                    lock.acquire()
+            if cache.has_version(self.name, version):
+                note("Cache hit for %s at version %s" % (self.name, version))
+                with update_info.phase("cache-link"):
+                    cache.link_to_deps(self.name, version, update_info.deps_dir)
+                update_info.report_cache_hit()
+                return
+            self._fetch_to_cache(update_info, cache, file_url, forced_ext, version)
+        finally:
+            lock.release()
 
+    def _fetch_to_cache(self, update_info, cache, file_url, forced_ext, version):
+        """Download a version missing from the cache, store it and link it."""
         note("Cache miss for %s - downloading" % self.name)
         update_info.report_cache_miss()
 
@@ -326,22 +342,26 @@ class PackageGhRls(PackageHttp):
         if forced_ext is not None and not filename.endswith(forced_ext):
             filename = filename + forced_ext
         download_dst = os.path.join(update_info.deps_dir, filename)
-        self._download_file(file_url, download_dst)
+        with update_info.phase("download", stage="net"):
+            self._download_file(file_url, download_dst, update_info)
 
-        self._install(download_dst, temp_dir)
-        os.unlink(download_dst)
+        with update_info.phase("unpack", stage="unpack"):
+            self._install(download_dst, temp_dir)
+            os.unlink(download_dst)
 
-        cache.store_version(self.name, version, temp_dir)
-        cache.link_to_deps(self.name, version, update_info.deps_dir)
+        with update_info.phase("cache-store", stage="unpack"):
+            cache.store_version(self.name, version, temp_dir, source_url=file_url)
+        with update_info.phase("cache-link"):
+            cache.link_to_deps(self.name, version, update_info.deps_dir)
 
     def _update_no_cache_readonly(self, update_info, pkg_dir, file_url, forced_ext):
         """Download and make read-only (cache=False)."""
         note("loading package %s (no cache, read-only)" % self.name)
 
-        self._update_normal(update_info, pkg_dir, file_url, forced_ext)
-        self._make_readonly(pkg_dir)
+        self._update_normal(update_info, pkg_dir, file_url, forced_ext, readonly=True)
+        self._make_readonly(pkg_dir, files=False)
 
-    def _update_normal(self, update_info, pkg_dir, file_url, forced_ext):
+    def _update_normal(self, update_info, pkg_dir, file_url, forced_ext, readonly=False):
         """Normal download without caching."""
         self._determine_src_type(file_url, forced_ext)
 
@@ -349,9 +369,11 @@ class PackageGhRls(PackageHttp):
         if forced_ext is not None and not filename.endswith(forced_ext):
             filename = filename + forced_ext
         download_dst = os.path.join(update_info.deps_dir, filename)
-        self._download_file(file_url, download_dst)
+        with update_info.phase("download", stage="net"):
+            self._download_file(file_url, download_dst, update_info)
 
-        self._install(download_dst, pkg_dir)
+        with update_info.phase("unpack", stage="unpack"):
+            self._install(download_dst, pkg_dir, readonly)
         os.unlink(download_dst)
 
     def _parse_version_tuple(self, v):
@@ -19,20 +19,98 @@
 #*     Author: 
 #*
 #****************************************************************************
+import asyncio
+import hashlib
 import logging
 import os
+import re
+import shutil
 import sys
 import subprocess
+import threading
 import dataclasses as dc
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from .package_url import PackageURL
 from ..proj_info import ProjInfo
 from ..project_ops_info import ProjectUpdateInfo, ProjectStatusInfo, ProjectSyncInfo
-from ..utils import note, fatal
+from ..utils import make_tree_readonly, note, fatal
 from ..cache import Cache, is_github_url, parse_github_url
+from ..git_meta import head_commit, read_ref
+from ..git_refs import RefResolver
+from ..http_client import client_for
+from ..subprocess_runner import SubprocessRunner, run_sync
 
 _logger = logging.getLogger("ivpm.pkg_types.package_git")
 
+_FULL_SHA_RE = re.compile(r"[0-9a-f]{40}|[0-9a-f]{64}")
+
+# Supported values of the 'filter' option
+_CLONE_FILTERS = ("blob:none", "tree:0")
+
+# Fetches into a cache mirror are serialized within the process
+_mirror_locks = {}
+_mirror_locks_lock = threading.Lock()
+
+
+def _mirror_lock(mirror: str) -> threading.Lock:
+    with _mirror_locks_lock:
+        return _mirror_locks.setdefault(mirror, threading.Lock())
+
+
+def _is_local_url(url: str) -> bool:
+    """True if git 'url' names a local repository (a path or file: URL)."""
+    if url.startswith("file:"):
+        return True
+    # Not "scheme://..." nor scp-like "host:path"
+    return "://" not in url and ":" not in url.split("/")[0]
+
+
+def _parse_status_v2(out: str) -> dict:
+    """Parse ``git status --porcelain=v2 --branch`` output.
+
+    Returns the HEAD commit ("" before the first commit), branch (None
+    when detached), ahead/behind counts (None without an upstream), and
+    the changed and untracked entries as ``git status --porcelain`` lines.
+    """
+    st = dict(commit="", branch=None, ahead=None, behind=None,
+              modified=[], untracked=[])
+    for line in out.splitlines():
+        if line.startswith("# "):
+            key, _, value = line[2:].partition(" ")
+            if key == "branch.oid" and value != "(initial)":
+                st["commit"] = value
+            elif key == "branch.head" and value != "(detached)":
+                st["branch"] = value
+            elif key == "branch.ab":
+                ahead, behind = value.split()
+                st["ahead"] = int(ahead)
+                st["behind"] = -int(behind)
+        elif line.startswith("1 "):
+            fields = line.split(" ", 8)
+            st["modified"].append("%s %s" % (fields[1].replace(".", " "), fields[8]))
+        elif line.startswith("2 "):
+            fields = line.split(" ", 9)
+            path, _, orig = fields[9].partition("\t")
+            st["modified"].append("%s %s -> %s" % (fields[1].replace(".", " "), orig, path))
+        elif line.startswith("u "):
+            fields = line.split(" ", 10)
+            st["modified"].append("%s %s" % (fields[1], fields[10]))
+        elif line.startswith("? "):
+            st["untracked"].append("?? " + line[2:])
+    return st
+
+
+def _mirror_is_complete(update_info: ProjectUpdateInfo, mirror: str) -> bool:
+    """True if 'mirror' holds full history (see _fetch_full_mirror())."""
+    if not os.path.isdir(mirror):
+        return False
+    result = update_info.run_subprocess(
+        ["git", "config", "--get", "ivpm.complete"],
+        cwd=mirror, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stdout.strip() == "true" \
+        and not os.path.isfile(os.path.join(mirror, "shallow"))
+
 
 @dc.dataclass
 class PackageGit(PackageURL):
@@ -40,6 +118,8 @@ class PackageGit(PackageURL):
     commit : str = None
     tag : str = None
     depth : str = None
+    filter : str = None  # partial-clone filter ("blob:none" or "tree:0")
+    sparse : list = None  # cone-mode sparse-checkout directories
     anonymous : bool = None
     resolved_commit : str = None  # actual commit hash after fetch
 
@@ -77,28 +157,78 @@ class PackageGit(PackageURL):
 
         return ProjInfo.mkFromProj(pkg_dir)
 
+    def _resolve_ref(self, ref: str, update_info: ProjectUpdateInfo = None) -> str:
+        """Resolve 'ref' to a commit hash: GitHub API for GitHub URLs, else
+        git ls-remote. The answer is memoized for the rest of the update,
+        so other packages (and code paths) naming the same ref reuse it.
+
+        For cache: true packages with a ref cache (see ref_cache.RefCache),
+        a resolution checked within --ref-ttl is used without network
+        access, and GitHub lookups are conditional on the stored ETag.
+        Other packages always ask the remote.
+        """
+        resolver = update_info.ref_resolver if update_info is not None else RefResolver()
+        ref_cache = None
+        if update_info is not None and self.cache is True:
+            ref_cache = update_info.ref_cache
+
+        def resolve():
+            cached = ref_cache.get(self.url, ref) if ref_cache is not None else None
+            if cached is not None and ref_cache.is_fresh(cached):
+                _logger.debug("Using cached resolution of %s@%s", self.url, ref)
+                return cached["commit"]
+
+            commit = etag = None
+            if is_github_url(self.url):
+                owner, repo = parse_github_url(self.url)
+                commit, etag = self._github_api_commit(
+                    owner, repo, ref, cached, update_info)
+            if commit is None:
+                commit = self._get_commit_hash_ls_remote(ref, update_info)
+            if commit is not None and ref_cache is not None:
+                ref_cache.put(self.url, ref, commit, etag)
+            return commit
+        return resolver.memoize(self.url, ref, resolve)
+
+    def _github_api_commit(self, owner: str, repo: str, ref: str, cached: dict = None,
+                           update_info: ProjectUpdateInfo = None):
+        """Look up 'ref' with the GitHub API. Returns (commit, etag), or
+        (None, None) if the API could not answer.
+
+        If 'cached' holds a previous answer with an ETag, the request is
+        conditional: a 304 reply confirms the cached commit.
+        """
+        api_url = f"https://api.github.com/repos/{owner}/{repo}/commits/{ref}"
+        headers = {}
+        if cached is not None and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        try:
+            response = client_for(update_info).get(
+                api_url, headers=headers, follow_redirects=True, timeout=30)
+        except Exception:
+            return (None, None)
+        if response.status_code == 304 and cached is not None:
+            return (cached["commit"], cached.get("etag"))
+        if response.status_code == 200:
+            try:
+                return (response.json()["sha"], response.headers.get("ETag"))
+            except Exception:
+                pass
+        return (None, None)
+
     def _get_github_commit_hash(self, owner: str, repo: str, ref: str = None, update_info: ProjectUpdateInfo = None) -> str:
         """Get the commit hash for a GitHub repo using the API or git ls-remote.
         
         For general git URLs, uses git ls-remote to get the hash.
         """
-        import httpx
-        
         if ref is None:
             ref = self.branch or self.tag or "HEAD"
 
-        
         # Try GitHub API first if it's a GitHub URL
         if is_github_url(self.url):
-            try:
-                # Use GitHub API to get the commit hash
-                api_url = f"https://api.github.com/repos/{owner}/{repo}/commits/{ref}"
-                response = httpx.get(api_url, follow_redirects=True, timeout=30)
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["sha"]
-            except Exception:
-                pass
+            commit, _ = self._github_api_commit(owner, repo, ref, update_info=update_info)
+            if commit is not None:
+                return commit
         
         # Fallback to git ls-remote for any git URL
         return self._get_commit_hash_ls_remote(ref, update_info)
@@ -107,61 +237,25 @@ class PackageGit(PackageURL):
         """Get commit hash using git ls-remote.
 
         Tries the effective URL (SSH when not anonymous) first, then
-        falls back to the original HTTPS URL if that fails.
+        falls back to the original HTTPS URL if that fails. Each remote is
+        listed at most once per update (see git_refs.RefResolver).
         """
         if ref is None:
             ref = self.branch or self.tag or "HEAD"
 
+        resolver = update_info.ref_resolver if update_info is not None else RefResolver()
+
         url = self._get_effective_url(update_info)
         urls_to_try = [url]
         if url != self.url:
             urls_to_try.append(self.url)
 
         for try_url in urls_to_try:
-            result = self._ls_remote(try_url, ref)
+            result = resolver.resolve(try_url, ref)
             if result is not None:
                 return result
         return None
 
-    def _ls_remote(self, url: str, ref: str) -> str:
-        """Run git ls-remote against a single URL/ref. Returns hash or None."""
-        try:
-            # Use git ls-remote to get the hash
-            result = subprocess.run(
-                ["git", "ls-remote", url, ref],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                # Output format: "hash\tref"
-                return result.stdout.strip().split()[0]
-            
-            # Try refs/heads/ prefix for branches
-            if not ref.startswith("refs/"):
-                result = subprocess.run(
-                    ["git", "ls-remote", url, f"refs/heads/{ref}"],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                if result.returncode == 0 and result.stdout.strip():
-                    return result.stdout.strip().split()[0]
-                
-                # Try refs/tags/ prefix for tags
-                result = subprocess.run(
-                    ["git", "ls-remote", url, f"refs/tags/{ref}"],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                if result.returncode == 0 and result.stdout.strip():
-                    return result.stdout.strip().split()[0]
-        except Exception:
-            pass
-        
-        return None
-
     def _resolve_commit_for_deps_source(self, update_info: ProjectUpdateInfo):
         """Populate self.resolved_commit (no clone) so deps-source matching
         can compare commit hashes.  Safe to call repeatedly; subsequent
@@ -174,11 +268,8 @@ class PackageGit(PackageURL):
             self.resolved_commit = self.commit
             return
         ref = self.branch or self.tag or "HEAD"
-        if is_github_url(self.url):
-            owner, repo = parse_github_url(self.url)
-            h = self._get_github_commit_hash(owner, repo, ref, update_info)
-        else:
-            h = self._get_commit_hash_ls_remote(ref, update_info)
+        with update_info.phase("resolve", stage="net"):
+            h = self._resolve_ref(ref, update_info)
         if h is not None:
             self.resolved_commit = h
 
@@ -190,13 +281,8 @@ class PackageGit(PackageURL):
 
         
         # Get the commit hash - use GitHub API for GitHub URLs, git ls-remote otherwise
-        commit_hash = None
-        if is_github_url(self.url):
-            owner, repo = parse_github_url(self.url)
-            commit_hash = self._get_github_commit_hash(owner, repo, ref, update_info)
-        else:
-            # Use git ls-remote for general git URLs
-            commit_hash = self._get_commit_hash_ls_remote(ref, update_info)
+        with update_info.phase("resolve", stage="net"):
+            commit_hash = self._resolve_ref(ref, update_info)
         
         if commit_hash is None:
             fatal("Failed to get commit hash for %s (ref: %s)" % (self.url, ref))
@@ -212,32 +298,232 @@ class PackageGit(PackageURL):
             update_info.report_cache_unconfigured()
             return self._update_full_clone(update_info, pkg_dir)
         
-        # Check if this version is cached
-        if cache.has_version(self.name, commit_hash):
-            # Cache hit - symlink to deps
-            note("Cache hit for %s at %s" % (self.name, commit_hash[:12]))
-            cache.link_to_deps(self.name, commit_hash, update_info.deps_dir)
-            update_info.report_cache_hit()
-            return ProjInfo.mkFromProj(pkg_dir)
-        
-        # Cache miss - clone without history
-        note("Cache miss for %s - cloning" % self.name)
+        # Check if this version is cached. On a miss, wait for any other
+        # process fetching the same version, then check again
+        version = self._cache_version(commit_hash)
+        lock = cache.version_lock(self.name, version)
+        try:
+            if not cache.has_version(self.name, version):
+                with update_info.phase("cache-wait"):
+                    lock.acquire()
+            if cache.has_version(self.name, version):
+                # Cache hit - symlink to deps
+                note("Cache hit for %s at %s" % (self.name, commit_hash[:12]))
+                with update_info.phase("cache-link"):
+                    cache.link_to_deps(self.name, version, update_info.deps_dir)
+                update_info.report_cache_hit()
+                return ProjInfo.mkFromProj(pkg_dir)
+            return self._fetch_to_cache(update_info, cache, pkg_dir, ref, commit_hash, version)
+        finally:
+            lock.release()
+
+    def _fetch_to_cache(self, update_info: ProjectUpdateInfo, cache: Cache, pkg_dir: str,
+                        ref: str, commit_hash: str, version: str) -> ProjInfo:
+        """Fetch a version missing from the cache, store it and link it."""
+        # Cache miss - fetch the commit into the cache's mirror of the
+        # remote (a small delta if an earlier commit is already there),
+        # then check out a copy without history
+        note("Cache miss for %s - fetching" % self.name)
         update_info.report_cache_miss()
         
-        # Clone to a temporary location first
+        # Check out to a temporary location first
         temp_dir = os.path.join(update_info.deps_dir, f".cache_temp_{self.name}")
         if os.path.exists(temp_dir):
-            import shutil
             shutil.rmtree(temp_dir)
         
-        self._clone_to_dir(update_info, temp_dir, depth=1)
+        # A sparse checkout is cloned directly, so that only the selected
+        # directories are downloaded
+        want = self.commit or commit_hash
+        mirror = None
+        if not self.sparse:
+            mirror = self._fetch_to_mirror(update_info, cache, ref, want)
+        if mirror is None or not self._checkout_from_mirror(
+                update_info, mirror, want, temp_dir):
+            # Fall back to a shallow clone from the remote
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
+            self._clone_to_dir(update_info, temp_dir, depth=1)
         
         # Store in cache and link
-        cache.store_version(self.name, commit_hash, temp_dir)
-        cache.link_to_deps(self.name, commit_hash, update_info.deps_dir)
+        with update_info.phase("cache-store", stage="unpack"):
+            cache.store_version(self.name, version, temp_dir, source_url=self.url)
+        with update_info.phase("cache-link"):
+            cache.link_to_deps(self.name, version, update_info.deps_dir)
         
         return ProjInfo.mkFromProj(pkg_dir)
 
+    def _cache_version(self, commit_hash: str) -> str:
+        """Return the cache version key for 'commit_hash': the commit, plus
+        a digest of the directories of a sparse checkout."""
+        if not self.sparse:
+            return commit_hash
+        digest = hashlib.sha1("\n".join(sorted(self.sparse)).encode()).hexdigest()
+        return "%s-sparse-%s" % (commit_hash, digest[:12])
+
+    def _fetch_to_mirror(self, update_info: ProjectUpdateInfo, cache: Cache,
+                         ref: str, want: str) -> Optional[str]:
+        """Fetch 'ref' (and commit 'want') into the cache's bare mirror of
+        this package's remote. Returns the mirror path, or None if the
+        commit could not be fetched.
+
+        The mirror keeps the refs it has fetched: the next fetch
+        advertises them, so moving a branch by a commit transfers only
+        the objects that commit changed. A mirror only used for cached
+        packages is shallow; one that editable clones borrow from (see
+        _fetch_full_mirror()) keeps its full history.
+        """
+        mirror = cache.get_mirror_dir(self.url)
+        url = self._get_effective_url(update_info)
+        if ref == "HEAD":
+            refspec = "+HEAD:refs/ivpm/HEAD"
+        elif ref.startswith("refs/"):
+            refspec = "+%s:%s" % (ref, ref)
+        elif ref == self.tag:
+            refspec = "+refs/tags/%s:refs/tags/%s" % (ref, ref)
+        else:
+            refspec = "+refs/heads/%s:refs/heads/%s" % (ref, ref)
+
+        with _mirror_lock(mirror):
+            if not self._init_mirror(update_info, mirror):
+                return None
+            depth = [] if _mirror_is_complete(update_info, mirror) else ["--depth", "1"]
+            with update_info.phase("fetch", stage="net"):
+                if not self._has_commit(update_info, mirror, want):
+                    self._run_git(
+                        update_info,
+                        ["git", "fetch", "-q", "--no-tags"] + depth + [url, refspec],
+                        mirror)
+                if not self._has_commit(update_info, mirror, want):
+                    # The ref moved since it was resolved, or 'want' is a
+                    # pinned commit: ask for the commit itself
+                    self._run_git(
+                        update_info,
+                        ["git", "fetch", "-q", "--no-tags"] + depth + [url, want],
+                        mirror)
+            if not self._has_commit(update_info, mirror, want):
+                _logger.debug("Could not fetch %s into mirror %s", want, mirror)
+                return None
+        return mirror
+
+    def _fetch_full_mirror(self, update_info: ProjectUpdateInfo, cache: Cache,
+                           url: Optional[str] = None) -> Optional[str]:
+        """Bring the cache's mirror of this package's remote (or of 'url',
+        eg a submodule's) up to date with all branches and tags, with full
+        history, for editable clones to borrow objects from. Returns the
+        mirror path, or None on failure.
+
+        A shallow mirror is deepened; git cannot borrow from a shallow
+        repository. Automatic gc is turned off in a complete mirror, since
+        pruning an object a clone borrows would corrupt that clone.
+        """
+        if url is None:
+            mirror = cache.get_mirror_dir(self.url)
+            url = self._get_effective_url(update_info)
+        else:
+            mirror = cache.get_mirror_dir(url)
+        git_cmd = ["git", "fetch", "-q"]
+        if os.path.isfile(os.path.join(mirror, "shallow")):
+            git_cmd.append("--unshallow")
+        git_cmd.extend([url, "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"])
+
+        with _mirror_lock(mirror):
+            if not self._init_mirror(update_info, mirror):
+                return None
+            with update_info.phase("fetch", stage="net"):
+                status = self._run_git(update_info, git_cmd, mirror)
+            if status.returncode != 0:
+                _logger.debug("Could not update mirror %s", mirror)
+                return None
+            for key, value in (("gc.auto", "0"), ("ivpm.complete", "true")):
+                self._run_git(update_info, ["git", "config", key, value], mirror)
+        return mirror
+
+    def _fetch_commit_to_mirror(self, update_info: ProjectUpdateInfo, cache: Cache,
+                                url: str, want: str) -> Optional[str]:
+        """Fetch commit 'want' of remote 'url' into the cache's mirror of
+        that remote, unless it is already there. Returns the mirror path,
+        or None if the commit could not be fetched.
+
+        The commit is kept reachable by a ref named after it, so that
+        neither gc nor a later shallow fetch drops it.
+        """
+        mirror = cache.get_mirror_dir(url)
+        with _mirror_lock(mirror):
+            if not self._init_mirror(update_info, mirror):
+                return None
+            if not self._has_commit(update_info, mirror, want):
+                git_cmd = ["git", "-c", "protocol.version=2", "fetch", "-q", "--no-tags"]
+                if not _mirror_is_complete(update_info, mirror):
+                    git_cmd.extend(["--depth", "1"])
+                git_cmd.extend([url, "+%s:refs/ivpm/commits/%s" % (want, want)])
+                with update_info.phase("fetch", stage="net"):
+                    self._run_git(update_info, git_cmd, mirror)
+            if not self._has_commit(update_info, mirror, want):
+                _logger.debug("Could not fetch %s into mirror %s", want, mirror)
+                return None
+        return mirror
+
+    def _init_mirror(self, update_info: ProjectUpdateInfo, mirror: str) -> bool:
+        """Create an empty bare mirror repository if none exists yet."""
+        if os.path.isdir(mirror):
+            return True
+        os.makedirs(os.path.dirname(mirror), exist_ok=True)
+        staging = "%s.%d.tmp" % (mirror, os.getpid())
+        status = self._run_git(
+            update_info, ["git", "init", "-q", "--bare", staging],
+            os.path.dirname(mirror))
+        if status.returncode != 0:
+            return False
+        try:
+            os.rename(staging, mirror)
+        except OSError:
+            # Another process created it first
+            shutil.rmtree(staging, ignore_errors=True)
+        return True
+
+    def _checkout_from_mirror(self, update_info: ProjectUpdateInfo, mirror: str,
+                              want: str, target_dir: str) -> bool:
+        """Create a shallow repository of commit 'want' in 'target_dir' from
+        a local mirror, set up as a shallow clone of the remote would be.
+        Returns False if any step failed."""
+        url = self._get_effective_url(update_info)
+        cmds = [
+            ["git", "init", "-q", target_dir],
+            ["git", "-c", "protocol.version=2", "fetch", "-q", "--no-tags",
+             "--depth", "1", "file://" + mirror, want],
+        ]
+        if self.branch is not None:
+            cmds.extend([
+                ["git", "checkout", "-q", "-b", self.branch, want],
+                ["git", "remote", "add", "-t", self.branch, "origin", url],
+                ["git", "update-ref", "refs/remotes/origin/" + self.branch, want],
+                ["git", "branch", "-q", "--set-upstream-to=origin/" + self.branch],
+            ])
+        else:
+            cmds.extend([
+                ["git", "checkout", "-q", "--detach", want],
+                ["git", "remote", "add", "origin", url],
+            ])
+
+        os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+        with update_info.phase("checkout"):
+            for i, git_cmd in enumerate(cmds):
+                cwd = os.path.dirname(target_dir) if i == 0 else target_dir
+                status = self._run_git(update_info, git_cmd, cwd)
+                if status.returncode != 0:
+                    _logger.debug("Git command %s failed", str(git_cmd))
+                    return False
+
+        self._update_submodules(update_info, target_dir)
+        return True
+
+    @staticmethod
+    def _has_commit(update_info: ProjectUpdateInfo, repo: str, commit: str) -> bool:
+        result = update_info.run_subprocess(
+            ["git", "cat-file", "-e", commit + "^{commit}"],
+            cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return result.returncode == 0
+
     def _update_no_cache(self, update_info: ProjectUpdateInfo, pkg_dir: str) -> ProjInfo:
         """Editable clone without shared cache (cache=False). Depth controlled by self.depth."""
         note("loading package %s (no cache, editable)" % self.name)
@@ -248,10 +534,25 @@ class PackageGit(PackageURL):
         return ProjInfo.mkFromProj(pkg_dir)
 
     def _update_full_clone(self, update_info: ProjectUpdateInfo, pkg_dir: str) -> ProjInfo:
-        """Full clone with history (cache unspecified)."""
+        """Full clone with history (cache unspecified).
+
+        With a cache configured, the clone borrows objects from the
+        cache's full mirror of the remote, so repeat workspaces download
+        little more than refs. The clone stays an ordinary, writable
+        repository. Partial and sparse clones do not use the mirror,
+        which would hold the full repository.
+        """
         note("loading package %s" % self.name)
         
-        self._clone_to_dir(update_info, pkg_dir, depth=self.depth)
+        reference = None
+        cache = update_info.cache if update_info.cache is not None else Cache()
+        if self.depth is None and self.filter is None and not self.sparse \
+                and self.cache is None and cache.is_enabled():
+            reference = self._fetch_full_mirror(update_info, cache)
+        self._clone_to_dir(update_info, pkg_dir, depth=self.depth, reference=reference)
+        if reference is not None and not getattr(update_info.args, "dissociate", False):
+            # So that 'ivpm cache gc' keeps the mirror the clone borrows from
+            cache.register_workspace(update_info.deps_dir)
         self._capture_resolved_commit(pkg_dir)
         
         return ProjInfo.mkFromProj(pkg_dir)
@@ -260,15 +561,7 @@ class PackageGit(PackageURL):
         """Read the HEAD commit hash from a cloned repo and store in resolved_commit."""
         if self.resolved_commit is not None:
             return  # already set (e.g. by cache path)
-        try:
-            result = subprocess.run(
-                ["git", "rev-parse", "HEAD"],
-                capture_output=True, text=True, cwd=pkg_dir, timeout=10
-            )
-            if result.returncode == 0:
-                self.resolved_commit = result.stdout.strip()
-        except Exception:
-            pass
+        self.resolved_commit = head_commit(pkg_dir)
 
 
     def _get_effective_url(self, update_info: ProjectUpdateInfo = None) -> str:
@@ -300,26 +593,58 @@ class PackageGit(PackageURL):
         url = self.url[delim_idx+3:]
         first_sl_idx = url.find("/")
         return "git@" + url[:first_sl_idx] + ":" + url[first_sl_idx+1:]
-    def _clone_to_dir(self, update_info: ProjectUpdateInfo, target_dir: str, depth=None):
-        """Clone the repo to the specified directory."""
-        cwd = os.getcwd()
+    def _clone_to_dir(self, update_info: ProjectUpdateInfo, target_dir: str, depth=None,
+                      reference: Optional[str] = None):
+        """Clone the repo to the specified directory.
+
+        If 'reference' names a local repository, objects it holds are
+        borrowed rather than downloaded (``--reference-if-able``), and
+        copied into the clone with ``ivpm update --dissociate``.
+
+        Clones run concurrently in worker threads, so every git command
+        is given an explicit ``cwd`` rather than changing the
+        process-wide working directory.
+        """
         parent_dir = os.path.dirname(target_dir)
         target_name = os.path.basename(target_dir)
         
         if not os.path.isdir(parent_dir):
-            os.makedirs(parent_dir)
+            os.makedirs(parent_dir, exist_ok=True)
         
-        os.chdir(parent_dir)
         sys.stdout.flush()
 
+        # A pinned commit is fetched by itself, when the server allows
+        if self.commit is not None and _FULL_SHA_RE.fullmatch(self.commit):
+            if self._fetch_commit_to_dir(update_info, target_dir, depth, reference):
+                self._update_submodules(update_info, target_dir)
+                return
+            _logger.debug("Fetching %s by hash failed; cloning instead", self.commit)
+            if os.path.exists(target_dir):
+                shutil.rmtree(target_dir)
+
         git_cmd = ["git", "clone"]
     
         if depth is not None:
             git_cmd.extend(["--depth", str(depth)])
 
+        if self.cache is True:
+            # Read-only clones need neither tags nor other branches
+            git_cmd.extend(["--no-tags", "--single-branch"])
+
         if self.branch is not None:
             git_cmd.extend(["-b", str(self.branch)])
 
+        if self.filter is not None:
+            git_cmd.append("--filter=" + self.filter)
+
+        if self.sparse:
+            git_cmd.append("--sparse")
+
+        if reference is not None:
+            git_cmd.extend(["--reference-if-able", reference])
+            if getattr(update_info.args, "dissociate", False):
+                git_cmd.append("--dissociate")
+
         url = self._get_effective_url(update_info)
         _logger.debug("Clone URL: %s", url)
         git_cmd.append(url)
@@ -327,61 +652,209 @@ class PackageGit(PackageURL):
         # Clone to the target directory name
         git_cmd.append(target_name)
         
-        _logger.debug("git_cmd: %s", str(git_cmd))
-        
-        # Suppress output when in Rich TUI mode
-        if update_info.suppress_output:
-            status = subprocess.run(git_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        else:
-            status = subprocess.run(git_cmd)
-        os.chdir(cwd)
+        with update_info.phase("clone", stage="net"):
+            status = self._run_git(update_info, git_cmd, parent_dir)
     
         if status.returncode != 0:
             fatal("Git command \"%s\" failed" % str(git_cmd))
 
+        # With a partial clone, this also fetches the selected contents
+        if self.sparse:
+            git_cmd = ["git", "sparse-checkout", "set", "--cone"] + list(self.sparse)
+            with update_info.phase("checkout", stage="net"):
+                status = self._run_git(update_info, git_cmd, target_dir)
+
+            if status.returncode != 0:
+                fatal("Git command \"%s\" failed" % str(git_cmd))
+
         # Checkout a specific commit            
         if self.commit is not None:
-            os.chdir(target_dir)
             git_cmd = ["git", "reset", "--hard", self.commit]
-            _logger.debug("git_cmd: %s", str(git_cmd))
-            if update_info.suppress_output:
-                status = subprocess.run(git_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            else:
-                status = subprocess.run(git_cmd)
+            with update_info.phase("checkout"):
+                status = self._run_git(update_info, git_cmd, target_dir)
         
             if status.returncode != 0:
                 fatal("Git command \"%s\" failed" % str(git_cmd))
-            os.chdir(cwd)
-        
     
-        # TODO: Existence of .gitmodules should trigger this
-        if os.path.isfile(os.path.join(target_dir, ".gitmodules")):
-            os.chdir(target_dir)
-            sys.stdout.flush()
-            git_cmd = ["git", "submodule", "update", "--init", "--recursive"]
-            _logger.debug("git_cmd: %s", str(git_cmd))
-            if update_info.suppress_output:
-                status = subprocess.run(git_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            else:
-                status = subprocess.run(git_cmd)
-            os.chdir(cwd)
+        self._update_submodules(update_info, target_dir)
+
+    def _fetch_commit_to_dir(self, update_info: ProjectUpdateInfo, target_dir: str,
+                             depth=None, reference: Optional[str] = None) -> bool:
+        """Create a repository in 'target_dir' holding the pinned commit,
+        fetched by hash rather than by cloning a branch and resetting.
+
+        Read-only (cache mode) packages get just the commit; editable ones
+        its history, but no other branches or tags. Returns False if the
+        fetch failed, eg because the server does not serve commits that
+        are not branch or tag tips.
+        """
+        url = self._get_effective_url(update_info)
+        if depth is None and self.cache is True:
+            depth = 1
+
+        # Protocol v2 servers accept any commit 'want'
+        fetch_cmd = ["git", "-c", "protocol.version=2", "fetch", "-q", "--no-tags"]
+        if depth is not None:
+            fetch_cmd.extend(["--depth", str(depth)])
+        fetch_cmd.extend(["origin", self.commit])
+
+        setup = [["git", "remote", "add", "origin", url]]
+        if self.filter is not None:
+            setup.extend([
+                ["git", "config", "remote.origin.promisor", "true"],
+                ["git", "config", "remote.origin.partialclonefilter", self.filter],
+            ])
+        if self.sparse:
+            setup.append(["git", "sparse-checkout", "set", "--cone"] + list(self.sparse))
+
+        if self.branch is not None:
+            checkout = [
+                ["git", "checkout", "-q", "-b", self.branch, self.commit],
+                ["git", "config", "branch.%s.remote" % self.branch, "origin"],
+                ["git", "config", "branch.%s.merge" % self.branch,
+                 "refs/heads/" + self.branch],
+            ]
+        else:
+            checkout = [["git", "checkout", "-q", "--detach", self.commit]]
+
+        parent_dir = os.path.dirname(target_dir)
+        status = self._run_git(update_info, ["git", "init", "-q", target_dir], parent_dir)
+        if status.returncode != 0:
+            return False
+        for git_cmd in setup:
+            if self._run_git(update_info, git_cmd, target_dir).returncode != 0:
+                return False
+        alternates = os.path.join(target_dir, ".git", "objects", "info", "alternates")
+        if reference is not None:
+            # What 'git clone --reference' sets up
+            os.makedirs(os.path.dirname(alternates), exist_ok=True)
+            with open(alternates, "w") as fp:
+                fp.write(os.path.join(reference, "objects") + "\n")
+
+        with update_info.phase("clone", stage="net"):
+            status = self._run_git(update_info, fetch_cmd, target_dir)
+        if status.returncode != 0:
+            return False
+
+        with update_info.phase("checkout"):
+            for git_cmd in checkout:
+                status = self._run_git(update_info, git_cmd, target_dir)
+                if status.returncode != 0:
+                    fatal("Git command \"%s\" failed" % str(git_cmd))
+
+        if reference is not None and getattr(update_info.args, "dissociate", False):
+            status = self._run_git(
+                update_info, ["git", "repack", "-a", "-d", "-q"], target_dir)
+            if status.returncode != 0:
+                fatal("Failed to copy borrowed objects into %s" % target_dir)
+            os.unlink(alternates)
+        return True
+
+    def _update_submodules(self, update_info: ProjectUpdateInfo, target_dir: str):
+        """Check out the submodules of the repository in 'target_dir', and
+        theirs in turn, several at a time within the network job budget.
+
+        Unless the package opts out of the cache (cache: false), each
+        submodule's recorded commit is first fetched into the cache
+        mirror of its remote, and git clones the submodule from there.
+        A commit already in a mirror is not fetched again, so workspaces
+        sharing submodules download each of them once.
+        """
+        if not os.path.isfile(os.path.join(target_dir, ".gitmodules")):
+            return
+        sys.stdout.flush()
+
+        # Records the submodule URLs, with relative ones resolved
+        self._run_git(update_info, ["git", "submodule", "--quiet", "init"], target_dir)
+        submodules = self._list_submodules(update_info, target_dir)
+        jobs = update_info.stage_jobs("net")
+
+        git_cmd = ["git", "-c", "protocol.version=2"]
+        depth = []
+        cache = update_info.cache if update_info.cache is not None else Cache()
+        if len(submodules) > 0 and self.cache is not False and cache.is_enabled():
+            def fetch(submodule):
+                _, url, commit = submodule
+                mirror = cache.get_mirror_dir(url)
+                # Editable clones get the submodules' full history
+                if self.cache is None and not (
+                        _mirror_is_complete(update_info, mirror)
+                        and self._has_commit(update_info, mirror, commit)) \
+                        and self._fetch_full_mirror(update_info, cache, url) is None:
+                    return None
+                return self._fetch_commit_to_mirror(update_info, cache, url, commit)
+
+            # git only clones submodules from local paths when allowed
+            # to. That is allowed for the mirrors, unless the repository
+            # itself names a local submodule.
+            if not any(_is_local_url(url) for _, url, _ in submodules):
+                with update_info.phase("submodules"):
+                    with ThreadPoolExecutor(max_workers=min(jobs, len(submodules))) as pool:
+                        mirrors = list(pool.map(update_info.bind_package(fetch), submodules))
+                rewrites = ["url.%s.insteadOf=%s" % (mirror, url)
+                            for (_, url, _), mirror in zip(submodules, mirrors)
+                            if mirror is not None]
+                if len(rewrites) > 0:
+                    git_cmd.extend(["-c", "protocol.file.allow=always"])
+                    for rewrite in rewrites:
+                        git_cmd.extend(["-c", rewrite])
+                # Mirrors of read-only packages hold just the commits
+                if self.cache is not None and len(rewrites) == len(submodules):
+                    depth = ["--depth", "1"]
+
+        git_cmd.extend(["submodule", "update", "--init", "--jobs", str(jobs)] + depth)
+        with update_info.phase("submodules", stage="net"):
+            self._run_git(update_info, git_cmd, target_dir)
+
+        for path, _, _ in submodules:
+            self._update_submodules(update_info, os.path.join(target_dir, path))
+
+    @staticmethod
+    def _list_submodules(update_info: ProjectUpdateInfo,
+                         repo_dir: str) -> List[Tuple[str, str, str]]:
+        """Return (path, url, commit) for each initialized submodule of
+        the repository in 'repo_dir'."""
+        def git(*args):
+            return update_info.run_subprocess(
+                ["git"] + list(args), cwd=repo_dir,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.splitlines()
+
+        submodules = []
+        for line in git("config", "-f", ".gitmodules", "--get-regexp", r"^submodule\..*\.path$"):
+            key, _, path = line.partition(" ")
+            name = key[len("submodule."):-len(".path")]
+            url = git("config", "--get", "submodule.%s.url" % name)
+            entry = git("ls-tree", "HEAD", "--", path)
+            if len(url) == 0 or len(entry) == 0:
+                continue
+            # "<mode> commit <sha>\t<path>"
+            mode, kind, commit = entry[0].split("\t")[0].split()
+            if kind == "commit":
+                submodules.append((path, url[0], commit))
+        return submodules
+
+    def _run_git(self, update_info: ProjectUpdateInfo, git_cmd, cwd: str):
+        """Run a git command in ``cwd``, honoring the TUI's output suppression.
+
+        The command is terminated if the update is cancelled while it runs.
+        """
+        _logger.debug("git_cmd: %s (cwd=%s)", str(git_cmd), cwd)
+        # Suppress output when in Rich TUI mode
+        if update_info.suppress_output:
+            return update_info.run_subprocess(
+                git_cmd, cwd=cwd,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            return update_info.run_subprocess(git_cmd, cwd=cwd)
 
     def _make_readonly(self, path: str):
         """Make all files in a directory tree read-only."""
-        import stat
-        for root, dirs, files in os.walk(path):
-            for d in dirs:
-                dir_path = os.path.join(root, d)
-                mode = os.stat(dir_path).st_mode
-                os.chmod(dir_path, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
-            for f in files:
-                file_path = os.path.join(root, f)
-                mode = os.stat(file_path).st_mode
-                os.chmod(file_path, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
-        mode = os.stat(path).st_mode
-        os.chmod(path, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
+        make_tree_readonly(path)
     
     def status(self, status_info: ProjectStatusInfo):
+        return run_sync(self.status_async(status_info))
+
+    async def status_async(self, status_info: ProjectStatusInfo):
         from ..pkg_status import PkgVcsStatus
 
         pkg_dir = os.path.join(status_info.deps_dir, self.name)
@@ -396,60 +869,72 @@ class PackageGit(PackageURL):
                 error="directory not found or not a git repo",
             )
 
-        def _git(args):
-            r = subprocess.run(
-                ["git"] + args,
-                capture_output=True, text=True, cwd=pkg_dir, timeout=10
+        async def _git(args):
+            rc, out, _ = await SubprocessRunner.run_async(
+                ["git"] + args, cwd=pkg_dir, timeout=10)
+            return rc, out
+
+        async def _head():
+            # The commit as git abbreviates it, and the refs at it, which
+            # git reads once for the repository
+            rc, out = await _git(["-c", "log.showSignature=false", "log", "-1",
+                                  "--decorate=short", "--format=%h%x09%D", "HEAD"])
+            if rc != 0:
+                return "", None
+            commit, _, refs = out.strip().partition("\t")
+            tags = [r[len("tag: "):] for r in refs.split(", ") if r.startswith("tag: ")]
+            if len(tags) > 1:
+                tags = [await _describe_tag()]
+            return commit, (tags[0] if len(tags) > 0 else None)
+
+        async def _describe_tag():
+            # Of several tags at HEAD, the one 'git describe --tags' names:
+            # annotated over lightweight, then the newest annotated one,
+            # then the first by name
+            rc, out = await _git(["for-each-ref", "--points-at", "HEAD",
+                                  "--format=%(objecttype)%09%(taggerdate:unix)%09%(refname:strip=2)",
+                                  "refs/tags"])
+            best = best_key = None
+            for line in out.splitlines() if rc == 0 else []:
+                kind, date, name = line.split("\t", 2)
+                key = (kind == "tag", int(date) if kind == "tag" and date else 0)
+                if best_key is None or key > best_key:
+                    best, best_key = name, key
+            return best
+
+        # Branch, upstream, ahead/behind and changes in one call; the
+        # commit and tag at HEAD alongside it
+        (rc, out), (commit, tag) = await asyncio.gather(
+            _git(["status", "--porcelain=v2", "--branch"]), _head())
+        if rc != 0:
+            return PkgVcsStatus(
+                name=self.name,
+                src_type="git",
+                path=pkg_dir,
+                vcs="git",
+                error="git status failed",
             )
-            return r.returncode, r.stdout.strip()
-
-        # Branch
-        _, branch_raw = _git(["rev-parse", "--abbrev-ref", "HEAD"])
-        branch = None if branch_raw == "HEAD" else branch_raw
-
-        # Tag (only when exactly on a tag)
-        rc_tag, tag_raw = _git(["describe", "--tags", "--exact-match", "HEAD"])
-        tag = tag_raw if rc_tag == 0 else None
-
-        # Short commit hash
-        _, commit = _git(["rev-parse", "--short", "HEAD"])
-
-        # Dirty / modified files
-        _, porcelain = _git(["status", "--porcelain"])
-        all_lines = [line for line in porcelain.splitlines() if line.strip()]
-        untracked = [line for line in all_lines if line.startswith("??")]
-        modified = [line for line in all_lines if not line.startswith("??")]
-        is_dirty = len(modified) > 0
-
-        # Ahead / behind upstream (silenced if no upstream)
-        ahead: Optional[int] = None
-        behind: Optional[int] = None
-        rc_ab, ab_raw = _git(["rev-list", "--left-right", "--count", "@{u}...HEAD"])
-        if rc_ab == 0 and ab_raw:
-            parts = ab_raw.split()
-            if len(parts) == 2:
-                try:
-                    behind = int(parts[0])
-                    ahead = int(parts[1])
-                except ValueError:
-                    pass
+        st = _parse_status_v2(out)
 
         return PkgVcsStatus(
             name=self.name,
             src_type="git",
             path=pkg_dir,
             vcs="git",
-            branch=branch,
+            branch=st["branch"],
             tag=tag,
             commit=commit,
-            is_dirty=is_dirty,
-            modified=modified,
-            untracked=untracked,
-            ahead=ahead,
-            behind=behind,
+            is_dirty=len(st["modified"]) > 0,
+            modified=st["modified"],
+            untracked=st["untracked"],
+            ahead=st["ahead"],
+            behind=st["behind"],
         )
     
     def sync(self, sync_info: ProjectSyncInfo):
+        return run_sync(self.sync_async(sync_info))
+
+    async def sync_async(self, sync_info: ProjectSyncInfo):
         from ..pkg_sync import PkgSyncResult, SyncOutcome
         import stat as _stat
 
@@ -485,15 +970,13 @@ class PackageGit(PackageURL):
                 error="not a git repository",
             )
 
-        def _git(*args):
-            r = subprocess.run(
-                ["git"] + list(args),
-                capture_output=True, text=True, cwd=pkg_dir, timeout=60,
-            )
-            return r.returncode, r.stdout.strip(), r.stderr.strip()
+        async def _git(*args):
+            rc, out, err = await SubprocessRunner.run_async(
+                ["git"] + list(args), cwd=pkg_dir, timeout=60)
+            return rc, out.strip(), err.strip()
 
         # Current branch (detached HEAD → skip).
-        rc, branch, _ = _git("rev-parse", "--abbrev-ref", "HEAD")
+        rc, branch, _ = await _git("rev-parse", "--abbrev-ref", "HEAD")
         if rc != 0:
             return PkgSyncResult(
                 name=self.name, src_type="git", path=pkg_dir,
@@ -505,14 +988,18 @@ class PackageGit(PackageURL):
                 outcome=SyncOutcome.SKIPPED, skipped_reason="detached HEAD",
             )
 
-        _, old_commit, _ = _git("rev-parse", "--short", "HEAD")
+        _, old_commit, _ = await _git("rev-parse", "--short", "HEAD")
 
         # Detect dirty working tree.
-        _, porcelain, _ = _git("status", "--porcelain")
+        _, porcelain, _ = await _git("status", "--porcelain")
         dirty_files = [ln for ln in porcelain.splitlines() if ln.strip()]
 
-        # Fetch from origin (safe in both real and dry-run modes).
-        rc, _, err = _git("fetch", "origin")
+        # Fetch from origin (safe in both real and dry-run modes), unless
+        # the branch has not moved there since the last fetch.
+        if await self._upstream_moved(sync_info, pkg_dir, branch):
+            rc, _, err = await _git("fetch", "origin")
+        else:
+            rc = 0
         if rc != 0:
             return PkgSyncResult(
                 name=self.name, src_type="git", path=pkg_dir,
@@ -522,7 +1009,7 @@ class PackageGit(PackageURL):
             )
 
         # Ahead / behind upstream.
-        rc, ab_raw, _ = _git("rev-list", "--left-right", "--count",
+        rc, ab_raw, _ = await _git("rev-list", "--left-right", "--count",
                               "@{u}...HEAD")
         behind = ahead = 0
         if rc == 0 and ab_raw:
@@ -569,7 +1056,7 @@ class PackageGit(PackageURL):
                     commits_behind=behind, commits_ahead=ahead,
                 )
             # Check whether a fast-forward is possible.
-            rc_ff, _, _ = _git("merge-base", "--is-ancestor",
+            rc_ff, _, _ = await _git("merge-base", "--is-ancestor",
                                "HEAD", "origin/%s" % branch)
             if rc_ff == 0:
                 if dirty_files:
@@ -592,15 +1079,15 @@ class PackageGit(PackageURL):
             )
 
         # Real merge.
-        rc, _, _ = _git("merge", "origin/%s" % branch)
+        rc, _, _ = await _git("merge", "origin/%s" % branch)
         if rc != 0:
             # Collect unmerged files from index before aborting.
-            _, st_out, _ = _git("status", "--porcelain")
+            _, st_out, _ = await _git("status", "--porcelain")
             conflict_files = [
                 ln[3:] for ln in st_out.splitlines()
                 if ln[:2] in ("UU", "AA", "DD", "AU", "UA", "DU", "UD")
             ]
-            _git("merge", "--abort")
+            await _git("merge", "--abort")
             return PkgSyncResult(
                 name=self.name, src_type="git", path=pkg_dir,
                 outcome=SyncOutcome.CONFLICT,
@@ -613,11 +1100,11 @@ class PackageGit(PackageURL):
                 ],
             )
 
-        _, new_commit, _ = _git("rev-parse", "--short", "HEAD")
+        _, new_commit, _ = await _git("rev-parse", "--short", "HEAD")
 
         # Update submodules if the project uses them.
         if os.path.isfile(os.path.join(pkg_dir, ".gitmodules")):
-            _git("submodule", "update", "--init", "--recursive")
+            await _git("submodule", "update", "--init", "--recursive")
 
         return PkgSyncResult(
             name=self.name, src_type="git", path=pkg_dir,
@@ -626,6 +1113,28 @@ class PackageGit(PackageURL):
             commits_behind=behind,
         )
     
+    async def _upstream_moved(self, sync_info: ProjectSyncInfo, pkg_dir: str, branch: str) -> bool:
+        """Return False if origin's 'branch' is still at the commit last
+        fetched into refs/remotes/origin/<branch>, True if it moved or
+        that cannot be told.
+
+        The remote's branch tips come from the sync's shared resolver, so
+        packages cloned from one remote cost a single ls-remote between
+        them rather than a fetch each.
+        """
+        tracking = read_ref(pkg_dir, "refs/remotes/origin/" + branch)
+        if tracking is None:
+            return True
+        rc, url, _ = await SubprocessRunner.run_async(
+            ["git", "remote", "get-url", "origin"], cwd=pkg_dir, timeout=10)
+        if rc != 0 or not url.strip():
+            return True
+        tip = await asyncio.get_event_loop().run_in_executor(
+            None, sync_info.ref_resolver.resolve, url.strip(), "refs/heads/" + branch)
+        _logger.debug("%s: origin/%s is %s, last fetched %s",
+                      self.name, branch, tip, tracking)
+        return tip is None or tip != tracking
+
     def process_options(self, opts, si):
         super().process_options(opts, si)
         self.src_type = "git"
@@ -635,6 +1144,18 @@ class PackageGit(PackageURL):
                 
         if "depth" in opts.keys():
             self.depth = opts["depth"]
+
+        if "filter" in opts.keys():
+            if opts["filter"] not in _CLONE_FILTERS:
+                fatal("Unknown git filter '%s' for package %s (expected one of: %s)" % (
+                    opts["filter"], self.name, ", ".join(_CLONE_FILTERS)))
+            self.filter = opts["filter"]
+
+        if "sparse" in opts.keys():
+            sparse = opts["sparse"]
+            if isinstance(sparse, str):
+                sparse = [sparse]
+            self.sparse = [str(p).strip("/") for p in sparse]
                 
         if "dep-set" in opts.keys():
             self.dep_set = opts["dep-set"]
@@ -649,6 +1170,21 @@ class PackageGit(PackageURL):
             self.tag = opts["tag"]
 
 
+    def matches_lock_entry(self, lock_entry):
+        """deps-source hook: a parent checkout can only stand in for this
+        package if it contains every directory this package checks out.
+        Returns False if it does not, else None for the usual commit
+        comparison."""
+        have = lock_entry.get("sparse")
+        if have is None:
+            return None
+        if not self.sparse:
+            return False
+        for path in self.sparse:
+            if not any(path == p or path.startswith(p + "/") for p in have):
+                return False
+        return None
+
     @staticmethod
     def create(name, opts, si) -> 'PackageGit':
         pkg = PackageGit(name)
@@ -662,16 +1198,10 @@ class PackageGit(PackageURL):
         real_dir = os.path.realpath(pkg_dir) if os.path.exists(pkg_dir) else pkg_dir
         if not os.path.isdir(real_dir):
             return {}
-        try:
-            r = subprocess.run(
-                ["git", "rev-parse", "HEAD"],
-                cwd=real_dir, capture_output=True, text=True, timeout=5,
-            )
-            if r.returncode == 0:
-                return {"commit_resolved": r.stdout.strip()}
-        except Exception:
-            pass
-        return {}
+        commit = head_commit(real_dir, timeout=5)
+        if commit is None:
+            return {}
+        return {"commit_resolved": commit}
 
     @classmethod
     def source_info(cls):
@@ -685,6 +1215,8 @@ class PackageGit(PackageURL):
                 ParamInfo("tag", "Tag to pin to; disables sync for this package"),
                 ParamInfo("commit", "Specific commit SHA to check out"),
                 ParamInfo("depth", "Shallow-clone depth (integer)", type_hint="int"),
+                ParamInfo("filter", "Partial-clone filter: blob:none (file contents fetched on demand) or tree:0"),
+                ParamInfo("sparse", "List of directories to check out (cone-mode sparse checkout)"),
                 ParamInfo("cache", "Cache mode: true=shared cache+symlink, false=shallow read-only clone, omit=full editable clone", type_hint="bool"),
                 ParamInfo("anonymous", "Clone via HTTPS instead of SSH (overrides global --anonymous-git)", type_hint="bool"),
             ],
@@ -20,18 +20,24 @@
 #*
 #****************************************************************************
 import os
-import httpx
 import sys
 import urllib
 import dataclasses as dc
 from .package_file import PackageFile
 from ..project_ops_info import ProjectUpdateInfo
-from ..utils import note
+from ..utils import make_tree_readonly, note
 from ..package import SourceType2Ext
 from ..cache import Cache
+from ..http_client import client_for
 
 class PackageHttp(PackageFile):
 
+    @staticmethod
+    def last_modified_version(last_modified: str) -> str:
+        """Return the cache version key for a Last-Modified header value."""
+        # Replace characters unsafe in a directory name
+        return last_modified.replace(" ", "_").replace(":", "-").replace(",", "")
+
     def update(self, update_info : ProjectUpdateInfo):
         pkg_dir = os.path.join(update_info.deps_dir, self.name)
         self.path = pkg_dir.replace("\\", "/")
@@ -48,7 +54,8 @@ class PackageHttp(PackageFile):
             # Try deps-source: probe URL to populate resolved_etag/last_modified
             # so the matcher has identity to compare against.
             if update_info.deps_source is not None:
-                self._get_url_version(self.url)
+                with update_info.phase("resolve", stage="net"):
+                    self._get_url_version(self.url, update_info)
                 if update_info.try_deps_source(self):
                     note("deps-source hit for %s" % self.name)
                     return
@@ -61,7 +68,7 @@ class PackageHttp(PackageFile):
             else:
                 return self._update_normal(update_info, pkg_dir)
     
-    def _get_url_version(self, url: str) -> str:
+    def _get_url_version(self, url: str, update_info: ProjectUpdateInfo = None) -> str:
         """Get version identifier for a URL using HEAD request.
         
         Uses Last-Modified header or ETag as version identifier.
@@ -70,15 +77,14 @@ class PackageHttp(PackageFile):
         self.resolved_etag = None
         self.resolved_last_modified = None
         try:
-            response = httpx.head(url, follow_redirects=True, timeout=30)
+            response = client_for(update_info).head(url, follow_redirects=True, timeout=30)
             
             # Prefer Last-Modified as it's more human-readable
             if "Last-Modified" in response.headers:
                 # Convert to a safe directory name
                 lm = response.headers["Last-Modified"]
                 self.resolved_last_modified = lm
-                # Replace problematic characters
-                return lm.replace(" ", "_").replace(":", "-").replace(",", "")
+                return self.last_modified_version(lm)
             
             # Fall back to ETag
             if "ETag" in response.headers:
@@ -106,7 +112,8 @@ class PackageHttp(PackageFile):
         note("loading package %s with cache" % self.name)
         
         # Get version from URL metadata
-        version = self._get_url_version(self.url)
+        with update_info.phase("resolve", stage="net"):
+            version = self._get_url_version(self.url, update_info)
         
         cache = update_info.cache
         if cache is None:
@@ -117,13 +124,25 @@ class PackageHttp(PackageFile):
             update_info.report_cache_unconfigured()
             return self._update_no_cache_readonly(update_info, pkg_dir)
         
-        # Check if this version is cached
-        if cache.has_version(self.name, version):
-            note("Cache hit for %s at version %s" % (self.name, version))
-            cache.link_to_deps(self.name, version, update_info.deps_dir)
-            update_info.report_cache_hit()
-            return
-        
+        # Check if this version is cached. On a miss, wait for any other
+        # process downloading the same version, then check again
+        lock = cache.version_lock(self.name, version)
+        try:
+            if not cache.has_version(self.name, version):
+                with update_info.phase("cache-wait"):
+                    lock.acquire()
+            if cache.has_version(self.name, version):
+                note("Cache hit for %s at version %s" % (self.name, version))
+                with update_info.phase("cache-link"):
+                    cache.link_to_deps(self.name, version, update_info.deps_dir)
+                update_info.report_cache_hit()
+                return
+            self._fetch_to_cache(update_info, cache, version)
+        finally:
+            lock.release()
+
+    def _fetch_to_cache(self, update_info: ProjectUpdateInfo, cache: Cache, version: str):
+        """Download a version missing from the cache, store it and link it."""
         # Cache miss - download and unpack
         note("Cache miss for %s - downloading" % self.name)
         update_info.report_cache_miss()
@@ -142,26 +161,30 @@ class PackageHttp(PackageFile):
         else:
             pkg_path = temp_dir
         
-        self._download_file(self.url, pkg_path)
+        with update_info.phase("download", stage="net"):
+            self._download_file(self.url, pkg_path, update_info)
         
         if self.unpack:
-            self._install(pkg_path, temp_dir)
-            os.unlink(pkg_path)
+            with update_info.phase("unpack", stage="unpack"):
+                self._install(pkg_path, temp_dir)
+                os.unlink(pkg_path)
         
         # Store in cache and link
-        cache.store_version(self.name, version, temp_dir)
-        cache.link_to_deps(self.name, version, update_info.deps_dir)
+        with update_info.phase("cache-store", stage="unpack"):
+            cache.store_version(self.name, version, temp_dir, source_url=self.url)
+        with update_info.phase("cache-link"):
+            cache.link_to_deps(self.name, version, update_info.deps_dir)
     
     def _update_no_cache_readonly(self, update_info: ProjectUpdateInfo, pkg_dir: str):
         """Download and make read-only (cache=False)."""
         note("loading package %s (no cache, read-only)" % self.name)
         
-        self._update_normal(update_info, pkg_dir)
-        
-        # Make read-only
-        self._make_readonly(pkg_dir)
+        # Archives are unpacked read-only; only directories remain
+        self._update_normal(update_info, pkg_dir, readonly=True)
+        self._make_readonly(pkg_dir, files=not self.unpack)
     
-    def _update_normal(self, update_info: ProjectUpdateInfo, pkg_dir: str):
+    def _update_normal(self, update_info: ProjectUpdateInfo, pkg_dir: str,
+                       readonly: bool = False):
         """Normal download without caching."""
         # Need to fetch, then unpack these
         download_dir = os.path.join(update_info.deps_dir, ".download")
@@ -177,37 +200,42 @@ class PackageHttp(PackageFile):
         # TODO: should this be an option?   
         remove_pkg_src = True
 
-        self._download_file(self.url, pkg_path)
+        with update_info.phase("download", stage="net"):
+            self._download_file(self.url, pkg_path, update_info)
 
         if self.unpack:
-            self._install(pkg_path, pkg_dir)
+            with update_info.phase("unpack", stage="unpack"):
+                self._install(pkg_path, pkg_dir, readonly)
             os.unlink(os.path.join(download_dir, 
                                    os.path.basename(self.url)))
         else:
             # 
             pass
     
-    def _make_readonly(self, path: str):
-        """Make all files in a directory tree read-only."""
-        import stat
-        for root, dirs, files in os.walk(path):
-            for d in dirs:
-                dir_path = os.path.join(root, d)
-                mode = os.stat(dir_path).st_mode
-                os.chmod(dir_path, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
-            for f in files:
-                file_path = os.path.join(root, f)
-                mode = os.stat(file_path).st_mode
-                os.chmod(file_path, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
-        mode = os.stat(path).st_mode
-        os.chmod(path, mode & ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH)
-
-    def _download_file(self, url, dest):
-        r = httpx.get(url, follow_redirects=True)
-        if r.status_code < 200 or r.status_code >= 300:
-            raise Exception("Failed to download %s: HTTP %d" % (url, r.status_code))
-        with open(dest, "wb") as f:
-            f.write(r.content)
+    def _make_readonly(self, path: str, files: bool = True):
+        """Make a directory tree (or a single file) read-only."""
+        make_tree_readonly(path, files=files)
+
+    def _download_file(self, url, dest, update_info: ProjectUpdateInfo = None):
+        """Download 'url' to 'dest', streaming to disk.
+
+        If 'update_info' is given, the download uses the update's pooled
+        HTTP client and stops when the update is cancelled. A partial file
+        is removed on failure.
+        """
+        try:
+            with client_for(update_info).stream("GET", url, follow_redirects=True) as r:
+                if r.status_code < 200 or r.status_code >= 300:
+                    raise Exception("Failed to download %s: HTTP %d" % (url, r.status_code))
+                with open(dest, "wb") as f:
+                    for chunk in r.iter_bytes():
+                        if update_info is not None:
+                            update_info.check_cancelled()
+                        f.write(chunk)
+        except BaseException:
+            if os.path.isfile(dest):
+                os.unlink(dest)
+            raise
             
     @staticmethod
     def create(name, opts, si) -> 'PackageHttp':
@@ -37,6 +37,7 @@ import os
 import dataclasses as dc
 
 from .package_url import PackageURL
+from ..http_client import client_for
 from ..project_ops_info import ProjectUpdateInfo
 from ..utils import fatal, getlocstr
 
@@ -126,9 +127,10 @@ class PackageIvpmYaml(PackageURL):
         under ``<deps_dir>/.ivpm-sources/``; local files are read in place."""
         url = self.url
         if url.startswith("http://") or url.startswith("https://"):
-            content = self._download(url)
-            self.resolved_fingerprint = self._http_fingerprint(url) \
-                or _sha256_bytes(content)
+            with update_info.phase("download", stage="net"):
+                content = self._download(url, update_info)
+                self.resolved_fingerprint = self._http_fingerprint(url, update_info) \
+                    or _sha256_bytes(content)
             cache_dir = os.path.join(update_info.deps_dir, ".ivpm-sources")
             os.makedirs(cache_dir, exist_ok=True)
             local = os.path.join(cache_dir, _safe_filename(url))
@@ -145,18 +147,16 @@ class PackageIvpmYaml(PackageURL):
             self.resolved_fingerprint = _sha256_bytes(f.read())
         return path
 
-    def _download(self, url: str) -> bytes:
-        import httpx
-        r = httpx.get(url, follow_redirects=True, timeout=30)
+    def _download(self, url: str, update_info: ProjectUpdateInfo = None) -> bytes:
+        r = client_for(update_info).get(url, follow_redirects=True, timeout=30)
         if r.status_code < 200 or r.status_code >= 300:
             raise Exception("Failed to download %s: HTTP %d" % (url, r.status_code))
         return r.content
 
-    def _http_fingerprint(self, url: str):
+    def _http_fingerprint(self, url: str, update_info: ProjectUpdateInfo = None):
         """Best-effort etag/last-modified via a HEAD request; None on failure."""
         try:
-            import httpx
-            resp = httpx.head(url, follow_redirects=True, timeout=30)
+            resp = client_for(update_info).head(url, follow_redirects=True, timeout=30)
             if "ETag" in resp.headers:
                 return resp.headers["ETag"].strip('"').strip("'")
             if "Last-Modified" in resp.headers:
@@ -103,6 +103,8 @@ class ProjInfo():
         # name (e.g. "cbwa"), value is the raw dict/value from YAML.
         self.handler_configs : Dict[str, object] = {}
         self.resolved_vars : Dict[str, str] = {}
+        # Every ivpm.yaml/include file read to build this ProjInfo
+        self.source_files : List[str] = []
 
     def has_dep_set(self, name):
         return name in self.dep_set_m.keys()
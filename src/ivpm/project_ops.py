@@ -32,6 +32,9 @@ from .update_event import UpdateEventDispatcher
 from .update_tui import create_update_tui, RichUpdateTUI
 from .utils import fatal, note, warning
 from .package_lock import write_lock, check_lock_changes
+from .package_timings import find_timings, write_timings
+from .cache import Cache
+from .ref_cache import RefCache
 
 _logger = logging.getLogger("ivpm.project_ops")
 
@@ -51,6 +54,20 @@ class ProjectOps(object):
                force : bool = False,
                cli_overrides = None):
         from .update_event import UpdateEvent, UpdateEventType
+        from .workspace_fingerprint import (
+            update_inputs, check_fingerprint, make_fingerprint)
+
+        # No-op fast path: if nothing the last update depended on has
+        # changed, there is nothing to do. --verify forces the full update.
+        fp_inputs = update_inputs(
+            args, dep_set=dep_set, force_py_install=force_py_install,
+            skip_venv=skip_venv, lock_file=lock_file,
+            refresh_all=refresh_all, force=force,
+            cli_overrides=cli_overrides)
+        if not getattr(args, "verify", False) \
+                and check_fingerprint(self.root_dir, fp_inputs):
+            note("Workspace is up to date (use --verify to force a full update)")
+            return
 
         # Get log level from args for TUI selection
         log_level = getattr(args, 'log_level', 'NONE')
@@ -61,6 +78,14 @@ class ProjectOps(object):
         tui = create_update_tui(log_level, verbose=verbose)
         event_dispatcher.add_listener(tui)
 
+        # Optional per-package phase timing profile (--profile-out)
+        profile_out = getattr(args, 'profile_out', None)
+        profiler = None
+        if profile_out:
+            from .update_profiler import UpdateProfiler
+            profiler = UpdateProfiler()
+            event_dispatcher.add_listener(profiler)
+
         # Determine if we should suppress output (Rich TUI mode)
         suppress_output = isinstance(tui, RichUpdateTUI)
 
@@ -70,6 +95,7 @@ class ProjectOps(object):
         if isinstance(tui, RichUpdateTUI):
             tui.start()
 
+        updater = None
         try:
             proj_info, deps_dir, dep_set = self._init(dep_set, cli_overrides=cli_overrides)
 
@@ -122,6 +148,18 @@ class ProjectOps(object):
                 except Exception:
                     _logger.debug("Could not read lock file for change detection")
 
+            # Locked transitive deps are prefetched while their parents load.
+            # Reproduction mode already schedules the full closure up front.
+            updater.speculate = lock_file is None
+
+            # Branch/tag resolutions persist in the package cache; --ref-ttl
+            # re-uses recent ones without network access
+            updater.update_info.ref_cache = RefCache.open(
+                Cache(), getattr(args, "ref_ttl", None) or 0.0)
+
+            # Fetch timings from earlier runs drive critical-path-first ordering
+            updater.timings = find_timings(deps_dir, lock_file)
+
             # Build the handler update_info (with dispatcher wired in)
             handler_update_info = ProjectUpdateInfo(
                 args, deps_dir,
@@ -149,7 +187,8 @@ class ProjectOps(object):
             handler_update_info.handler_state = _prev_ivpm.get("handlers", {})
 
             # Root pre-load: let handlers initialise before any packages are fetched
-            pkg_handler.on_root_pre_load(handler_update_info)
+            with handler_update_info.phase("root-pre-load"):
+                pkg_handler.on_root_pre_load(handler_update_info)
 
             # Prevent an attempt to load the top-level project as a depedency
             updater.all_pkgs[proj_info.name] = None
@@ -158,7 +197,8 @@ class ProjectOps(object):
             _logger.debug("Setup-deps: %s", str(pkgs_info.setup_deps))
 
             # Root post-load: handlers do their main work (venv, pip install, envrc, etc.)
-            pkg_handler.on_root_post_load(handler_update_info)
+            with handler_update_info.phase("root-handlers"):
+                pkg_handler.on_root_post_load(handler_update_info)
 
             # Signal update complete
             updater.update_info.update_complete()
@@ -166,6 +206,8 @@ class ProjectOps(object):
             # Write package-lock.json with resolved package versions
             handler_contributions = pkg_handler.get_lock_entries(deps_dir)
             write_lock(deps_dir, updater.all_pkgs, handler_contributions)
+            write_timings(deps_dir, updater.all_pkgs, updater.durations,
+                          previous=updater.timings)
 
             # Write ivpm.json with dep-set and handler state
             ivpm_json = {"dep-set": dep_set}
@@ -174,12 +216,23 @@ class ProjectOps(object):
             state_contributions = pkg_handler.get_state_entries()
             if state_contributions:
                 ivpm_json["handlers"] = state_contributions
+            ivpm_json["fingerprint"] = make_fingerprint(
+                self.root_dir, deps_dir, proj_info.source_files, fp_inputs,
+                pkg_handler.get_fingerprint_paths())
             with open(os.path.join(deps_dir, "ivpm.json"), "w") as fp:
                 json.dump(ivpm_json, fp)
         finally:
             # Ensure TUI is stopped on exception
             if isinstance(tui, RichUpdateTUI):
                 tui.stop()
+            # Release the pooled HTTP connections of the run
+            if updater is not None:
+                updater.update_info.http.close()
+            # Write the profile even for a failed update: it shows where
+            # the time went up to the failure
+            if profiler is not None:
+                profiler.write(profile_out)
+                note("Wrote update profile to %s" % profile_out)
 
     def build(self, dep_set : str = None, args = None, debug : bool = False):
         proj_info, deps_dir, dep_set = self._init(dep_set)
@@ -201,6 +254,8 @@ class ProjectOps(object):
         pass
 
     def status(self, dep_set: str = None, args=None):
+        import asyncio
+        import multiprocessing
         from .proj_info import ProjInfo
         from .pkg_status import PkgVcsStatus
         from .project_ops_info import ProjectStatusInfo
@@ -220,35 +275,48 @@ class ProjectOps(object):
         lock = read_lock(lock_path)
         packages = lock.get("packages", {})
 
-        status_info = ProjectStatusInfo(args=args, deps_dir=deps_dir)
+        max_parallel = getattr(args, "jobs", 0) if args is not None else 0
+        status_info = ProjectStatusInfo(
+            args=args, deps_dir=deps_dir, max_parallel=max_parallel or 0)
         rgy = PkgTypeRgy.inst()
 
-        results = []
-        for name, entry in packages.items():
-            src = entry.get("src", "")
-            if not rgy.hasPkgType(src):
-                results.append(PkgVcsStatus(
-                    name=name,
-                    src_type=src,
-                    path=os.path.join(deps_dir, name),
-                    vcs="none",
-                    from_deps_source=entry.get("from_deps_source"),
-                ))
-                continue
+        # Packages are queried in parallel; each git package costs one or
+        # two git processes
+        n_workers = status_info.max_parallel or multiprocessing.cpu_count()
 
-            pkg = rgy.mkPackage(src, name, entry, None)
-            pkg.path = os.path.join(deps_dir, name)
-            result = pkg.status(status_info)
-            if result is None:
-                result = PkgVcsStatus(
-                    name=name,
-                    src_type=src,
-                    path=pkg.path,
-                    vcs="none",
-                )
-            if entry.get("from_deps_source"):
-                result.from_deps_source = entry["from_deps_source"]
-            results.append(result)
+        async def _run_all():
+            semaphore = asyncio.Semaphore(n_workers)
+
+            async def _run_one(name, entry):
+                src = entry.get("src", "")
+                if not rgy.hasPkgType(src):
+                    return PkgVcsStatus(
+                        name=name,
+                        src_type=src,
+                        path=os.path.join(deps_dir, name),
+                        vcs="none",
+                        from_deps_source=entry.get("from_deps_source"),
+                    )
+
+                pkg = rgy.mkPackage(src, name, entry, None)
+                pkg.path = os.path.join(deps_dir, name)
+                async with semaphore:
+                    result = await pkg.status_async(status_info)
+                if result is None:
+                    result = PkgVcsStatus(
+                        name=name,
+                        src_type=src,
+                        path=pkg.path,
+                        vcs="none",
+                    )
+                if entry.get("from_deps_source"):
+                    result.from_deps_source = entry["from_deps_source"]
+                return result
+
+            return await asyncio.gather(
+                *[_run_one(n, e) for n, e in packages.items()])
+
+        results = list(asyncio.run(_run_all()))
 
         # Recompute (do not persist) whether each deps-source package resolves
         # into the current main git worktree, so status can mark those as
@@ -326,7 +394,6 @@ class ProjectOps(object):
 
         async def _run_all():
             semaphore = asyncio.Semaphore(n_workers)
-            loop = asyncio.get_event_loop()
 
             async def _run_one(name, entry):
                 async with semaphore:
@@ -361,9 +428,7 @@ class ProjectOps(object):
                     else:
                         pkg = rgy.mkPackage(src, name, entry, None)
                         pkg.path = os.path.join(deps_dir, name)
-                        result = await loop.run_in_executor(
-                            None, pkg.sync, sync_info
-                        )
+                        result = await pkg.sync_async(sync_info)
                     if progress:
                         progress.on_pkg_result(result)
                     return result
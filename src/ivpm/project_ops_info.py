@@ -19,12 +19,21 @@
 #*     Author: 
 #*
 #****************************************************************************
+import asyncio
+import concurrent.futures
+import contextlib
 import dataclasses as dc
 import enum
 import logging
+import os
+import subprocess
+import threading
 import time
 from typing import List, Optional, Tuple
 
+from .git_refs import RefResolver
+from .http_client import HttpClient
+from .subprocess_runner import SubprocessRunner, run_sync
 from .update_event import UpdateEvent, UpdateEventType, UpdateEventDispatcher
 
 _logger = logging.getLogger("ivpm.project_ops_info")
@@ -52,10 +61,13 @@ class ProjectSyncInfo(ProjectOpsInfo):
     packages_filter: Optional[List[str]] = None  # if set, only sync named packages
     max_parallel: int = 0                         # 0 = cpu_count()
     progress: Optional[object] = None             # SyncProgressListener instance
+    # Upstream branch tips, listed once per remote for the whole sync
+    ref_resolver: RefResolver = dc.field(default_factory=RefResolver)
 
 @dc.dataclass
 class ProjectStatusInfo(ProjectOpsInfo):
     dep_set: Optional[str] = None
+    max_parallel: int = 0                         # 0 = cpu_count()
 
 @dc.dataclass
 class ProjectStatusResult(object):
@@ -63,12 +75,44 @@ class ProjectStatusResult(object):
     path : str
     status : FileStatus
 
+def _in_loop_thread(loop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+class UpdateCancelled(Exception):
+    """Raised in a package fetch when the update was cancelled, eg
+    because another package failed."""
+    pass
+
+
+# Fetch statistics merged from a fork()'ed ProjectUpdateInfo. Package
+# counts are not merged: the package is reported again when it is loaded.
+_MERGED_STAT_FIELDS = (
+    "cache_hits", "cache_misses", "cache_unconfigured_packages",
+    "deps_source_hits", "deps_source_misses")
+_STAT_FIELDS = _MERGED_STAT_FIELDS + (
+    "total_packages", "cacheable_packages", "editable_packages")
+
+# Per worker thread: the slot in the update's overall worker pool held by
+# the package it loads (see ProjectUpdateInfo.worker_slot()). Module-level
+# rather than per-instance, so that fork()'ed copies see it too.
+_worker = threading.local()
+
 @dc.dataclass
 class ProjectUpdateInfo(ProjectOpsInfo):
     project_name : Optional[str] = None
     force_py_install : bool = False
     skip_venv : bool = False
     cache: Optional['Cache'] = None
+    # git ref -> commit resolution, memoized for the run
+    ref_resolver: RefResolver = dc.field(default_factory=RefResolver)
+    # Persistent ref resolutions in the IVPM cache (None: not persisted)
+    ref_cache: Optional['RefCache'] = None
+    # Pooled HTTP connections, shared by all packages of the run
+    http: HttpClient = dc.field(default_factory=HttpClient)
     cache_hits: int = 0
     cache_misses: int = 0
     total_packages: int = 0
@@ -81,6 +125,10 @@ class ProjectUpdateInfo(ProjectOpsInfo):
     deps_source_hits: int = 0
     deps_source_misses: int = 0
     max_parallel: int = 0  # 0 means use available cores
+    # Per-resource concurrency limits within max_parallel (0 = unlimited).
+    # Keyed by stage: "net" (clone/download), "unpack" (archive extraction,
+    # cache store) and "handler" (leaf handlers).
+    stage_limits: dict = dc.field(default_factory=dict)
     event_dispatcher: Optional[UpdateEventDispatcher] = None
     suppress_output: bool = False  # When True, suppress subprocess output (Rich TUI mode)
     python_config: Optional[object] = None  # PythonConfig from root ivpm.yaml
@@ -92,9 +140,233 @@ class ProjectUpdateInfo(ProjectOpsInfo):
     pending_skill_dirs: List[Tuple[str, str]] = dc.field(default_factory=list)  # (name, skill_dir) pushed by handlers
     modules_interface: Optional['ModulesInterface'] = None  # lazily populated by PackageModule.update()
     _tui_ref: Optional[object] = None  # Reference to the TUI for prompt callbacks
-    _current_package_start: Optional[float] = None
-    _current_package_name: Optional[str] = None
-    _current_cache_hit: Optional[bool] = None
+    # Package fetches run concurrently in worker threads, so the
+    # package-in-progress state (name, start time, cache hit) is per-thread
+    _tls: object = dc.field(default_factory=threading.local)
+    _stage_sems: dict = dc.field(default_factory=dict)
+    _stage_lock: object = dc.field(default_factory=threading.Lock)
+    # Event loop running the update; fetch subprocesses run on it
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    # Cancellation state: set once by cancel(), shared by fork()'ed copies.
+    # _procs holds the (loop, task) of each running subprocess
+    _cancel: object = dc.field(default_factory=threading.Event)
+    _procs: set = dc.field(default_factory=set)
+    _procs_lock: object = dc.field(default_factory=threading.Lock)
+
+    def __post_init__(self):
+        # ls-remote runs, like the fetches, as a cancellable subprocess
+        if self.ref_resolver.run is None:
+            self.ref_resolver.run = self.run_subprocess
+
+    def stage(self, name: str):
+        """Return a context manager that holds a slot in the named stage's
+        worker pool for the duration of the ``with`` block.
+
+        Package fetches run in worker threads, so the pools are thread
+        semaphores. A package releases its network slot before unpacking,
+        letting other fetches proceed while it extracts. Stages without a
+        configured limit are not gated.
+
+        Once in a limited stage, the thread lends its slot in the update's
+        overall pool (see worker_slot()) to another package, and takes a
+        slot back when it leaves the stage.
+        """
+        limit = self.stage_limits.get(name, 0) if name else 0
+        if not limit:
+            return contextlib.nullcontext()
+        with self._stage_lock:
+            if name not in self._stage_sems.keys():
+                self._stage_sems[name] = threading.BoundedSemaphore(limit)
+            return self._in_stage(self._stage_sems[name])
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _in_stage(sem):
+        slot = getattr(_worker, "slot", None)
+        lent = False
+        try:
+            with sem:
+                if slot is not None:
+                    slot.lend()
+                    lent = True
+                yield
+        finally:
+            # Not while holding the stage slot: the packages holding the
+            # overall slots may be waiting for it
+            if lent:
+                slot.reclaim()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def worker_slot(slot):
+        """Make 'slot' this thread's slot in the update's overall worker
+        pool for the ``with`` block. 'slot' has lend() and reclaim()
+        methods, which stage() calls on entering and leaving a limited
+        stage."""
+        _worker.slot = slot
+        try:
+            yield
+        finally:
+            _worker.slot = None
+
+    def stage_jobs(self, name: str) -> int:
+        """Return how many jobs of the named stage may run at once: the
+        stage's limit, else the update's overall job budget."""
+        limit = self.stage_limits.get(name, 0) if name else 0
+        if limit:
+            return limit
+        if self.max_parallel:
+            return self.max_parallel
+        return os.cpu_count() or 1
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Cancel the update after a fatal error.
+
+        Fetches that have not started raise UpdateCancelled when they
+        check in, and subprocesses started through run_subprocess() are
+        cancelled, which terminates them (then kills them if they ignore
+        SIGTERM; see SubprocessRunner.run_async).
+        """
+        self._cancel.set()
+        with self._procs_lock:
+            running = list(self._procs)
+        if len(running) == 0:
+            return
+        _logger.debug("Terminating %d running subprocesses", len(running))
+        for loop, task in running:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # The loop has finished, and the process with it
+                pass
+
+    def check_cancelled(self):
+        """Raise UpdateCancelled if the update has been cancelled."""
+        if self._cancel.is_set():
+            raise UpdateCancelled("Update cancelled")
+
+    def run_subprocess(self, cmd, cwd=None, stdout=None, stderr=None,
+                       timeout=None) -> subprocess.CompletedProcess:
+        """Run a command as subprocess.run() does, as an asyncio subprocess
+        (SubprocessRunner.run_async) on the update's event loop, so that
+        cancelling the update cancels it.
+
+        'stdout' and 'stderr' are None (passed through) or PIPE (captured,
+        as text), or DEVNULL: output then goes to the TUI, as a
+        PACKAGE_OUTPUT event per line, rather than to the terminal.
+
+        Raises UpdateCancelled if the update was cancelled before the
+        command started or while it ran.
+        """
+        self.check_cancelled()
+        streams = (stdout, stderr)
+        capture = any(stream is not None for stream in streams)
+        on_output = None
+        if subprocess.DEVNULL in streams:
+            package = getattr(self._tls, "package_name", None)
+
+            def on_output(name, line):
+                if streams[name == "stderr"] == subprocess.DEVNULL:
+                    self._dispatch_output(package, line)
+
+        coro = self._run_cancellable(SubprocessRunner.run_async(
+            cmd, cwd=cwd, capture_output=capture, timeout=timeout,
+            on_output=on_output))
+        try:
+            if self.loop is not None and self.loop.is_running() \
+                    and not _in_loop_thread(self.loop):
+                returncode, out, err = asyncio.run_coroutine_threadsafe(
+                    coro, self.loop).result()
+            else:
+                returncode, out, err = run_sync(coro)
+        except (asyncio.CancelledError, concurrent.futures.CancelledError):
+            self.check_cancelled()
+            raise
+        self.check_cancelled()
+        return subprocess.CompletedProcess(
+            cmd, returncode,
+            out if stdout == subprocess.PIPE else None,
+            err if stderr == subprocess.PIPE else None)
+
+    async def _run_cancellable(self, coro):
+        """Await 'coro' as a task that cancel() can cancel."""
+        task = asyncio.ensure_future(coro)
+        entry = (asyncio.get_running_loop(), task)
+        with self._procs_lock:
+            self._procs.add(entry)
+        try:
+            # cancel() may have run before the task was registered
+            if self._cancel.is_set():
+                task.cancel()
+            return await task
+        finally:
+            with self._procs_lock:
+                self._procs.discard(entry)
+
+    def _dispatch_output(self, package, line):
+        if self.event_dispatcher:
+            self.event_dispatcher.dispatch(UpdateEvent(
+                event_type=UpdateEventType.PACKAGE_OUTPUT,
+                package_name=package,
+                output=line))
+
+    def fork(self) -> 'ProjectUpdateInfo':
+        """Return a copy for work done outside the normal package flow
+        (eg a speculative prefetch).
+
+        The copy shares configuration, the stage worker pools, the HTTP
+        client and the cancellation state, but starts with zeroed
+        statistics and dispatches no events. Use merge_stats() to fold
+        its statistics back in.
+        """
+        kw = {f: 0 for f in _STAT_FIELDS}
+        return dc.replace(self, event_dispatcher=None,
+                          _tls=threading.local(), **kw)
+
+    def merge_stats(self, other: 'ProjectUpdateInfo'):
+        """Add the fetch statistics (cache/deps-source hits and misses)
+        gathered in a fork()'ed copy."""
+        for f in _MERGED_STAT_FIELDS:
+            setattr(self, f, getattr(self, f) + getattr(other, f))
+
+    @contextlib.contextmanager
+    def phase(self, name: str, stage: Optional[str] = None):
+        """Mark a named phase (eg "resolve", "clone", "unpack") of the
+        package being loaded on this thread, emitting PACKAGE_PHASE_START
+        and PACKAGE_PHASE_END events around the ``with`` block.
+
+        If 'stage' is given, the block also holds a slot in that stage's
+        worker pool (see stage()); time spent waiting for the slot is
+        counted in the phase.
+        """
+        package = getattr(self._tls, "package_name", None)
+        self._dispatch_phase(UpdateEventType.PACKAGE_PHASE_START, package, name)
+        try:
+            with self.stage(stage):
+                yield
+        finally:
+            self._dispatch_phase(UpdateEventType.PACKAGE_PHASE_END, package, name)
+
+    def bind_package(self, fn):
+        """Wrap 'fn' so that, run on another thread, its phases are
+        attributed to the package being loaded on this one."""
+        package = getattr(self._tls, "package_name", None)
+
+        def run(*args, **kwargs):
+            self._tls.package_name = package
+            return fn(*args, **kwargs)
+        return run
+
+    def _dispatch_phase(self, event_type, package, name):
+        if self.event_dispatcher:
+            self.event_dispatcher.dispatch(UpdateEvent(
+                event_type=event_type,
+                package_name=package,
+                phase=name))
     
     def get_prompt_callback(self):
         """Return a prompt callback appropriate for the current TUI.
@@ -126,7 +398,8 @@ class ProjectUpdateInfo(ProjectOpsInfo):
         if hit is None:
             self.report_deps_source_miss()
             return False
-        self._materialize_from_deps_source(pkg, hit)
+        with self.phase("deps-source-link"):
+            self._materialize_from_deps_source(pkg, hit)
         self.report_deps_source_hit()
         return True
 
@@ -146,13 +419,19 @@ class ProjectUpdateInfo(ProjectOpsInfo):
         pkg.from_deps_source = source_path
         pkg.path = target.replace("\\", "/")
 
+        # A parent entry that links into the cache is a use of that version
+        from .cache import Cache
+        cache = self.cache if self.cache is not None else Cache()
+        if cache.is_enabled():
+            cache.record_path_use(source_path, self.deps_dir)
+
     def report_cache_hit(self):
         self.cache_hits += 1
-        self._current_cache_hit = True
+        self._tls.cache_hit = True
     
     def report_cache_miss(self):
         self.cache_misses += 1
-        self._current_cache_hit = False
+        self._tls.cache_hit = False
     
     def report_package(self, cacheable: bool = False, editable: bool = False):
         """Report a package for statistics.
@@ -169,9 +448,9 @@ class ProjectUpdateInfo(ProjectOpsInfo):
     
     def package_start(self, name: str, pkg_type: str = None, pkg_src: str = None):
         """Signal that loading of a package has started."""
-        self._current_package_start = time.time()
-        self._current_package_name = name
-        self._current_cache_hit = None
+        self._tls.package_start = time.time()
+        self._tls.package_name = name
+        self._tls.cache_hit = None
         
         if self.event_dispatcher:
             event = UpdateEvent(
@@ -186,23 +465,24 @@ class ProjectUpdateInfo(ProjectOpsInfo):
     def package_complete(self, name: str, version: str = None):
         """Signal that loading of a package has completed."""
         duration = None
-        if self._current_package_start and self._current_package_name == name:
-            duration = time.time() - self._current_package_start
+        start = getattr(self._tls, "package_start", None)
+        if start and getattr(self._tls, "package_name", None) == name:
+            duration = time.time() - start
         
         if self.event_dispatcher:
             event = UpdateEvent(
                 event_type=UpdateEventType.PACKAGE_COMPLETE,
                 package_name=name,
                 duration=duration,
-                cache_hit=self._current_cache_hit,
+                cache_hit=getattr(self._tls, "cache_hit", None),
                 version=version
             )
             self.event_dispatcher.dispatch(event)
         _logger.debug("Package complete: %s (%.2fs)", name, duration or 0)
         
-        self._current_package_start = None
-        self._current_package_name = None
-        self._current_cache_hit = None
+        self._tls.package_start = None
+        self._tls.package_name = None
+        self._tls.cache_hit = None
     
     def package_error(self, name: str, error_message: str):
         """Signal that loading of a package has failed."""
@@ -0,0 +1,118 @@
+#****************************************************************************
+#* ref_cache.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+ref_cache.py — persistent branch/tag -> commit resolutions.
+
+Resolved refs of ``cache: true`` git packages are kept under the IVPM
+cache directory in ``.refs/``, one small JSON file per (url, ref)::
+
+    {"url": ..., "ref": ..., "commit": ..., "etag": ..., "checked": <epoch>}
+
+On the next update a GitHub lookup is sent with ``If-None-Match: <etag>``;
+a ``304 Not Modified`` reply re-uses the stored commit and does not count
+against the API rate limit.  With a TTL (``ivpm update --ref-ttl 10m``),
+an entry checked within the TTL is used without any network access.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+_logger = logging.getLogger("ivpm.ref_cache")
+
+REFS_DIR = ".refs"
+
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text: str) -> float:
+    """Parse a duration such as ``90``, ``90s``, ``10m``, ``2h`` or ``1d``
+    into seconds."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(text))
+    if m is None:
+        raise ValueError(
+            "invalid duration %r (expected eg 90s, 10m, 2h, 1d)" % text)
+    return float(m.group(1)) * _DURATION_UNITS[m.group(2)]
+
+
+class RefCache(object):
+    """On-disk ref-resolution cache in ``<cache_dir>/.refs``."""
+
+    def __init__(self, cache_dir: str, ttl: float = 0.0):
+        self.refs_dir = os.path.join(cache_dir, REFS_DIR)
+        self.ttl = ttl
+
+    @staticmethod
+    def open(cache, ttl: float = 0.0) -> Optional['RefCache']:
+        """Return a RefCache for an IVPM Cache, or None if caching is off."""
+        if cache is None or not cache.is_enabled():
+            return None
+        return RefCache(cache.cache_dir, ttl)
+
+    def get(self, url: str, ref: str) -> Optional[dict]:
+        """Return the stored entry for (url, ref), or None."""
+        path = self._path(url, ref)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as fp:
+                entry = json.load(fp)
+        except Exception as e:
+            _logger.debug("Could not read %s: %s", path, e)
+            return None
+        if entry.get("url") != url or entry.get("ref") != ref \
+                or not entry.get("commit"):
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        """True if 'entry' was checked within the TTL."""
+        return self.ttl > 0 and time.time() - entry.get("checked", 0) < self.ttl
+
+    def put(self, url: str, ref: str, commit: str, etag: Optional[str] = None):
+        """Record that (url, ref) resolved to 'commit' as of now.
+
+        The write is atomic, so concurrent updates sharing a cache see
+        either the old or the new entry.
+        """
+        path = self._path(url, ref)
+        entry = {
+            "url": url,
+            "ref": ref,
+            "commit": commit,
+            "etag": etag,
+            "checked": time.time(),
+        }
+        try:
+            os.makedirs(self.refs_dir, exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(tmp_path, "w") as fp:
+                json.dump(entry, fp)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # A read-only shared cache just means no persistence
+            _logger.debug("Could not write %s: %s", path, e)
+
+    def _path(self, url: str, ref: str) -> str:
+        key = hashlib.sha1(("%s\0%s" % (url, ref)).encode()).hexdigest()
+        return os.path.join(self.refs_dir, key + ".json")
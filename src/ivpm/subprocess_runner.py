@@ -19,12 +19,32 @@
 """
 Subprocess utilities with output capture support.
 """
+import asyncio
+import concurrent.futures
 import logging
 import subprocess
-from typing import List, Optional, Tuple, Union
+from typing import Callable, List, Optional, Tuple, Union
 
 _logger = logging.getLogger("ivpm.subprocess")
 
+# Seconds a terminated (SIGTERM) process is given to exit before SIGKILL
+TERMINATE_GRACE = 5.0
+
+
+def run_sync(coro):
+    """Run coroutine 'coro' to completion from synchronous code.
+
+    asyncio.run() refuses to run inside a thread whose event loop is
+    already running (eg a synchronous API called from async code); the
+    coroutine is then run on a new loop in a worker thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
 
 class SubprocessRunner:
     """
@@ -130,3 +150,101 @@ class SubprocessRunner:
             capture_output=not verbose,
             timeout=timeout
         )
+
+    @staticmethod
+    async def run_async(
+        cmd: List[str],
+        cwd: Optional[str] = None,
+        env: Optional[dict] = None,
+        capture_output: bool = True,
+        check: bool = False,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str, str], None]] = None
+    ) -> Tuple[int, str, str]:
+        """
+        Run a subprocess on the event loop, without tying up a thread.
+
+        Output is read line by line as it is produced. If the awaiting
+        task is cancelled, or the timeout expires, the process is
+        terminated (then killed if it does not exit promptly) before the
+        CancelledError or TimeoutExpired propagates.
+
+        Args:
+            cmd: Command to run (list of strings; no shell)
+            cwd: Working directory
+            env: Environment variables
+            capture_output: If True, capture stdout/stderr; if False, pass through
+            check: If True, raise CalledProcessError on non-zero return
+            timeout: Timeout in seconds
+            on_output: Called as on_output(stream, line) for each output
+                line, where stream is "stdout" or "stderr". Only used when
+                capture_output is True.
+
+        Returns:
+            Tuple of (return_code, stdout, stderr)
+        """
+        _logger.debug("Running command: %s", cmd)
+
+        pipe = asyncio.subprocess.PIPE if capture_output else None
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=cwd, env=env, stdout=pipe, stderr=pipe)
+
+        out = {"stdout": [], "stderr": []}
+
+        async def _read(stream, name):
+            while True:
+                line = await stream.readline()
+                if not line:
+                    break
+                text = line.decode(errors="replace")
+                out[name].append(text)
+                if on_output is not None:
+                    on_output(name, text.rstrip("\n"))
+
+        async def _communicate():
+            if capture_output:
+                await asyncio.gather(
+                    _read(proc.stdout, "stdout"),
+                    _read(proc.stderr, "stderr"))
+            return await proc.wait()
+
+        try:
+            returncode = await asyncio.wait_for(_communicate(), timeout)
+        except asyncio.TimeoutError:
+            await SubprocessRunner._terminate(proc)
+            raise subprocess.TimeoutExpired(
+                cmd, timeout, "".join(out["stdout"]), "".join(out["stderr"]))
+        except asyncio.CancelledError:
+            await asyncio.shield(SubprocessRunner._terminate(proc))
+            raise
+
+        stdout = "".join(out["stdout"])
+        stderr = "".join(out["stderr"])
+        if stdout:
+            _logger.debug("stdout: %s", stdout)
+        if stderr:
+            _logger.debug("stderr: %s", stderr)
+
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
+
+        return (returncode, stdout, stderr)
+
+    @staticmethod
+    async def _terminate(proc):
+        """Stop a running process: SIGTERM, then SIGKILL after a grace period."""
+        if proc.returncode is not None:
+            return
+        _logger.debug("Terminating process %d", proc.pid)
+        try:
+            proc.terminate()
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), TERMINATE_GRACE)
+        except asyncio.TimeoutError:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
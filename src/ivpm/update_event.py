@@ -35,6 +35,9 @@ class UpdateEventType(Enum):
     PACKAGE_START = auto()          # Package loading started
     PACKAGE_COMPLETE = auto()       # Package loading completed successfully
     PACKAGE_ERROR = auto()          # Package loading failed
+    PACKAGE_PHASE_START = auto()    # A phase (resolve, clone, unpack...) of a package began
+    PACKAGE_PHASE_END = auto()      # A phase of a package ended
+    PACKAGE_OUTPUT = auto()         # A line of output from a package's fetch command
     UPDATE_COMPLETE = auto()        # All packages loaded
     # --- Deprecated (use HANDLER_TASK_* instead) ---
     VENV_START = auto()             # Deprecated: use HANDLER_TASK_START
@@ -54,6 +57,8 @@ class UpdateEvent:
     cache_hit: Optional[bool] = None
     error_message: Optional[str] = None
     version: Optional[str] = None
+    phase: Optional[str] = None          # phase name for PACKAGE_PHASE_* events
+    output: Optional[str] = None         # output line for PACKAGE_OUTPUT events
     total_packages: int = 0
     cache_hits: int = 0
     cache_misses: int = 0
@@ -0,0 +1,173 @@
+#****************************************************************************
+#* update_profiler.py
+#*
+#* Copyright 2018-2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.
+#* You may obtain a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+Update event listener that records a timing profile of an update.
+
+The profile is written in Chrome trace-event JSON format, viewable in
+Perfetto (ui.perfetto.dev) or chrome://tracing. Each worker thread is a
+lane; each package is a slice on the lane that loaded it, with its phases
+(resolve, clone/download, unpack, cache store/link, leaf handlers) nested
+inside. Root handler tasks appear on the lane of the thread running them.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+from .update_event import UpdateEvent, UpdateEventListener, UpdateEventType
+
+
+class UpdateProfiler(UpdateEventListener):
+    """Collects package, phase and handler-task spans from update events.
+
+    Events are dispatched synchronously on the thread that emits them, so
+    the receiving thread identifies the lane and the receive time is the
+    event time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+        self._threads: Dict[int, str] = {}
+        # Per-thread stack of open spans: (category, key, name, start_us, args)
+        self._open: Dict[int, List[tuple]] = {}
+        self._events: List[dict] = []
+
+    def on_event(self, event: UpdateEvent):
+        t = event.event_type
+        if t == UpdateEventType.PACKAGE_START:
+            args = {}
+            if event.package_type:
+                args["type"] = event.package_type
+            if event.package_src:
+                args["src"] = event.package_src
+            self._begin("package", event.package_name, event.package_name, args)
+        elif t == UpdateEventType.PACKAGE_COMPLETE:
+            args = {}
+            if event.cache_hit is not None:
+                args["cache_hit"] = event.cache_hit
+            if event.version:
+                args["version"] = event.version
+            self._end("package", event.package_name, args)
+        elif t == UpdateEventType.PACKAGE_ERROR:
+            self._end("package", event.package_name,
+                      {"error": event.error_message})
+        elif t == UpdateEventType.PACKAGE_PHASE_START:
+            args = {"package": event.package_name} if event.package_name else {}
+            self._begin("phase", (event.package_name, event.phase),
+                        event.phase, args)
+        elif t == UpdateEventType.PACKAGE_PHASE_END:
+            self._end("phase", (event.package_name, event.phase), {})
+        elif t == UpdateEventType.HANDLER_TASK_START:
+            args = {"task_id": event.task_id}
+            if event.parent_task_id:
+                args["parent"] = event.parent_task_id
+            self._begin("handler", event.task_id,
+                        event.task_name or event.task_id, args)
+        elif t == UpdateEventType.HANDLER_TASK_END:
+            self._end("handler", event.task_id, {})
+        elif t == UpdateEventType.HANDLER_TASK_ERROR:
+            self._end("handler", event.task_id,
+                      {"error": event.error_message})
+        elif t == UpdateEventType.UPDATE_COMPLETE:
+            with self._lock:
+                tid = self._thread()
+                self._events.append({
+                    "name": "update complete", "ph": "i", "s": "g",
+                    "ts": self._now(), "pid": self._pid, "tid": tid,
+                    "args": {"total_packages": event.total_packages,
+                             "cache_hits": event.cache_hits,
+                             "cache_misses": event.cache_misses}})
+
+    def trace(self) -> dict:
+        """Return the profile as a Chrome trace-event document."""
+        with self._lock:
+            events = [{
+                "name": "process_name", "ph": "M", "pid": self._pid, "tid": 0,
+                "args": {"name": "ivpm update"}}]
+            for tid, name in self._threads.items():
+                events.append({
+                    "name": "thread_name", "ph": "M", "pid": self._pid,
+                    "tid": tid, "args": {"name": name}})
+            events.extend(self._events)
+
+            # Spans still open (eg an update that failed part-way) are
+            # closed at the current time so they remain visible
+            now = self._now()
+            for tid, stack in self._open.items():
+                for cat, key, name, ts, args in stack:
+                    events.append(self._span(
+                        cat, name, ts, now, tid, dict(args, incomplete=True)))
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str):
+        """Write the profile to 'path'."""
+        with open(path, "w") as fp:
+            json.dump(self.trace(), fp, indent=1)
+            fp.write("\n")
+
+    def _now(self) -> float:
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def _thread(self) -> int:
+        # Caller holds self._lock
+        tid = threading.get_ident()
+        if tid not in self._threads.keys():
+            self._threads[tid] = threading.current_thread().name
+        return tid
+
+    def _span(self, cat, name, ts, end, tid, args) -> dict:
+        ev = {
+            "name": name, "cat": cat, "ph": "X",
+            "ts": ts, "dur": max(end - ts, 0.0),
+            "pid": self._pid, "tid": tid}
+        if args:
+            ev["args"] = args
+        return ev
+
+    def _begin(self, cat, key, name, args):
+        with self._lock:
+            tid = self._thread()
+            self._open.setdefault(tid, []).append(
+                (cat, key, name or "", self._now(), args))
+
+    def _end(self, cat, key, args):
+        with self._lock:
+            now = self._now()
+            tid = self._thread()
+            # Look on this thread first; fall back to others for spans
+            # ended on a different thread than they began
+            tids = [tid] + [t for t in self._open.keys() if t != tid]
+            for t in tids:
+                stack = self._open.get(t, [])
+                for i in range(len(stack)-1, -1, -1):
+                    if stack[i][0] == cat and stack[i][1] == key:
+                        # Close anything left open inside the span, then
+                        # the span itself
+                        for c, _, n, ts, a in reversed(stack[i+1:]):
+                            self._events.append(self._span(
+                                c, n, ts, now, t, dict(a, incomplete=True)))
+                        c, _, n, ts, a = stack[i]
+                        self._events.append(self._span(
+                            c, n, ts, now, t, dict(a, **args)))
+                        del stack[i:]
+                        return
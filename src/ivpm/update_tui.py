@@ -273,6 +273,12 @@ class RichUpdateTUI(UpdateEventListener):
                 self.errors.append((event.package_name, event.error_message))
                 self._update_display()
         
+        elif event.event_type == UpdateEventType.PACKAGE_OUTPUT:
+            status = self.packages.get(event.package_name)
+            if status is not None and not status.completed and event.output.strip():
+                status.progress_message = event.output.strip()
+                self._update_display()
+
         elif event.event_type == UpdateEventType.UPDATE_COMPLETE:
             self.total_packages = event.total_packages
             self.cache_hits = event.cache_hits
@@ -3,12 +3,14 @@ Created on Jun 22, 2021
 
 @author: mballance
 '''
+import concurrent.futures
 import logging
 import os
+import stat
 import sys
 import shutil
 import subprocess
-from typing import List
+from typing import List, Optional
 from ivpm.msg import note, fatal, warning
 from ivpm.site_config import get_site_config
 from pathlib import Path
@@ -222,3 +224,57 @@ def getlocstr(e):
         return "<no-srcinfo>"
     pass
     
+
+
+_WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+def make_tree_readonly(path : str, dir_mode : Optional[int] = None,
+                       files : bool = True, jobs : Optional[int] = None):
+    """Clear the write bits of the files in the tree at 'path'.
+
+    Directories are set to 'dir_mode', or have their write bits cleared
+    when it is None. With files=False only directories are changed, for
+    trees whose files were written read-only in the first place.
+
+    Directories are scanned in parallel ('jobs' threads) with os.scandir(),
+    and an entry is only chmod-ed if its mode changes, which is what makes
+    this affordable on NFS. Entries that cannot be chmod-ed (eg owned by
+    another user) are skipped.
+    """
+    def chmod(p, mode, new_mode):
+        if stat.S_IMODE(mode) != new_mode:
+            try:
+                os.chmod(p, new_mode)
+            except OSError:
+                pass
+
+    def visit(dir_path):
+        subdirs = []
+        try:
+            mode = os.stat(dir_path).st_mode
+            chmod(dir_path, mode,
+                  dir_mode if dir_mode is not None else stat.S_IMODE(mode) & ~_WRITE_BITS)
+            with os.scandir(dir_path) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        subdirs.append(e.path)
+                    elif files and e.is_file(follow_symlinks=False):
+                        mode = e.stat(follow_symlinks=False).st_mode
+                        chmod(e.path, mode, stat.S_IMODE(mode) & ~_WRITE_BITS)
+        except OSError as e:
+            _logger.debug("Not making %s read-only: %s", dir_path, e)
+        return subdirs
+
+    if not os.path.isdir(path):
+        if files and os.path.isfile(path):
+            mode = os.stat(path).st_mode
+            chmod(path, mode, stat.S_IMODE(mode) & ~_WRITE_BITS)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        pending = {pool.submit(visit, path)}
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                pending.update(pool.submit(visit, d) for d in f.result())
@@ -0,0 +1,236 @@
+#****************************************************************************
+#* workspace_fingerprint.py
+#*
+#* Copyright 2024 Matthew Ballance and Contributors
+#*
+#* Licensed under the Apache License, Version 2.0 (the "License"); you may
+#* not use this file except in compliance with the License.  You may obtain
+#* a copy of the License at:
+#*
+#*   http://www.apache.org/licenses/LICENSE-2.0
+#*
+#* Unless required by applicable law or agreed to in writing, software
+#* distributed under the License is distributed on an "AS IS" BASIS,
+#* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#* See the License for the specific language governing permissions and
+#* limitations under the License.
+#*
+#****************************************************************************
+"""
+workspace_fingerprint.py — detect a no-op ``ivpm update``.
+
+After a successful update, a digest of everything the update depended on
+is stored in ``<deps_dir>/ivpm.json`` under ``"fingerprint"``:
+
+* the content of the root ivpm.yaml and every file it includes,
+* the content of ``package-lock.json`` (and of ``--lock-file``, if given),
+* the update options that affect the result,
+* the top-level entries of the deps-dir (name, inode, mtime, link target)
+  and the ``ivpm.yaml`` of each package directory,
+* paths outside the deps-dir that handlers read or wrote (see
+  ``PackageHandler.get_fingerprint_paths()``), and
+* the ivpm version and ``IVPM_CACHE``.
+
+A later update whose inputs produce the same digest has nothing to do, and
+can return without parsing ivpm.yaml, visiting packages or running
+handlers. The deps-dir holding the fingerprint is found by scanning the
+root ivpm.yaml's text for ``deps-dir:`` (else ``packages``); since the
+digest covers that file, a wrong guess can only miss the fast path.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import List, Optional
+
+_logger = logging.getLogger("ivpm.workspace_fingerprint")
+
+# Update options that do not change the resulting workspace
+_IGNORED_ARGS = {
+    "func", "project_dir", "jobs", "net_jobs", "unpack_jobs", "handler_jobs",
+    "profile_out", "verify", "verbose", "log_level", "ref_ttl",
+    "dissociate",
+}
+
+# Options that request work regardless of workspace state
+_FORCING_ARGS = ("force_py_install", "refresh_all", "force")
+
+# deps-dir entries written after the fingerprint is taken
+_IGNORED_ENTRIES = {"ivpm.json"}
+
+
+def update_inputs(args, **kwargs) -> dict:
+    """Collect the update options relevant to the fingerprint.
+
+    *kwargs* are the explicit ``ProjectOps.update()`` parameters (dep-set,
+    lock file, variable overrides...), which take precedence over *args*.
+    """
+    ret = {}
+    if args is not None and hasattr(args, "__dict__"):
+        for k, v in vars(args).items():
+            if k not in _IGNORED_ARGS and not k.startswith("_"):
+                ret[k] = v
+    ret.update(kwargs)
+    return ret
+
+
+def is_forced(inputs: dict) -> bool:
+    """True if the options ask for work even when nothing changed."""
+    return any(inputs.get(k) for k in _FORCING_ARGS)
+
+
+def _file_digest(h, path: str):
+    try:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    except OSError:
+        h.update(b"<missing>")
+
+
+def _path_digest(h, path: str):
+    """Digest a handler path: content for files; entry names and link
+    targets for directories."""
+    if os.path.isfile(path):
+        _file_digest(h, path)
+    elif os.path.isdir(path):
+        for e in sorted(os.scandir(path), key=lambda e: e.name):
+            h.update(b"\0" + e.name.encode())
+            if e.is_symlink():
+                h.update(b"->" + os.readlink(e.path).encode())
+            elif e.is_dir():
+                h.update(b"/")
+    else:
+        h.update(b"<missing>")
+
+
+def compute_fingerprint(root_dir: str,
+                        deps_dir: str,
+                        source_files: List[str],
+                        inputs: dict,
+                        paths: List[str] = ()) -> str:
+    """Return the fingerprint digest for the current workspace state.
+
+    *source_files* and *paths* are relative to *root_dir* (or absolute).
+    """
+    from .__version__ import _pkg_version
+
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "ivpm": _pkg_version,
+        "cache": os.environ.get("IVPM_CACHE"),
+        "inputs": inputs,
+    }, sort_keys=True, default=str).encode())
+
+    for f in source_files:
+        h.update(b"\0file\0" + f.encode())
+        _file_digest(h, os.path.join(root_dir, f))
+
+    _file_digest(h, os.path.join(deps_dir, "package-lock.json"))
+    lock_file = inputs.get("lock_file")
+    if lock_file:
+        _file_digest(h, os.path.join(root_dir, lock_file))
+
+    for p in paths:
+        h.update(b"\0path\0" + p.encode())
+        _path_digest(h, os.path.join(root_dir, p))
+
+    try:
+        entries = sorted(os.scandir(deps_dir), key=lambda e: e.name)
+    except OSError:
+        entries = []
+    for e in entries:
+        if e.name in _IGNORED_ENTRIES:
+            continue
+        st = e.stat(follow_symlinks=False)
+        h.update(("\0entry\0%s\0%d\0%d\0%o" % (
+            e.name, st.st_ino, st.st_mtime_ns, st.st_mode)).encode())
+        if e.is_symlink():
+            h.update(os.readlink(e.path).encode())
+        if e.is_dir():
+            # A package's own ivpm.yaml decides which deps it pulls in
+            try:
+                yst = os.stat(os.path.join(e.path, "ivpm.yaml"))
+                h.update(("\0yaml\0%d\0%d" % (
+                    yst.st_mtime_ns, yst.st_size)).encode())
+            except OSError:
+                pass
+
+    return h.hexdigest()
+
+
+def _relpaths(root_dir: str, paths: List[str]) -> List[str]:
+    ret = []
+    for p in paths:
+        rel = os.path.relpath(p, root_dir)
+        ret.append(p if rel.startswith("..") else rel)
+    return ret
+
+
+def make_fingerprint(root_dir: str,
+                     deps_dir: str,
+                     source_files: List[str],
+                     inputs: dict,
+                     paths: List[str] = ()) -> dict:
+    """Build the ``ivpm.json`` fingerprint entry after a successful update."""
+    files = _relpaths(root_dir, source_files)
+    paths = _relpaths(root_dir, paths)
+    return {
+        "deps-dir": os.path.relpath(deps_dir, root_dir),
+        "files": files,
+        "paths": paths,
+        "digest": compute_fingerprint(root_dir, deps_dir, files, inputs, paths),
+    }
+
+
+_DEPS_DIR_RE = re.compile(r"^\s*deps-dir\s*:\s*[\"']?([^\"'#\s]+)", re.MULTILINE)
+
+
+def _deps_dir_candidates(root_dir: str) -> List[str]:
+    """Return the deps-dirs the root ivpm.yaml may configure, without
+    parsing it: the ``deps-dir:`` values in its text, then the default."""
+    ret = []
+    try:
+        with open(os.path.join(root_dir, "ivpm.yaml")) as fp:
+            ret = [d for d in _DEPS_DIR_RE.findall(fp.read()) if "$" not in d]
+    except OSError:
+        pass
+    if "packages" not in ret:
+        ret.append("packages")
+    return ret
+
+
+def check_fingerprint(root_dir: str, inputs: dict,
+                      deps_dir: Optional[str] = None) -> bool:
+    """Return True if the workspace matches the fingerprint in the
+    ivpm.json of 'deps_dir' (absolute or relative to 'root_dir'). By
+    default the deps-dir is looked up without parsing ivpm.yaml (see
+    _deps_dir_candidates())."""
+    if is_forced(inputs):
+        return False
+    if deps_dir is None:
+        return any(check_fingerprint(root_dir, inputs, d)
+                   for d in _deps_dir_candidates(root_dir))
+    deps_dir = os.path.normpath(os.path.join(root_dir, deps_dir))
+    ivpm_json = os.path.join(deps_dir, "ivpm.json")
+    if not os.path.isfile(ivpm_json):
+        return False
+    try:
+        with open(ivpm_json) as fp:
+            fingerprint = json.load(fp).get("fingerprint")
+    except Exception as e:
+        _logger.debug("Could not read %s: %s", ivpm_json, e)
+        return False
+    if not isinstance(fingerprint, dict) or "digest" not in fingerprint.keys():
+        return False
+    recorded = os.path.join(root_dir, fingerprint.get("deps-dir", ""))
+    if os.path.normpath(recorded) != deps_dir:
+        return False
+
+    digest = compute_fingerprint(
+        root_dir, deps_dir, fingerprint.get("files", []), inputs,
+        fingerprint.get("paths", []))
+    _logger.debug("Workspace fingerprint: %s (recorded %s)",
+                  digest, fingerprint["digest"])
+    return digest == fingerprint["digest"]
@@ -14,7 +14,8 @@ SRCDIR = os.path.join(ROOTDIR, 'src')
 import sys
 sys.path.insert(0, SRCDIR)
 
-from ivpm.cache import Cache, is_github_url, parse_github_url, CacheResult
+from ivpm.cache import Cache, is_github_url, parse_github_url, parse_size, CacheResult
+from ivpm.package_lock import locked_cache_versions
 from ivpm.project_ops_info import ProjectUpdateInfo
 
 
@@ -213,6 +214,424 @@ class TestCache(unittest.TestCase):
         self.assertTrue(self.cache.has_version("pkg1", "v2"))
 
 
+class TestCacheObjects(unittest.TestCase):
+    """Versions stored through the content-addressed object store."""
+
+    setUp = TestCache.setUp
+    tearDown = TestCache.tearDown
+
+    def _store(self, version, files):
+        source_dir = os.path.join(self.test_dir, "source-" + version)
+        for name, (content, mode) in files.items():
+            path = os.path.join(source_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+            os.chmod(path, mode)
+        return self.cache.store_version("pkg", version, source_dir)
+
+    def test_identical_files_shared(self):
+        big = "x" * 100000
+        v1 = self._store("v1", {"big.bin": (big, 0o644), "a.txt": ("one", 0o644)})
+        v2 = self._store("v2", {"big.bin": (big, 0o644), "a.txt": ("two", 0o644),
+                                "sub/big.bin": (big, 0o644)})
+        ino = os.stat(os.path.join(v1, "big.bin")).st_ino
+        self.assertEqual(os.stat(os.path.join(v2, "big.bin")).st_ino, ino)
+        self.assertEqual(os.stat(os.path.join(v2, "sub", "big.bin")).st_ino, ino)
+        self.assertNotEqual(os.stat(os.path.join(v1, "a.txt")).st_ino,
+                            os.stat(os.path.join(v2, "a.txt")).st_ino)
+
+        manifest = self.cache.read_manifest("pkg", "v2")
+        self.assertEqual(manifest["files"]["sub/big.bin"]["size"], len(big))
+        self.assertEqual(manifest["files"]["big.bin"]["digest"],
+                         manifest["files"]["sub/big.bin"]["digest"])
+
+        info = self.cache.get_cache_info()
+        self.assertEqual(info["total_size"], 3 * len(big) + 6)
+        self.assertEqual(info["physical_size"], len(big) + 6)
+        self.assertEqual(info["packages"][0]["physical_size"], len(big) + 6)
+
+    def test_executable_kept_apart(self):
+        v1 = self._store("v1", {"run.sh": ("echo", 0o755)})
+        v2 = self._store("v2", {"run.sh": ("echo", 0o644)})
+        self.assertTrue(os.stat(os.path.join(v1, "run.sh")).st_mode & stat.S_IXUSR)
+        self.assertFalse(os.stat(os.path.join(v2, "run.sh")).st_mode & stat.S_IXUSR)
+        self.assertTrue(self.cache.read_manifest("pkg", "v1")["files"]["run.sh"]["x"])
+
+    def test_clean_prunes_objects(self):
+        import time
+        v1 = self._store("v1", {"old.txt": ("old", 0o644), "both.txt": ("both", 0o644)})
+        v2 = self._store("v2", {"both.txt": ("both", 0o644)})
+        old_time = time.time() - (10 * 24 * 60 * 60)
+        os.utime(v1, (old_time, old_time))
+
+        self.assertEqual(self.cache.clean_older_than(7), 1)
+        self.assertFalse(os.path.exists(self.cache.get_manifest_path("pkg", "v1")))
+        info = self.cache.get_cache_info()
+        self.assertEqual(info["physical_size"], len("both"))
+        # The shared file stays read-only in the surviving version
+        self.assertFalse(os.stat(os.path.join(v2, "both.txt")).st_mode & stat.S_IWUSR)
+
+    def test_without_hardlinks(self):
+        import errno
+        with patch("os.link", side_effect=OSError(errno.EXDEV, "cross-device")):
+            v1 = self._store("v1", {"a.txt": ("same", 0o644)})
+            v2 = self._store("v2", {"a.txt": ("same", 0o644)})
+        with open(os.path.join(v2, "a.txt")) as f:
+            self.assertEqual(f.read(), "same")
+        self.assertIsNotNone(self.cache.read_manifest("pkg", "v1"))
+        info = self.cache.get_cache_info()
+        self.assertEqual(info["physical_size"], info["total_size"])
+
+
+    def test_stored_read_only(self):
+        import errno
+        v1 = self._store("v1", {"a.txt": ("one", 0o664), "sub/run.sh": ("echo", 0o775)})
+        with patch("os.link", side_effect=OSError(errno.EXDEV, "cross-device")):
+            v2 = self._store("v2", {"a.txt": ("two", 0o664), "sub/b.txt": ("b", 0o644)})
+        for version_dir in (v1, v2):
+            for root, dirs, files in os.walk(version_dir):
+                self.assertEqual(stat.S_IMODE(os.stat(root).st_mode) & 0o777, 0o775)
+                for name in files:
+                    mode = os.stat(os.path.join(root, name)).st_mode
+                    self.assertFalse(mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        self.assertTrue(os.stat(os.path.join(v1, "sub", "run.sh")).st_mode & stat.S_IXUSR)
+
+        # The index data gathered while storing matches a scan of the tree
+        indexed = {r["version"]: r for r in self.cache.index.versions()}
+        blobs = {}
+        for pkg, version, inode, size in self.cache.index.blobs():
+            blobs.setdefault(version, {})[inode] = size
+        for version in ("v1", "v2"):
+            record, scanned = self.cache._scan_version("pkg", version, 0)
+            for field in ("size", "files", "unshared_size", "digest"):
+                self.assertEqual(indexed[version][field], record[field])
+            self.assertEqual(blobs.get(version, {}), scanned)
+
+    def test_remove_locked_down_dirs(self):
+        import time
+        v1 = self._store("v1", {"sub/both.txt": ("both", 0o644), "sub/old.txt": ("old", 0o644)})
+        v2 = self._store("v2", {"both.txt": ("both", 0o644)})
+        # Directories locked down by hand, or by an older IVPM
+        os.chmod(os.path.join(v1, "sub"), 0o555)
+        os.chmod(v1, 0o555)
+        old_time = time.time() - (10 * 24 * 60 * 60)
+        os.utime(v1, (old_time, old_time))
+
+        chmods = []
+        chmod = os.chmod
+        with patch("os.chmod", side_effect=lambda p, m: (chmods.append(p), chmod(p, m))):
+            self.assertEqual(self.cache.clean_older_than(7), 1)
+        self.assertFalse(os.path.exists(v1))
+        # Files are not chmod-ed, at most directories (not for root)
+        self.assertLessEqual(set(chmods), {v1, os.path.join(v1, "sub")})
+        self.assertFalse(os.stat(os.path.join(v2, "both.txt")).st_mode & stat.S_IWUSR)
+
+
+class TestCacheGc(unittest.TestCase):
+    """Size-budgeted eviction of least-recently-used versions."""
+
+    setUp = TestCache.setUp
+    tearDown = TestCache.tearDown
+
+    def _store(self, version, content, age_days, pkg="pkg"):
+        import time
+        source_dir = os.path.join(self.test_dir, "source-%s-%s" % (pkg, version))
+        os.makedirs(source_dir)
+        with open(os.path.join(source_dir, "data.bin"), "w") as f:
+            f.write(content)
+        t = time.time() - age_days * 24 * 60 * 60
+        with patch("ivpm.cache.time.time", return_value=t):
+            return self.cache.store_version(pkg, version, source_dir)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("1024"), 1024)
+        self.assertEqual(parse_size("500M"), 500 << 20)
+        self.assertEqual(parse_size("200G"), 200 << 30)
+        self.assertEqual(parse_size("1.5t"), int(1.5 * (1 << 40)))
+        self.assertEqual(parse_size("2GiB"), 2 << 30)
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+    def test_evicts_least_recently_used(self):
+        self._store("v1", "1" * 1000, age_days=30)
+        self._store("v2", "2" * 1000, age_days=20)
+        self._store("v3", "3" * 1000, age_days=10)
+        # v1 is old, but was linked into a (since deleted) workspace today
+        self.cache.record_use("pkg", "v1")
+
+        result = self.cache.gc(2000)
+        self.assertEqual(result["removed"], [("pkg", "v2")])
+        self.assertEqual(result["freed"], 1000)
+        self.assertEqual(result["physical_size"], 2000)
+        self.assertFalse(self.cache.has_version("pkg", "v2"))
+        self.assertFalse(os.path.exists(self.cache.get_manifest_path("pkg", "v2")))
+        self.assertEqual(self.cache.get_cache_info()["physical_size"], 2000)
+
+        # Within budget: nothing to do
+        self.assertEqual(self.cache.gc(2000)["removed"], [])
+
+    def test_shared_files_counted_once(self):
+        shared = "s" * 1000
+        self._store("v1", shared, age_days=30)
+        self._store("v2", shared, age_days=20)
+        self._store("v3", "3" * 1000, age_days=10)
+
+        # Removing v1 frees nothing while v2 still links the same file
+        result = self.cache.gc(1000)
+        self.assertEqual(result["removed"], [("pkg", "v1"), ("pkg", "v2")])
+        self.assertEqual(result["freed"], 1000)
+        self.assertEqual(self.cache.get_cache_info()["physical_size"], 1000)
+
+    def test_keeps_versions_linked_from_workspaces(self):
+        self._store("v1", "1" * 1000, age_days=30)
+        self._store("v2", "2" * 1000, age_days=20)
+        self.cache.link_to_deps("pkg", "v1", self.deps_dir)
+
+        # A new process, as 'ivpm cache gc' is
+        result = Cache(self.cache_dir).gc(0)
+        self.assertEqual(result["removed"], [("pkg", "v2")])
+        self.assertTrue(self.cache.has_version("pkg", "v1"))
+
+        # Once the workspace is gone its versions can go too
+        os.unlink(os.path.join(self.deps_dir, "pkg"))
+        os.rmdir(self.deps_dir)
+        result = Cache(self.cache_dir).gc(0)
+        self.assertEqual(result["removed"], [("pkg", "v1")])
+        self.assertEqual(result["physical_size"], 0)
+        self.assertEqual(self.cache.index.workspaces(), [])
+
+    def test_mirrors_counted_and_evicted(self):
+        import time
+        mirrors = []
+        for i, age_days in enumerate((30, 20, 10)):
+            mirror = self.cache.get_mirror_dir("https://example.com/repo%d.git" % i)
+            os.makedirs(os.path.join(mirror, "objects", "info"))
+            with open(os.path.join(mirror, "objects", "pack.bin"), "w") as f:
+                f.write("m" * 1000)
+            t = time.time() - age_days * 24 * 60 * 60
+            with open(os.path.join(mirror, "FETCH_HEAD"), "w") as f:
+                pass
+            os.utime(os.path.join(mirror, "FETCH_HEAD"), (t, t))
+            mirrors.append(mirror)
+        self._store("v1", "1" * 1000, age_days=25)
+
+        # An editable clone in a workspace borrows from the oldest mirror
+        alternates = os.path.join(self.deps_dir, "repo0", ".git", "objects", "info", "alternates")
+        os.makedirs(os.path.dirname(alternates))
+        with open(alternates, "w") as f:
+            f.write(os.path.join(mirrors[0], "objects") + "\n")
+        self.cache.register_workspace(self.deps_dir)
+
+        result = Cache(self.cache_dir).gc(2000)
+        self.assertEqual(result["mirrors_removed"], [os.path.basename(mirrors[1])])
+        self.assertEqual(result["removed"], [("pkg", "v1")])
+        self.assertEqual(result["freed"], 2000)
+        self.assertEqual(result["mirror_size"], 2000)
+        self.assertEqual(result["physical_size"], 2000)
+        self.assertTrue(os.path.isdir(mirrors[0]))
+        self.assertFalse(os.path.exists(mirrors[1]))
+        self.assertTrue(os.path.isdir(mirrors[2]))
+
+    def test_keeps_versions_of_lock_files(self):
+        commit = "a" * 40
+        self._store(commit + "-sparse-0123456789ab", "1" * 1000, age_days=30)
+        self._store("b" * 40, "2" * 1000, age_days=20)
+        self._store("Mon_01_Jan_2024_00-00-00_GMT", "3" * 1000, age_days=30, pkg="tool")
+        lock = {"packages": {
+            "pkg": {"src": "git", "commit_resolved": commit},
+            "tool": {"src": "http", "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"},
+        }}
+
+        result = self.cache.gc(0, keep_versions=locked_cache_versions(lock))
+        self.assertEqual(result["removed"], [("pkg", "b" * 40)])
+        self.assertEqual(result["physical_size"], 2000)
+
+    def test_deps_source_hit_recorded(self):
+        import types
+        self._store("v1", "1" * 1000, age_days=30)
+        self.cache.link_to_deps("pkg", "v1", self.deps_dir)
+        child_deps = os.path.join(self.test_dir, "child-deps")
+        info = ProjectUpdateInfo(None, child_deps, cache=self.cache)
+        info._materialize_from_deps_source(
+            types.SimpleNamespace(name="pkg"), os.path.join(self.deps_dir, "pkg"))
+
+        record = self.cache.index.versions()[0]
+        self.assertGreater(record["last_used"], record["created"])
+        self.assertIn(os.path.realpath(child_deps), self.cache.index.workspaces())
+        self.assertEqual(Cache(self.cache_dir).gc(0)["removed"], [])
+
+
+class TestCacheIndex(unittest.TestCase):
+    """The SQLite metadata index of the cache."""
+
+    setUp = TestCache.setUp
+    tearDown = TestCache.tearDown
+
+    def _store(self, version, content, pkg="pkg"):
+        source_dir = os.path.join(self.test_dir, "source-%s-%s" % (pkg, version))
+        os.makedirs(os.path.join(source_dir, "sub"))
+        for name in ("a.txt", "sub/b.txt"):
+            with open(os.path.join(source_dir, name), "w") as f:
+                f.write(content)
+        return self.cache.store_version(pkg, version, source_dir,
+                                        source_url="https://example.com/%s.git" % pkg)
+
+    def test_store_updates_index(self):
+        self._store("v1", "x" * 100)
+        self._store("v2", "x" * 100)
+        self.assertTrue(self.cache.index.is_complete())
+        record = self.cache.index.versions()[0]
+        self.assertEqual((record["package"], record["version"]), ("pkg", "v1"))
+        self.assertEqual((record["size"], record["files"]), (200, 2))
+        self.assertEqual(record["source_url"], "https://example.com/pkg.git")
+        self.assertEqual(len(record["digest"]), 64)
+
+        # Info and lookups need no walk of the cached trees
+        with patch("os.walk", side_effect=AssertionError("walked")):
+            info = self.cache.get_cache_info()
+            self.assertTrue(self.cache.has_version("pkg", "v2"))
+            self.assertFalse(self.cache.has_version("pkg", "v3"))
+        self.assertEqual(info["total_size"], 400)
+        self.assertEqual(info["physical_size"], 100)
+        self.assertEqual(info["packages"][0]["physical_size"], 100)
+        self.assertEqual(info["packages"][0]["versions"][1]["files"], 2)
+
+    def test_existing_cache_reindexed(self):
+        # Versions stored before the index existed
+        v1 = self.cache.get_version_cache_dir("old", "v1")
+        os.makedirs(v1)
+        with open(os.path.join(v1, "a.txt"), "w") as f:
+            f.write("content")
+        self._store("v1", "new")
+        self.assertFalse(self.cache.index.is_complete())
+        self.assertTrue(self.cache.has_version("old", "v1"))
+        self.assertFalse(self.cache.has_version("old", "v2"))
+
+        self.cache.record_use("pkg", "v1")
+        used = self.cache.index.versions()[0]["last_used"]
+        self.assertEqual(self.cache.reindex(), 2)
+        self.assertTrue(self.cache.index.is_complete())
+        records = {r["package"]: r for r in self.cache.index.versions()}
+        self.assertEqual(records["old"]["size"], len("content"))
+        self.assertIsNone(records["old"]["digest"])
+        # What only the index knew is kept
+        self.assertEqual(records["pkg"]["last_used"], used)
+        self.assertEqual(records["pkg"]["source_url"], "https://example.com/pkg.git")
+
+    def test_info_builds_index(self):
+        v1 = self.cache.get_version_cache_dir("old", "v1")
+        os.makedirs(v1)
+        with open(os.path.join(v1, "a.txt"), "w") as f:
+            f.write("content")
+        self.assertFalse(self.cache.index.exists())
+        self.assertEqual(self.cache.get_cache_info()["total_size"], len("content"))
+        self.assertTrue(self.cache.index.is_complete())
+
+    def test_clean_updates_index(self):
+        import time
+        v1 = self._store("v1", "one")
+        self._store("v2", "two")
+        old_time = time.time() - (10 * 24 * 60 * 60)
+        os.utime(v1, (old_time, old_time))
+        self.assertEqual(self.cache.clean_older_than(7), 1)
+        self.assertEqual([r["version"] for r in self.cache.index.versions()], ["v2"])
+        self.assertFalse(self.cache.has_version("pkg", "v1"))
+
+    def test_removed_version_not_reported(self):
+        v1 = self._store("v1", "one")
+        # Removed behind the index's back
+        os.chmod(v1, 0o755)
+        shutil.rmtree(v1)
+        self.assertFalse(self.cache.has_version("pkg", "v1"))
+        self.assertEqual(self.cache.index.versions(), [])
+        self.assertTrue(self.cache.index.is_complete())
+
+    def test_unusable_index(self):
+        self._store("v1", "one")
+        with patch("ivpm.cache_index.sqlite3.connect",
+                   side_effect=__import__("sqlite3").OperationalError("locked")):
+            self.assertTrue(self.cache.has_version("pkg", "v1"))
+            self.assertEqual(self.cache.get_cache_info()["total_size"], 6)
+
+
+class TestReadOnlyTrees(unittest.TestCase):
+    """Locking down trees without a chmod per file after the fact."""
+
+    setUp = TestCache.setUp
+    tearDown = TestCache.tearDown
+
+    def _tree(self):
+        root = os.path.join(self.test_dir, "tree")
+        for i in range(3):
+            os.makedirs(os.path.join(root, "d%d" % i, "sub"))
+            for name in ("a.txt", "sub/b.txt"):
+                with open(os.path.join(root, "d%d" % i, name), "w") as f:
+                    f.write(name)
+        os.symlink("a.txt", os.path.join(root, "d0", "link"))
+        return root
+
+    def _modes(self, root):
+        modes = {}
+        for path, dirs, files in os.walk(root):
+            for name in dirs + files:
+                p = os.path.join(path, name)
+                modes[os.path.relpath(p, root)] = stat.S_IMODE(os.lstat(p).st_mode)
+        return modes
+
+    def test_make_tree_readonly(self):
+        from ivpm.utils import make_tree_readonly
+        root = self._tree()
+        os.chmod(os.path.join(root, "d1", "a.txt"), 0o444)
+        chmods = []
+        chmod = os.chmod
+        with patch("os.chmod", side_effect=lambda p, m: (chmods.append(p), chmod(p, m))):
+            make_tree_readonly(root, dir_mode=0o2775)
+        for rel, mode in self._modes(root).items():
+            if os.path.isdir(os.path.join(root, rel)):
+                self.assertEqual(mode & 0o777, 0o775, rel)
+            elif not os.path.islink(os.path.join(root, rel)):
+                self.assertFalse(mode & 0o222, rel)
+        # Already read-only: left alone
+        self.assertNotIn(os.path.join(root, "d1", "a.txt"), chmods)
+
+        make_tree_readonly(root, files=False)
+        modes = self._modes(root)
+        self.assertEqual(modes["d2/sub"] & 0o777, 0o555)
+
+    def test_install_readonly(self):
+        import tarfile
+        import zipfile
+        from ivpm.pkg_types.package_file import PackageFile
+        src = self._tree()
+        tgz = os.path.join(self.test_dir, "pkg.tar.gz")
+        with tarfile.open(tgz, "w:gz") as tf:
+            tf.add(src, arcname="pkg-1.0")
+        zf_path = os.path.join(self.test_dir, "pkg.zip")
+        with zipfile.ZipFile(zf_path, "w") as zf:
+            for path, dirs, files in os.walk(src):
+                for name in files:
+                    p = os.path.join(path, name)
+                    zf.write(p, os.path.relpath(p, src))
+
+        for archive, src_type in ((tgz, ".tar.gz"), (zf_path, ".zip")):
+            pkg = PackageFile("pkg")
+            pkg.src_type = src_type
+            dest = os.path.join(self.test_dir, "unpacked" + src_type)
+            pkg._install(archive, dest, readonly=True)
+            b_txt = os.path.join(dest, "d1", "sub", "b.txt")
+            with open(b_txt) as f:
+                self.assertEqual(f.read(), "sub/b.txt")
+            self.assertFalse(os.stat(b_txt).st_mode & 0o222, src_type)
+            # Directories stay writable until the caller locks them down
+            self.assertTrue(os.stat(os.path.dirname(b_txt)).st_mode & stat.S_IWUSR)
+
+            writable = os.path.join(self.test_dir, "writable" + src_type)
+            pkg._install(archive, writable)
+            self.assertTrue(os.stat(os.path.join(writable, "d1", "sub", "b.txt")).st_mode
+                            & stat.S_IWUSR)
+
+
 class TestCacheGit(TestBase):
     """Test git caching integration."""
     
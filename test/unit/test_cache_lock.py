@@ -0,0 +1,205 @@
+"""
+Tests for the cross-process locks that let one process populate a cache
+entry while others wait for it.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from ivpm.cache import Cache
+from ivpm.cache_lock import CacheLock, STALE_AFTER
+from ivpm.pkg_types.package_git import PackageGit
+from ivpm.project_ops_info import ProjectUpdateInfo
+
+SRCDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), "src")
+
+_HOLDER = """
+import sys
+sys.path.insert(0, %r)
+from ivpm.cache_lock import CacheLock
+lock = CacheLock(sys.argv[1], "pkg", "v1")
+lock.acquire()
+print("locked", flush=True)
+sys.stdin.read()
+"""
+
+
+class TestCacheLock(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-lock-")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def test_other_process(self):
+        holder = subprocess.Popen(
+            [sys.executable, "-c", _HOLDER % SRCDIR, self._dir],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(holder.stdout.readline().strip(), "locked")
+            lock = CacheLock(self._dir, "pkg", "v1", timeout=0.3)
+            self.assertFalse(lock.acquire())
+            lock.release()
+            # Other versions are not held up
+            with CacheLock(self._dir, "pkg", "v2", timeout=0.3) as other:
+                self.assertTrue(other.acquired)
+        finally:
+            holder.stdin.close()
+            holder.wait()
+        # Released when the holder exits
+        with CacheLock(self._dir, "pkg", "v1", timeout=5) as lock:
+            self.assertTrue(lock.acquired)
+
+    def test_other_thread(self):
+        held = threading.Event()
+        done = threading.Event()
+
+        def hold():
+            with CacheLock(self._dir, "pkg", "v1"):
+                held.set()
+                done.wait(5)
+        t = threading.Thread(target=hold)
+        t.start()
+        held.wait(5)
+        try:
+            self.assertFalse(CacheLock(self._dir, "pkg", "v1", timeout=0.2).acquire())
+        finally:
+            done.set()
+            t.join()
+        self.assertTrue(CacheLock(self._dir, "pkg", "v1", timeout=0.2).acquire())
+
+
+@mock.patch("ivpm.cache_lock.fcntl", None)
+class TestCacheLockFile(unittest.TestCase):
+    """The lock-file fallback for file systems without fcntl locks."""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-lock-")
+        self.lock_file = os.path.join(self._dir, ".locks", "pkg", "v1.lck")
+        os.makedirs(os.path.dirname(self.lock_file))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _held_by(self, pid, age=0):
+        with open(self.lock_file, "w") as fp:
+            fp.write("%s %d\n" % (socket.gethostname(), pid))
+        t = time.time() - age
+        os.utime(self.lock_file, (t, t))
+
+    def test_acquire_release(self):
+        lock = CacheLock(self._dir, "pkg", "v1")
+        self.assertTrue(lock.acquire())
+        self.assertTrue(os.path.isfile(self.lock_file))
+        self.assertEqual(os.listdir(os.path.dirname(self.lock_file)), ["v1.lck"])
+        lock.release()
+        self.assertFalse(os.path.exists(self.lock_file))
+
+    def test_live_holder_waited_for(self):
+        self._held_by(os.getppid())
+        self.assertFalse(CacheLock(self._dir, "pkg", "v1", timeout=0.2).acquire())
+        self.assertTrue(os.path.isfile(self.lock_file))
+
+    def test_stale_locks_broken(self):
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        self._held_by(dead.pid)
+        lock = CacheLock(self._dir, "pkg", "v1", timeout=1)
+        self.assertTrue(lock.acquire())
+        lock.release()
+
+        # A holder on another host that stopped touching its lock
+        with open(self.lock_file, "w") as fp:
+            fp.write("elsewhere 1\n")
+        t = time.time() - STALE_AFTER - 1
+        os.utime(self.lock_file, (t, t))
+        self.assertTrue(CacheLock(self._dir, "pkg", "v1", timeout=1).acquire())
+
+    def test_lock_retaken_before_break_kept(self):
+        # The stale lock this waiter saw was broken by another waiter, and
+        # a live holder has taken the lock since
+        self._held_by(os.getppid())
+        is_stale = CacheLock._is_stale
+        seen = []
+
+        def stale_once(lock_file):
+            seen.append(lock_file)
+            return len(seen) == 1 or is_stale(lock_file)
+        with mock.patch.object(CacheLock, "_is_stale", side_effect=stale_once):
+            self.assertFalse(CacheLock(self._dir, "pkg", "v1", timeout=0.1).acquire())
+        with open(self.lock_file) as fp:
+            self.assertEqual(fp.read().split(), [socket.gethostname(), str(os.getppid())])
+        self.assertEqual(os.listdir(os.path.dirname(self.lock_file)), ["v1.lck"])
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Concurrent cache misses on one version fetch it once."""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-lock-")
+        self.repo = os.path.join(self._dir, "repo")
+        os.makedirs(self.repo)
+        self._git("init", "-q", "-b", "main")
+        with open(os.path.join(self.repo, "file.txt"), "w") as fp:
+            fp.write("content\n")
+        self._git("add", "-A")
+        self._git("commit", "-q", "-m", "one")
+        self.cache = Cache(os.path.join(self._dir, "cache"))
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(self._dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, 0o755)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, *args):
+        subprocess.check_call(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=self.repo)
+
+    def _update(self, workspace, results):
+        deps_dir = os.path.join(self._dir, workspace)
+        os.makedirs(deps_dir)
+        info = ProjectUpdateInfo(None, deps_dir, cache=self.cache)
+        pkg = PackageGit("lib", url="file://" + self.repo, cache=True,
+                         anonymous=True, branch="main")
+        pkg.update(info)
+        results.append((info.cache_hits, info.cache_misses,
+                        os.path.realpath(os.path.join(deps_dir, "lib"))))
+
+    def test_one_fetch(self):
+        fetch = PackageGit._fetch_to_cache
+        fetches = []
+
+        def slow_fetch(pkg, *args):
+            fetches.append(pkg.name)
+            time.sleep(0.3)
+            return fetch(pkg, *args)
+
+        results = []
+        with mock.patch.object(PackageGit, "_fetch_to_cache", slow_fetch):
+            threads = [threading.Thread(target=self._update, args=("ws%d" % i, results))
+                       for i in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(fetches, ["lib"])
+        self.assertEqual(sorted(r[:2] for r in results), [(0, 1)] + [(1, 0)] * 3)
+        self.assertEqual(len(set(r[2] for r in results)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Concurrency stress test for git materialization.
+
+Many ``commit:``-pinned, submodule-bearing local repositories are fetched
+in parallel at full ``--jobs``. Git commands must run with an explicit
+``cwd`` -- a process-wide ``os.chdir`` in one worker thread would send
+another worker's ``git reset``/``git submodule`` into the wrong repo.
+"""
+import argparse
+import os
+import subprocess
+
+from .test_base import TestBase
+
+N_REPOS = 12
+
+
+class TestGitConcurrency(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        # Local file:// submodules are disabled by default in recent git
+        self._saved_env = {
+            k: os.environ.get(k) for k in (
+                "GIT_CONFIG_COUNT", "GIT_CONFIG_KEY_0", "GIT_CONFIG_VALUE_0")}
+        os.environ["GIT_CONFIG_COUNT"] = "1"
+        os.environ["GIT_CONFIG_KEY_0"] = "protocol.file.allow"
+        os.environ["GIT_CONFIG_VALUE_0"] = "always"
+
+    def tearDown(self):
+        for k, v in self._saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        super().tearDown()
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _mk_repo(self, path, content):
+        os.makedirs(path)
+        self._git(path, "init", "-q", "-b", "main")
+        with open(os.path.join(path, "data.txt"), "w") as fp:
+            fp.write(content)
+        self._git(path, "add", "-A")
+        self._git(path, "commit", "-q", "-m", "init")
+
+    def test_parallel_pinned_submodule_clones(self):
+        src_dir = os.path.join(self.testdir, "src")
+        sub_repo = os.path.join(src_dir, "sub")
+        self._mk_repo(sub_repo, "sub")
+
+        pins = {}
+        for i in range(N_REPOS):
+            repo = os.path.join(src_dir, "repo%d" % i)
+            self._mk_repo(repo, "pinned %d" % i)
+            self._git(repo, "submodule", "add", "-q", "file://%s" % sub_repo, "sub")
+            self._git(repo, "commit", "-q", "-m", "add sub")
+            pins[i] = self._git(repo, "rev-parse", "HEAD")
+            # Move the branch past the pinned commit
+            with open(os.path.join(repo, "data.txt"), "w") as fp:
+                fp.write("moved %d" % i)
+            self._git(repo, "commit", "-q", "-a", "-m", "move")
+
+        deps = "".join(
+            "                    - name: repo%d\n"
+            "                      url: file://%s\n"
+            "                      src: git\n"
+            "                      commit: %s\n" % (
+                i, os.path.join(src_dir, "repo%d" % i), pins[i])
+            for i in range(N_REPOS))
+        self.mkFile("ivpm.yaml", (
+            "package:\n"
+            "    name: stress\n"
+            "    dep-sets:\n"
+            "        - name: default-dev\n"
+            "          deps:\n"
+            "%s" % deps))
+
+        cwd = os.getcwd()
+        args = argparse.Namespace(jobs=N_REPOS, anonymous=True)
+        self.ivpm_update(skip_venv=True, args=args)
+        self.assertEqual(os.getcwd(), cwd)
+
+        for i in range(N_REPOS):
+            pkg_dir = os.path.join(self.testdir, "packages", "repo%d" % i)
+            self.assertEqual(self._git(pkg_dir, "rev-parse", "HEAD"), pins[i])
+            with open(os.path.join(pkg_dir, "data.txt")) as fp:
+                self.assertEqual(fp.read(), "pinned %d" % i)
+            with open(os.path.join(pkg_dir, "sub", "data.txt")) as fp:
+                self.assertEqual(fp.read(), "sub")
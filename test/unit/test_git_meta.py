@@ -0,0 +1,81 @@
+"""
+Tests for the in-process reader of git HEAD and refs (git_meta).
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from ivpm import git_meta
+from ivpm.git_meta import head_branch, head_commit
+
+
+class TestGitMeta(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-gitmeta-")
+        self.repo = os.path.join(self._dir, "repo")
+        os.makedirs(self.repo)
+        self._git(self.repo, "init", "-q", "-b", "main")
+        for i in range(2):
+            self._git(self.repo, "commit", "-q", "--allow-empty", "-m", "c%d" % i)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _check(self, path):
+        with mock.patch.object(git_meta.subprocess, "run") as run:
+            commit = head_commit(path)
+        run.assert_not_called()
+        self.assertEqual(commit, self._git(path, "rev-parse", "HEAD"))
+
+    def test_loose_and_packed(self):
+        self._check(self.repo)
+        self.assertEqual(head_branch(self.repo), "main")
+        self._git(self.repo, "pack-refs", "--all")
+        self.assertFalse(os.path.exists(os.path.join(self.repo, ".git", "refs", "heads", "main")))
+        self._check(self.repo)
+
+    def test_detached(self):
+        self._git(self.repo, "checkout", "-q", "--detach", "HEAD~1")
+        self._check(self.repo)
+        self.assertIsNone(head_branch(self.repo))
+
+    def test_worktree_and_gitfile(self):
+        wt = os.path.join(self._dir, "wt")
+        self._git(self.repo, "worktree", "add", "-q", "-b", "topic", wt, "HEAD~1")
+        self._git(self.repo, "pack-refs", "--all")
+        self._check(wt)
+        self.assertEqual(head_branch(wt), "topic")
+
+        sep = os.path.join(self._dir, "sep")
+        self._git(self._dir, "clone", "-q", "--separate-git-dir",
+                  os.path.join(self._dir, "sep.git"), self.repo, sep)
+        self._check(sep)
+
+    def test_unborn_and_missing(self):
+        empty = os.path.join(self._dir, "empty")
+        os.makedirs(empty)
+        self._git(empty, "init", "-q")
+        self.assertIsNone(head_commit(empty))
+        self.assertIsNone(head_commit(os.path.join(self._dir, "nothing")))
+
+    def test_falls_back_to_git(self):
+        os.makedirs(os.path.join(self.repo, ".git", "reftable"))
+        open(os.path.join(self.repo, ".git", "reftable", "tables.list"), "w").close()
+        with mock.patch.object(git_meta.subprocess, "run",
+                               wraps=subprocess.run) as run:
+            commit = head_commit(self.repo)
+        run.assert_called_once()
+        self.assertEqual(commit, self._git(self.repo, "rev-parse", "HEAD"))
+
+
+if __name__ == "__main__":
+    unittest.main()
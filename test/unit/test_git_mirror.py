@@ -0,0 +1,190 @@
+"""
+Tests for the per-remote bare mirrors that ``cache: true`` git packages
+fetch into on a cache miss.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from ivpm.cache import Cache
+from ivpm.pkg_types.package_git import PackageGit
+from ivpm.project_ops_info import ProjectUpdateInfo
+
+
+class _MirrorTestBase(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-mirror-")
+        self.repo = os.path.join(self._dir, "repo")
+        os.makedirs(self.repo)
+        self._git(self.repo, "init", "-q", "-b", "main")
+        for i in range(20):
+            with open(os.path.join(self.repo, "f%d.txt" % i), "w") as fp:
+                fp.write("file %d\n" % i * 50)
+        self._git(self.repo, "add", "-A")
+        self._git(self.repo, "commit", "-q", "-m", "one")
+        self.url = "file://" + self.repo
+        self.cache = Cache(os.path.join(self._dir, "cache"))
+
+    def tearDown(self):
+        # Cached versions are read-only
+        for root, dirs, files in os.walk(self._dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, 0o755)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _update(self, workspace, **kw):
+        deps_dir = os.path.join(self._dir, workspace)
+        os.makedirs(deps_dir)
+        info = ProjectUpdateInfo(None, deps_dir, cache=self.cache)
+        pkg = PackageGit("lib", url=self.url, cache=True, anonymous=True, **kw)
+        pkg.update(info)
+        return pkg, os.path.join(deps_dir, "lib")
+
+    def _mirror_objects(self):
+        out = self._git(self.cache.get_mirror_dir(self.url),
+                        "count-objects", "-v")
+        stats = dict(line.split(": ") for line in out.splitlines())
+        return int(stats["count"]) + int(stats["in-pack"])
+
+
+class TestGitMirror(_MirrorTestBase):
+
+    def test_branch_move_fetches_delta(self):
+        pkg, path = self._update("ws1", branch="main")
+        c1 = pkg.resolved_commit
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), c1)
+        self.assertEqual(self._git(path, "rev-parse", "--abbrev-ref", "HEAD"), "main")
+        self.assertEqual(self._git(path, "rev-parse", "--abbrev-ref", "@{u}"), "origin/main")
+        self.assertEqual(self._git(path, "remote", "get-url", "origin"), self.url)
+        before = self._mirror_objects()
+
+        with open(os.path.join(self.repo, "f0.txt"), "a") as fp:
+            fp.write("changed\n")
+        self._git(self.repo, "commit", "-q", "-a", "-m", "two")
+
+        pkg, path = self._update("ws2", branch="main")
+        self.assertNotEqual(pkg.resolved_commit, c1)
+        self.assertTrue(self.cache.has_version("lib", c1))
+        self.assertTrue(self.cache.has_version("lib", pkg.resolved_commit))
+        with open(os.path.join(path, "f0.txt")) as fp:
+            self.assertTrue(fp.read().endswith("changed\n"))
+        # Only the new commit, its root tree and the changed file
+        self.assertEqual(self._mirror_objects() - before, 3)
+
+    def test_tag_and_head(self):
+        self._git(self.repo, "tag", "-a", "-m", "release", "v1")
+        pkg, path = self._update("ws1", tag="v1")
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), pkg.resolved_commit)
+        pkg, path = self._update("ws2")
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), pkg.resolved_commit)
+
+    def test_shared_by_packages_of_one_remote(self):
+        self.assertEqual(self.cache.get_mirror_dir(self.url),
+                         self.cache.get_mirror_dir(self.url))
+        self.assertNotEqual(self.cache.get_mirror_dir(self.url),
+                            self.cache.get_mirror_dir(self.url + "2"))
+        self._update("ws1", branch="main")
+        self.assertEqual(self.cache.get_cache_info()["packages"][0]["name"], "lib")
+        self.assertEqual(len(self.cache.get_cache_info()["packages"]), 1)
+
+    def test_falls_back_to_clone(self):
+        pkg = PackageGit("lib", url=self.url, cache=True, anonymous=True, branch="main")
+        pkg._fetch_to_mirror = lambda *a: None
+        deps_dir = os.path.join(self._dir, "ws")
+        os.makedirs(deps_dir)
+        pkg.update(ProjectUpdateInfo(None, deps_dir, cache=self.cache))
+        path = os.path.join(deps_dir, "lib")
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), pkg.resolved_commit)
+
+
+class TestReferenceClone(_MirrorTestBase):
+    """Editable clones borrowing objects from the full mirror."""
+
+    def _clone(self, workspace, dissociate=False):
+        deps_dir = os.path.join(self._dir, workspace)
+        os.makedirs(deps_dir)
+        info = ProjectUpdateInfo(
+            argparse.Namespace(dissociate=dissociate), deps_dir, cache=self.cache)
+        pkg = PackageGit("lib", url=self.url, anonymous=True, branch="main")
+        pkg.update(info)
+        return os.path.join(deps_dir, "lib")
+
+    def _alternates(self, path):
+        alt = os.path.join(path, ".git", "objects", "info", "alternates")
+        if not os.path.isfile(alt):
+            return None
+        with open(alt) as fp:
+            return fp.read().strip()
+
+    def test_clone_borrows_from_mirror(self):
+        mirror = self.cache.get_mirror_dir(self.url)
+        for ws in ("ws1", "ws2"):
+            path = self._clone(ws)
+            self.assertEqual(self._alternates(path), os.path.join(mirror, "objects"))
+        self.assertFalse(os.path.isfile(os.path.join(mirror, "shallow")))
+        self.assertEqual(self._git(mirror, "config", "gc.auto"), "0")
+
+        # The clone is an ordinary writable repository
+        with open(os.path.join(path, "new.txt"), "w") as fp:
+            fp.write("local change\n")
+        self._git(path, "add", "new.txt")
+        self._git(path, "commit", "-q", "-m", "local")
+        self.assertEqual(self._git(path, "rev-parse", "--abbrev-ref", "@{u}"), "origin/main")
+
+    def test_gc_keeps_borrowed_mirror(self):
+        mirror = self.cache.get_mirror_dir(self.url)
+        path = self._clone("ws1")
+        result = self.cache.gc(0)
+        self.assertEqual(result["mirrors_removed"], [])
+        self.assertGreater(result["mirror_size"], 0)
+        self.assertTrue(os.path.isdir(mirror))
+
+        # Once the workspace is gone the mirror can go too
+        shutil.rmtree(os.path.dirname(path))
+        result = self.cache.gc(0)
+        self.assertEqual(result["mirrors_removed"], [os.path.basename(mirror)])
+        self.assertFalse(os.path.exists(mirror))
+
+    def test_dissociate(self):
+        path = self._clone("ws1", dissociate=True)
+        self.assertIsNone(self._alternates(path))
+        self._git(path, "fsck")
+
+    def test_shallow_mirror_deepened(self):
+        self._update("ws1", branch="main")
+        mirror = self.cache.get_mirror_dir(self.url)
+        self.assertTrue(os.path.isfile(os.path.join(mirror, "shallow")))
+
+        self._clone("ws2")
+        self.assertFalse(os.path.isfile(os.path.join(mirror, "shallow")))
+
+        # Later cache misses keep the mirror complete
+        with open(os.path.join(self.repo, "f0.txt"), "a") as fp:
+            fp.write("changed\n")
+        self._git(self.repo, "commit", "-q", "-a", "-m", "two")
+        self._update("ws3", branch="main")
+        self.assertFalse(os.path.isfile(os.path.join(mirror, "shallow")))
+
+    def test_no_cache_plain_clone(self):
+        deps_dir = os.path.join(self._dir, "ws")
+        os.makedirs(deps_dir)
+        pkg = PackageGit("lib", url=self.url, anonymous=True, branch="main")
+        with mock.patch.object(Cache, "is_enabled", return_value=False):
+            pkg.update(ProjectUpdateInfo(None, deps_dir, cache=self.cache))
+        self.assertIsNone(self._alternates(os.path.join(deps_dir, "lib")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Tests for materializing 'commit:' pinned git packages by fetching the
+commit directly rather than cloning a branch and resetting.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from ivpm.cache import Cache
+from ivpm.pkg_types.package_git import PackageGit
+from ivpm.project_ops_info import ProjectUpdateInfo
+
+
+class TestGitPinnedCommit(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-pinned-")
+        self.repo = os.path.join(self._dir, "repo")
+        os.makedirs(self.repo)
+        self._git(self.repo, "init", "-q", "-b", "main")
+        self.commits = []
+        for i in range(3):
+            with open(os.path.join(self.repo, "file.txt"), "w") as fp:
+                fp.write("version %d\n" % i)
+            self._git(self.repo, "add", "-A")
+            self._git(self.repo, "commit", "-q", "-m", "c%d" % i)
+            self._git(self.repo, "tag", "v%d" % i)
+            self.commits.append(self._git(self.repo, "rev-parse", "HEAD"))
+        self._git(self.repo, "branch", "other")
+        self.url = "file://" + self.repo
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(self._dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, 0o755)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _has(self, path, commit):
+        return subprocess.run(
+            ["git", "cat-file", "-e", commit + "^{commit}"], cwd=path,
+            capture_output=True).returncode == 0
+
+    def _update(self, **opts):
+        deps_dir = os.path.join(self._dir, "ws")
+        os.makedirs(deps_dir)
+        opts.update(url=self.url, anonymous=True)
+        pkg = PackageGit.create("lib", opts, None)
+        # No objects borrowed from a cache mirror
+        with mock.patch.object(Cache, "is_enabled", return_value=False):
+            pkg.update(ProjectUpdateInfo(None, deps_dir, cache=None))
+        return pkg, os.path.join(deps_dir, "lib")
+
+    def _read(self, path):
+        with open(os.path.join(path, "file.txt")) as fp:
+            return fp.read()
+
+    def test_editable_pinned_on_branch(self):
+        _, path = self._update(branch="main", commit=self.commits[1])
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), self.commits[1])
+        self.assertEqual(self._read(path), "version 1\n")
+        self.assertEqual(self._git(path, "rev-parse", "--abbrev-ref", "HEAD"), "main")
+        self.assertEqual(self._git(path, "config", "branch.main.merge"), "refs/heads/main")
+        self.assertEqual(self._git(path, "remote", "get-url", "origin"), self.url)
+
+        # History up to the pin, but nothing newer, no tags or other branches
+        self.assertTrue(self._has(path, self.commits[0]))
+        self.assertFalse(self._has(path, self.commits[2]))
+        self.assertEqual(self._git(path, "tag"), "")
+        self.assertEqual(self._git(path, "branch", "-a", "--format=%(refname)"),
+                         "refs/heads/main")
+
+    def test_read_only_pinned_is_shallow(self):
+        _, path = self._update(commit=self.commits[1], cache=True)
+        self.assertEqual(self._read(path), "version 1\n")
+        self.assertEqual(self._git(path, "rev-list", "--count", "HEAD"), "1")
+        self.assertEqual(self._git(path, "rev-parse", "--abbrev-ref", "HEAD"), "HEAD")
+
+    def test_no_cache_clone_is_complete(self):
+        # cache: false is an editable clone: all history, tags and branches
+        _, path = self._update(branch="main", cache=False)
+        self.assertEqual(self._git(path, "rev-list", "--count", "HEAD"), "3")
+        self.assertEqual(self._git(path, "tag"), "v0\nv1\nv2")
+        self.assertIn("refs/remotes/origin/other",
+                      self._git(path, "branch", "-a", "--format=%(refname)"))
+
+        shutil.rmtree(os.path.join(self._dir, "ws"))
+        _, path = self._update(commit=self.commits[1], cache=False)
+        self.assertEqual(self._git(path, "rev-list", "--count", "HEAD"), "2")
+        # Later fetches bring in the remote's branches and tags
+        self._git(path, "fetch", "-q", "--tags", "origin")
+        self.assertIn("refs/remotes/origin/other",
+                      self._git(path, "branch", "-a", "--format=%(refname)"))
+        self.assertEqual(self._git(path, "tag"), "v0\nv1\nv2")
+
+    def test_borrows_from_mirror(self):
+        cache = Cache(os.path.join(self._dir, "cache"))
+        for ws, dissociate in (("ws1", False), ("ws2", True)):
+            deps_dir = os.path.join(self._dir, ws)
+            os.makedirs(deps_dir)
+            pkg = PackageGit("lib", url=self.url, anonymous=True, branch="main",
+                             commit=self.commits[1])
+            pkg.update(ProjectUpdateInfo(
+                argparse.Namespace(dissociate=dissociate), deps_dir, cache=cache))
+            path = os.path.join(deps_dir, "lib")
+            self.assertEqual(self._git(path, "rev-parse", "HEAD"), self.commits[1])
+            alternates = os.path.join(path, ".git", "objects", "info", "alternates")
+            self.assertEqual(os.path.isfile(alternates), not dissociate)
+        self._git(path, "fsck")
+
+    def test_falls_back_to_clone_and_reset(self):
+        def refuse(pkg, update_info, target_dir, *args):
+            # A partially set-up repository is discarded
+            os.makedirs(os.path.join(target_dir, ".git"))
+            return False
+
+        with mock.patch.object(PackageGit, "_fetch_commit_to_dir", refuse):
+            _, path = self._update(branch="main", commit=self.commits[1])
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), self.commits[1])
+        self.assertTrue(self._has(path, self.commits[2]))
+
+    def test_abbreviated_commit_cloned(self):
+        with mock.patch.object(PackageGit, "_fetch_commit_to_dir") as fetch:
+            _, path = self._update(branch="main", commit=self.commits[1][:10])
+        fetch.assert_not_called()
+        self.assertEqual(self._git(path, "rev-parse", "HEAD"), self.commits[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
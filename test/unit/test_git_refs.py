@@ -0,0 +1,125 @@
+"""
+Tests for run-scoped git ref resolution (git_refs.RefResolver).
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ivpm import git_refs
+from ivpm.git_refs import RefResolver, lookup_ref, parse_ls_remote
+
+
+class TestLookupRef(unittest.TestCase):
+
+    TABLE = {
+        "HEAD": "h0",
+        "refs/heads/main": "h1",
+        "refs/heads/v1": "h2",
+        "refs/tags/v1": "t1",
+        "refs/tags/v2": "tagobj",
+        "refs/tags/v2^{}": "c2",
+    }
+
+    def test_branch_before_tag(self):
+        self.assertEqual(lookup_ref(self.TABLE, "v1"), "h2")
+
+    def test_annotated_tag_peeled(self):
+        self.assertEqual(lookup_ref(self.TABLE, "v2"), "c2")
+        self.assertEqual(lookup_ref(self.TABLE, "refs/tags/v2"), "c2")
+
+    def test_full_ref_and_head(self):
+        self.assertEqual(lookup_ref(self.TABLE, "refs/tags/v1"), "t1")
+        self.assertEqual(lookup_ref(self.TABLE, "HEAD"), "h0")
+
+    def test_missing(self):
+        self.assertIsNone(lookup_ref(self.TABLE, "nope"))
+
+    def test_parse(self):
+        self.assertEqual(
+            parse_ls_remote("abc\trefs/heads/main\ndef\trefs/tags/t\n\n"),
+            {"refs/heads/main": "abc", "refs/tags/t": "def"})
+
+
+class TestRefResolver(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-refs-")
+        self.repo = os.path.join(self._dir, "repo")
+        os.makedirs(self.repo)
+        self._git("init", "-q", "-b", "main")
+        self._git("commit", "-q", "--allow-empty", "-m", "one")
+        self.c1 = self._git("rev-parse", "HEAD")
+        self._git("tag", "-a", "-m", "release", "v1")
+        self._git("checkout", "-q", "-b", "dev")
+        self._git("commit", "-q", "--allow-empty", "-m", "two")
+        self.c2 = self._git("rev-parse", "HEAD")
+        self._git("checkout", "-q", "main")
+        self.url = "file://" + self.repo
+
+        self.calls = []
+        real_run = subprocess.run
+
+        def counting_run(cmd, *args, **kwargs):
+            self.calls.append(cmd)
+            return real_run(cmd, *args, **kwargs)
+        patcher = mock.patch.object(git_refs.subprocess, "run", counting_run)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=self.repo).decode().strip()
+
+    def test_one_listing_per_remote(self):
+        r = RefResolver()
+        self.assertEqual(r.resolve(self.url, "main"), self.c1)
+        self.assertEqual(r.resolve(self.url, "dev"), self.c2)
+        self.assertEqual(r.resolve(self.url, "refs/heads/dev"), self.c2)
+        self.assertEqual(r.resolve(self.url, "v1"), self.c1)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_head_resolved_once(self):
+        r = RefResolver()
+        self.assertEqual(r.resolve(self.url, "HEAD"), self.c1)
+        self.assertEqual(r.resolve(self.url, "HEAD"), self.c1)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_concurrent_lookups_share_listing(self):
+        r = RefResolver()
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(r.resolve(self.url, "dev")))
+            for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [self.c2] * 8)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_unreachable_remote_listed_once(self):
+        r = RefResolver()
+        url = "file://" + os.path.join(self._dir, "missing")
+        self.assertIsNone(r.resolve(url, "main"))
+        self.assertIsNone(r.resolve(url, "dev"))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_memoize(self):
+        r = RefResolver()
+        n = []
+        for _ in range(3):
+            self.assertEqual(
+                r.memoize(self.url, "main", lambda: n.append(1) or "x"), "x")
+        self.assertEqual(len(n), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Tests for partial-clone ('filter') and sparse-checkout ('sparse') options
+of git packages.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from ivpm.cache import Cache
+from ivpm.package_lock import _entry_from_pkg, _spec_matches_lock, package_from_lock_entry
+from ivpm.pkg_types.package_git import PackageGit
+from ivpm.project_ops_info import ProjectUpdateInfo
+from ivpm.yamlsrc.loader import SrcLoaderError
+
+
+class TestGitSparseOptions(unittest.TestCase):
+
+    def _pkg(self, **opts):
+        opts.setdefault("url", "https://github.com/org/big.git")
+        return PackageGit.create("big", opts, None)
+
+    def test_options(self):
+        pkg = self._pkg(filter="blob:none", sparse=["hw/rtl/", "scripts"])
+        self.assertEqual(pkg.filter, "blob:none")
+        self.assertEqual(pkg.sparse, ["hw/rtl", "scripts"])
+        self.assertEqual(self._pkg(sparse="docs").sparse, ["docs"])
+
+    def test_invalid_filter(self):
+        with self.assertRaises(SrcLoaderError):
+            self._pkg(filter="blob:limit=1k")
+
+    def test_lock_round_trip(self):
+        pkg = self._pkg(filter="tree:0", sparse=["hw"])
+        entry = _entry_from_pkg(pkg)
+        self.assertEqual(entry["filter"], "tree:0")
+        self.assertEqual(entry["sparse"], ["hw"])
+        self.assertTrue(_spec_matches_lock(pkg, entry))
+
+        restored = package_from_lock_entry("big", entry, pinned=False)
+        self.assertEqual((restored.filter, restored.sparse), ("tree:0", ["hw"]))
+
+        self.assertFalse(_spec_matches_lock(self._pkg(filter="tree:0", sparse=["sw"]), entry))
+        self.assertFalse(_spec_matches_lock(self._pkg(sparse=["hw"]), entry))
+
+    def test_lock_unchanged_without_options(self):
+        pkg = self._pkg()
+        entry = _entry_from_pkg(pkg)
+        self.assertNotIn("filter", entry)
+        self.assertNotIn("sparse", entry)
+        self.assertTrue(_spec_matches_lock(pkg, entry))
+        self.assertFalse(_spec_matches_lock(self._pkg(sparse=["hw"]), entry))
+
+    def test_deps_source_coverage(self):
+        full = {"commit_resolved": "c"}
+        partial = {"commit_resolved": "c", "sparse": ["hw"]}
+        self.assertIsNone(self._pkg().matches_lock_entry(full))
+        self.assertIsNone(self._pkg(sparse=["hw/rtl"]).matches_lock_entry(partial))
+        self.assertIsNone(self._pkg(sparse=["hw"]).matches_lock_entry(partial))
+        self.assertFalse(self._pkg(sparse=["hwx"]).matches_lock_entry(partial))
+        self.assertFalse(self._pkg().matches_lock_entry(partial))
+
+
+class TestGitSparseClone(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-sparse-")
+        self.repo = os.path.join(self._dir, "repo")
+        for sub in ("hw/rtl", "hw/tb", "sw"):
+            os.makedirs(os.path.join(self.repo, sub))
+            with open(os.path.join(self.repo, sub, "file.txt"), "w") as fp:
+                fp.write(sub + "\n")
+        with open(os.path.join(self.repo, "README"), "w") as fp:
+            fp.write("top\n")
+        self._git(self.repo, "init", "-q", "-b", "main")
+        self._git(self.repo, "config", "uploadpack.allowFilter", "true")
+        self._git(self.repo, "add", "-A")
+        self._git(self.repo, "commit", "-q", "-m", "one")
+        self.url = "file://" + self.repo
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(self._dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, 0o755)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _update(self, workspace, store=None, **opts):
+        deps_dir = os.path.join(self._dir, workspace)
+        os.makedirs(deps_dir)
+        opts.update(url=self.url, anonymous=True, branch="main")
+        pkg = PackageGit.create("big", opts, None)
+        pkg.update(ProjectUpdateInfo(None, deps_dir, cache=store))
+        return pkg, os.path.join(deps_dir, "big")
+
+    def test_partial_sparse_clone(self):
+        pkg, path = self._update("ws", filter="blob:none", sparse=["hw/rtl"])
+        self.assertTrue(os.path.isfile(os.path.join(path, "README")))
+        self.assertTrue(os.path.isfile(os.path.join(path, "hw", "rtl", "file.txt")))
+        self.assertFalse(os.path.exists(os.path.join(path, "hw", "tb")))
+        self.assertFalse(os.path.exists(os.path.join(path, "sw")))
+        self.assertEqual(
+            self._git(path, "config", "remote.origin.partialclonefilter"), "blob:none")
+        self.assertEqual(pkg.resolved_commit, self._git(self.repo, "rev-parse", "HEAD"))
+
+    def test_cached_sparse_kept_apart(self):
+        cache = Cache(os.path.join(self._dir, "cache"))
+        _, full = self._update("ws1", store=cache, cache=True)
+        _, sparse = self._update("ws2", store=cache, cache=True, sparse=["sw"])
+        self.assertNotEqual(os.path.realpath(full), os.path.realpath(sparse))
+        self.assertTrue(os.path.isdir(os.path.join(full, "hw")))
+        self.assertFalse(os.path.exists(os.path.join(sparse, "hw")))
+        self.assertTrue(os.path.isfile(os.path.join(sparse, "sw", "file.txt")))
+
+        # A second sparse workspace is a cache hit
+        _, again = self._update("ws3", store=cache, cache=True, sparse=["sw"])
+        self.assertEqual(os.path.realpath(again), os.path.realpath(sparse))
+
+
+if __name__ == "__main__":
+    unittest.main()
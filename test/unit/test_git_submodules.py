@@ -0,0 +1,133 @@
+"""
+Tests for checking out git submodules through the cache mirrors.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from ivpm.cache import Cache
+from ivpm.pkg_types.package_git import PackageGit
+from ivpm.project_ops_info import ProjectUpdateInfo
+
+# Submodule URLs look remote; git maps them to local repositories
+REMOTE = "https://example.invalid/"
+
+
+class TestGitSubmodules(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-submod-")
+        self.remotes = os.path.join(self._dir, "remotes")
+        patcher = mock.patch.dict(os.environ, {
+            "GIT_CONFIG_COUNT": "2",
+            "GIT_CONFIG_KEY_0": "url.file://%s/.insteadOf" % self.remotes,
+            "GIT_CONFIG_VALUE_0": REMOTE,
+            "GIT_CONFIG_KEY_1": "protocol.file.allow",
+            "GIT_CONFIG_VALUE_1": "always"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.subs = {}
+        for name in ("leaf", "sub1", "sub2"):
+            self._repo(name)
+        # sub1 has a submodule of its own
+        self._add_submodule("sub1", "leaf")
+        self.top = self._repo("top")
+        self._add_submodule("top", "sub1")
+        self._add_submodule("top", "sub2")
+        self.url = "file://" + self.top
+        self.cache = Cache(os.path.join(self._dir, "cache"))
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(self._dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, 0o755)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test",
+             "-c", "protocol.file.allow=always"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _repo(self, name):
+        path = os.path.join(self.remotes, name + ".git")
+        os.makedirs(path)
+        self._git(path, "init", "-q", "-b", "main")
+        with open(os.path.join(path, name + ".txt"), "w") as fp:
+            fp.write(name + "\n")
+        self._git(path, "add", "-A")
+        self._git(path, "commit", "-q", "-m", name)
+        self.subs[name] = self._git(path, "rev-parse", "HEAD")
+        return path
+
+    def _add_submodule(self, repo, name):
+        path = os.path.join(self.remotes, repo + ".git")
+        self._git(path, "submodule", "add", "-q", REMOTE + name + ".git", name)
+        self._git(path, "commit", "-q", "-m", "add " + name)
+        self.subs[repo] = self._git(path, "rev-parse", "HEAD")
+
+    def _update(self, workspace, **opts):
+        deps_dir = os.path.join(self._dir, workspace)
+        os.makedirs(deps_dir)
+        opts.update(url=self.url, anonymous=True, branch="main")
+        pkg = PackageGit.create("top", opts, None)
+        pkg.update(ProjectUpdateInfo(None, deps_dir, cache=self.cache))
+        return os.path.join(deps_dir, "top")
+
+    def _check(self, path):
+        for sub in ("sub1", "sub2", os.path.join("sub1", "leaf")):
+            name = os.path.basename(sub)
+            with open(os.path.join(path, sub, name + ".txt")) as fp:
+                self.assertEqual(fp.read(), name + "\n")
+            self.assertEqual(self._git(os.path.join(path, sub), "rev-parse", "HEAD"),
+                             self.subs[name])
+        # Submodules keep their own remotes
+        self.assertEqual(self._git(os.path.join(path, "sub2"), "config", "remote.origin.url"),
+                         REMOTE + "sub2.git")
+
+    def _mirrored(self):
+        return sorted(name for name in ("leaf", "sub1", "sub2")
+                      if os.path.isdir(self.cache.get_mirror_dir(REMOTE + name + ".git")))
+
+    def test_fetched_once(self):
+        self._check(self._update("ws1"))
+        self.assertEqual(self._mirrored(), ["leaf", "sub1", "sub2"])
+
+        # Later workspaces only need the submodule remotes' mirrors
+        for name in ("leaf", "sub1", "sub2"):
+            os.rename(os.path.join(self.remotes, name + ".git"),
+                      os.path.join(self.remotes, name + ".gone"))
+        self._check(self._update("ws2"))
+
+    def test_read_only(self):
+        path = self._update("ws1", cache=True)
+        self._check(path)
+        for name in ("sub1", "sub2"):
+            mirror = self.cache.get_mirror_dir(REMOTE + name + ".git")
+            self.assertEqual(
+                self._git(mirror, "rev-parse", "refs/ivpm/commits/" + self.subs[name]),
+                self.subs[name])
+
+    def test_no_cache(self):
+        self._check(self._update("ws1", cache=False))
+        self.assertEqual(self._mirrored(), [])
+
+
+class TestStageJobs(unittest.TestCase):
+
+    def test_budget(self):
+        info = ProjectUpdateInfo(None, "deps", max_parallel=6)
+        self.assertEqual(info.stage_jobs("net"), 6)
+        info.stage_limits = {"net": 2}
+        self.assertEqual(info.stage_jobs("net"), 2)
+        self.assertGreaterEqual(ProjectUpdateInfo(None, "deps").stage_jobs("net"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
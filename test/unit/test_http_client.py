@@ -0,0 +1,203 @@
+"""
+Tests for the run-scoped pooled HTTP client (http_client.HttpClient).
+
+The benchmark fetches 60 GitHub-style archive packages from a local HTTPS
+stand-in server, once with per-request connections (the old module-level
+httpx calls) and once through a shared client, counting the TLS
+handshakes the server performs.
+"""
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+
+from ivpm.http_client import HttpClient, client_for
+from ivpm.pkg_types.package_http import PackageHttp
+from ivpm.project_ops_info import ProjectUpdateInfo
+
+N_PACKAGES = 60
+BODY = b"x" * 4096
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._reply(body=False)
+
+    def do_GET(self):
+        self._reply(body=True)
+
+    def _reply(self, body):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.delay)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+            self.end_headers()
+            if body:
+                self.wfile.write(BODY)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TLSServer(ThreadingHTTPServer):
+    """HTTPS server that counts the TLS handshakes (connections) it accepts."""
+    daemon_threads = True
+
+    def __init__(self, ctx):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.socket = ctx.wrap_socket(self.socket, server_side=True)
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        self.active = 0
+        self.max_active = 0
+        self.delay = 0.0
+
+    def get_request(self):
+        request = super().get_request()
+        with self.lock:
+            self.handshakes += 1
+        return request
+
+    def reset(self):
+        with self.lock:
+            self.handshakes = 0
+            self.max_active = 0
+
+
+class TestHttpClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if shutil.which("openssl") is None:
+            raise unittest.SkipTest("openssl is required to create a test certificate")
+        cls._dir = tempfile.mkdtemp(prefix="ivpm-http-")
+        cls.cert = os.path.join(cls._dir, "cert.pem")
+        key = os.path.join(cls._dir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+             "-keyout", key, "-out", cls.cert, "-days", "1",
+             "-subj", "/CN=127.0.0.1",
+             "-addext", "subjectAltName=IP:127.0.0.1"],
+            check=True, capture_output=True)
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cls.cert, key)
+        cls.server = _TLSServer(ctx)
+        cls.base = "https://127.0.0.1:%d" % cls.server.server_address[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls._dir, ignore_errors=True)
+
+    def setUp(self):
+        self.server.reset()
+        self.server.delay = 0.0
+        self.work = tempfile.mkdtemp(prefix="ivpm-http-deps-")
+        # Module-level httpx calls trust the stand-in's certificate too
+        patcher = mock.patch.dict(os.environ, {"SSL_CERT_FILE": self.cert})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def _verify(self):
+        return ssl.create_default_context(cafile=self.cert)
+
+    def _fetch_all(self, update_info):
+        """Resolve and download N_PACKAGES archives as 'http' packages do
+        (a HEAD for the version, then the download), 8 at a time."""
+        def fetch(i):
+            pkg = PackageHttp("lib%d" % i)
+            pkg.url = "%s/org/lib%d/archive/v1.0.tar.gz" % (self.base, i)
+            self.assertIsNotNone(pkg._get_url_version(pkg.url, update_info))
+            pkg._download_file(pkg.url, os.path.join(self.work, pkg.name), update_info)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(fetch, range(N_PACKAGES)))
+        return time.time() - start
+
+    def test_benchmark_handshakes(self):
+        unpooled_time = self._fetch_all(None)
+        unpooled = self.server.handshakes
+        self.server.reset()
+
+        info = ProjectUpdateInfo(None, self.work)
+        try:
+            pooled_time = self._fetch_all(info)
+        finally:
+            info.http.close()
+        pooled = self.server.handshakes
+
+        summary = "%d packages: %d handshakes in %.2fs unpooled, %d in %.2fs pooled" % (
+            N_PACKAGES, unpooled, unpooled_time, pooled, pooled_time)
+        self.assertEqual(unpooled, 2 * N_PACKAGES, summary)
+        self.assertLessEqual(pooled, 8, summary)
+        for i in range(N_PACKAGES):
+            with open(os.path.join(self.work, "lib%d" % i), "rb") as fp:
+                self.assertEqual(fp.read(), BODY)
+
+    def test_per_host_limit(self):
+        self.server.delay = 0.05
+        client = HttpClient(max_per_host=2, verify=self._verify())
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                codes = list(pool.map(
+                    lambda i: client.get("%s/r%d" % (self.base, i)).status_code,
+                    range(16)))
+        finally:
+            client.close()
+        self.assertEqual(codes, [200] * 16)
+        self.assertLessEqual(self.server.max_active, 2)
+        self.assertLessEqual(self.server.handshakes, 2)
+
+    def test_stream_releases_slot(self):
+        client = HttpClient(max_per_host=1, verify=self._verify())
+        try:
+            for _ in range(3):
+                with client.stream("GET", self.base + "/s") as r:
+                    self.assertEqual(r.read(), BODY)
+            self.assertEqual(client.head(self.base + "/s").status_code, 200)
+        finally:
+            client.close()
+        self.assertEqual(self.server.handshakes, 1)
+
+    def test_reopen_after_close(self):
+        client = HttpClient(verify=self._verify())
+        self.assertEqual(client.get(self.base + "/a").status_code, 200)
+        client.close()
+        self.assertEqual(client.get(self.base + "/b").status_code, 200)
+        client.close()
+        self.assertEqual(self.server.handshakes, 2)
+
+    def test_shared_by_fork(self):
+        info = ProjectUpdateInfo(None, self.work)
+        self.assertIs(info.fork().http, info.http)
+        self.assertIs(client_for(info), info.http)
+        self.assertIs(client_for(None), httpx)
+
+
+if __name__ == "__main__":
+    unittest.main()
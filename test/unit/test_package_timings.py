@@ -0,0 +1,81 @@
+#****************************************************************************
+#* test_package_timings.py
+#*
+#* Tests for the package_timings module (critical-path computation, subtree
+#* sizes, and write/read round-trip).
+#****************************************************************************
+import os
+import shutil
+import tempfile
+import unittest
+
+from ivpm.package_timings import (
+    critical_paths, find_timings, read_timings, subtree_sizes,
+    write_timings, TIMINGS_FILE)
+from ivpm.package import Package
+from ivpm.packages_info import PackagesInfo
+
+
+def _pkg(name, resolved_by="root"):
+    p = Package(name)
+    p.resolved_by = resolved_by
+    return p
+
+
+class TestPackageTimings(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="ivpm-timings-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_critical_paths(self):
+        timings = {
+            "a": {"duration": 1.0, "resolved_by": "root"},
+            "b": {"duration": 2.0, "resolved_by": "a"},
+            "c": {"duration": 0.5, "resolved_by": "a"},
+            "d": {"duration": 3.0, "resolved_by": "c"},
+        }
+        cp = critical_paths(timings)
+        self.assertAlmostEqual(cp["d"], 3.0)
+        self.assertAlmostEqual(cp["c"], 3.5)
+        self.assertAlmostEqual(cp["a"], 4.5)
+        self.assertEqual(subtree_sizes(timings),
+                         {"a": 3, "b": 0, "c": 1, "d": 0})
+
+    def test_cycle_terminates(self):
+        timings = {
+            "a": {"duration": 1.0, "resolved_by": "b"},
+            "b": {"duration": 1.0, "resolved_by": "a"},
+        }
+        cp = critical_paths(timings)
+        self.assertEqual(set(cp.keys()), {"a", "b"})
+
+    def test_write_keeps_previous_duration_for_reused(self):
+        all_pkgs = PackagesInfo("root")
+        all_pkgs["a"] = _pkg("a")
+        all_pkgs["b"] = _pkg("b", resolved_by="a")
+        previous = {"b": {"duration": 7.0, "resolved_by": "a"}}
+
+        write_timings(self.tmpdir, all_pkgs, {"a": 1.23456}, previous=previous)
+
+        data = read_timings(os.path.join(self.tmpdir, TIMINGS_FILE))
+        self.assertEqual(data["a"]["duration"], 1.235)
+        self.assertEqual(data["b"]["duration"], 7.0)
+        self.assertEqual(data["a"]["subtree_size"], 1)
+
+    def test_find_next_to_lock_file(self):
+        lock_dir = os.path.join(self.tmpdir, "ci")
+        all_pkgs = PackagesInfo("root")
+        all_pkgs["a"] = _pkg("a")
+        write_timings(lock_dir, all_pkgs, {"a": 2.0})
+
+        deps_dir = os.path.join(self.tmpdir, "packages")
+        self.assertEqual(find_timings(deps_dir), {})
+        found = find_timings(deps_dir, os.path.join(lock_dir, "ivpm.lock"))
+        self.assertEqual(found["a"]["duration"], 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
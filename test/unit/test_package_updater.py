@@ -0,0 +1,334 @@
+"""
+Unit tests for the streaming dependency scheduler in ``PackageUpdater``.
+
+Packages here are in-memory fakes whose ``update()`` sleeps for a
+configurable time and returns a synthetic ProjInfo, so the tests exercise
+scheduling order and ``resolved_by`` attribution without any fetching.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import dataclasses as dc
+from unittest import mock
+from typing import List
+
+from ivpm.package import Package
+from ivpm.package_updater import PackageUpdater
+from ivpm.packages_info import PackagesInfo
+from ivpm.proj_info import ProjInfo
+from ivpm.yamlsrc.loader import SrcLoaderError
+
+
+class _StubHandler:
+    """Minimal package handler: the updater only calls these two hooks."""
+    def on_leaf_pre_load(self, pkg, update_info):
+        pass
+
+    def on_leaf_post_load(self, pkg, update_info):
+        pass
+
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.active = 0
+        self.max_active = 0
+
+    def record(self, kind, name):
+        with self.lock:
+            self.events.append((kind, name))
+            if kind == "start":
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            elif kind == "end":
+                self.active -= 1
+
+    def max_overlap(self, stage):
+        """Max number of packages concurrently inside 'stage'."""
+        n = ret = 0
+        for kind, _ in self.events:
+            if kind == stage + "+":
+                n += 1
+                ret = max(ret, n)
+            elif kind == stage + "-":
+                n -= 1
+        return ret
+
+    def index(self, kind, name):
+        return self.events.index((kind, name))
+
+
+@dc.dataclass
+class _FakePkg(Package):
+    delay : float = 0.0
+    deps : List[str] = dc.field(default_factory=list)
+    graph : dict = None
+    recorder : _Recorder = None
+    stages : List[tuple] = dc.field(default_factory=list)
+    cmd : List[str] = None
+    error : str = None
+
+    def update(self, update_info):
+        self.recorder.record("start", self.name)
+        time.sleep(self.delay)
+        if self.cmd is not None:
+            os.makedirs(os.path.join(update_info.deps_dir, self.name))
+            update_info.run_subprocess(self.cmd)
+        if self.error is not None:
+            os.makedirs(os.path.join(update_info.deps_dir, self.name))
+            raise Exception(self.error)
+        for stage, delay in self.stages:
+            with update_info.stage(stage):
+                self.recorder.record(stage + "+", self.name)
+                time.sleep(delay)
+                self.recorder.record(stage + "-", self.name)
+        info = ProjInfo(False)
+        info.name = self.name
+        ds = PackagesInfo("default")
+        for d in self.deps:
+            ds.add_package(self.graph[d]())
+        info.set_dep_set("default", ds)
+        self.recorder.record("end", self.name)
+        return info
+
+
+class TestStreamingScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-updater-")
+        self.recorder = _Recorder()
+        self.graph = {}
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _pkg(self, name, delay=0.0, deps=(), stages=(), cmd=None, error=None):
+        def mk():
+            return _FakePkg(name, dep_set="default", delay=delay,
+                            deps=list(deps), graph=self.graph,
+                            recorder=self.recorder, stages=list(stages),
+                            cmd=cmd, error=error)
+        self.graph[name] = mk
+
+    def _run(self, roots, jobs=8, timings=None, **stage_jobs):
+        ds = PackagesInfo("default")
+        for r in roots:
+            ds.add_package(self.graph[r]())
+        updater = PackageUpdater(
+            self._dir, _StubHandler(),
+            args=argparse.Namespace(jobs=jobs, **stage_jobs))
+        if timings is not None:
+            updater.timings = timings
+        updater.all_pkgs["root"] = None
+        self.updater = updater
+        return updater.update(ds)
+
+    def test_dep_starts_before_slow_sibling_completes(self):
+        self._pkg("slow", delay=0.5)
+        self._pkg("fast", deps=["child"])
+        self._pkg("child")
+
+        self._run(["slow", "fast"])
+
+        self.assertLess(
+            self.recorder.index("start", "child"),
+            self.recorder.index("end", "slow"))
+
+    def test_resolved_by_follows_bfs_order(self):
+        # 'shared' is a level-1 dep of 'slow' and a level-2 dep via
+        # fast -> mid. The fast path claims it first, but the BFS winner
+        # is 'slow'.
+        self._pkg("slow", delay=0.4, deps=["shared"])
+        self._pkg("fast", deps=["mid"])
+        self._pkg("mid", deps=["shared"])
+        self._pkg("shared")
+
+        all_pkgs = self._run(["slow", "fast"])
+
+        self.assertEqual(all_pkgs["shared"].resolved_by, "slow")
+        self.assertEqual(all_pkgs["mid"].resolved_by, "fast")
+        self.assertIsNone(all_pkgs["slow"].resolved_by)
+        self.assertEqual(1, sum(
+            1 for e in self.recorder.events if e == ("start", "shared")))
+
+    def test_conflicting_late_claim_reloads_winner_spec(self):
+        # The BFS winner 'slow' asks for another spec of 'shared' only
+        # after the fast path's claim has loaded it
+        self._pkg("slow", delay=0.4, deps=["shared"])
+        self._pkg("fast", deps=["mid"])
+        self._pkg("mid", deps=["shared-v2"])
+        self._pkg("shared")
+        self.graph["shared-v2"] = lambda: _FakePkg(
+            "shared", dep_set="default", src_type="v2", graph=self.graph,
+            recorder=self.recorder, deps=["only-v2"])
+        self._pkg("only-v2", delay=0.2)
+
+        all_pkgs = self._run(["slow", "fast"])
+
+        self.assertIsNone(all_pkgs["shared"].src_type)
+        self.assertEqual(all_pkgs["shared"].resolved_by, "slow")
+        # What only the replaced spec asked for is not kept
+        self.assertNotIn("only-v2", all_pkgs.keys())
+        self.assertEqual(
+            list(all_pkgs.keys()), ["root", "slow", "fast", "shared", "mid"])
+
+    def test_conflicting_claim_while_loading_reloads(self):
+        # 'shared' (as v2) is still loading when the winner's claim comes
+        self._pkg("slow", delay=0.2, deps=["shared"])
+        self._pkg("fast", deps=["shared-v2"])
+        self._pkg("shared")
+        self.graph["shared-v2"] = lambda: _FakePkg(
+            "shared", dep_set="default", src_type="v2", delay=0.4,
+            graph=self.graph, recorder=self.recorder)
+
+        all_pkgs = self._run(["slow", "fast"])
+
+        self.assertIsNone(all_pkgs["shared"].src_type)
+        self.assertEqual(all_pkgs["shared"].resolved_by, "slow")
+        self.assertEqual(
+            2, sum(1 for e in self.recorder.events if e == ("start", "shared")))
+
+    def test_all_pkgs_in_bfs_order(self):
+        self._pkg("a", delay=0.3, deps=["a1"])
+        self._pkg("b", deps=["b1"])
+        self._pkg("a1")
+        self._pkg("b1")
+
+        all_pkgs = self._run(["a", "b"])
+
+        self.assertEqual(
+            list(all_pkgs.keys()), ["root", "a", "b", "a1", "b1"])
+
+    def test_jobs_limit_applies(self):
+        self._pkg("r", deps=["c%d" % i for i in range(6)])
+        for i in range(6):
+            self._pkg("c%d" % i, delay=0.05)
+
+        self._run(["r"], jobs=2)
+
+        self.assertLessEqual(self.recorder.max_active, 2)
+        self.assertEqual(
+            7, sum(1 for e in self.recorder.events if e[0] == "start"))
+
+    def test_stage_limits(self):
+        # One network slot, but a package unpacks without holding it, so
+        # other packages keep downloading while it extracts
+        for i in range(4):
+            self._pkg("p%d" % i, stages=[("net", 0.05), ("unpack", 0.3)])
+
+        self._run(["p%d" % i for i in range(4)], jobs=4,
+                  net_jobs=1, unpack_jobs=4)
+
+        self.assertEqual(self.recorder.max_overlap("net"), 1)
+        self.assertGreater(self.recorder.max_overlap("unpack"), 1)
+
+    def test_staged_package_lends_its_slot(self):
+        # One --jobs slot, but a package on the network lends it, so the
+        # other package starts and uses the second network slot
+        for i in range(3):
+            self._pkg("p%d" % i, stages=[("net", 0.3)])
+
+        self._run(["p%d" % i for i in range(3)], jobs=1, net_jobs=2)
+
+        self.assertEqual(self.recorder.max_overlap("net"), 2)
+        self.assertLessEqual(self.recorder.max_active, 3)
+
+    def test_stage_unlimited_by_default(self):
+        for i in range(4):
+            self._pkg("p%d" % i, stages=[("net", 0.2)])
+
+        self._run(["p%d" % i for i in range(4)], jobs=4)
+
+        self.assertGreater(self.recorder.max_overlap("net"), 1)
+
+    def test_critical_path_first(self):
+        # 'deep' was cheap to fetch last time but gated a long chain, so
+        # with one slot it starts ahead of its BFS-earlier siblings, and
+        # 'deep1' jumps the queue as soon as it is discovered
+        for n in ("a", "b", "c"):
+            self._pkg(n)
+        self._pkg("deep", deps=["deep1"])
+        self._pkg("deep1")
+        timings = {
+            "a": {"duration": 1.0, "resolved_by": "root"},
+            "b": {"duration": 1.0, "resolved_by": "root"},
+            "c": {"duration": 1.0, "resolved_by": "root"},
+            "deep": {"duration": 0.1, "resolved_by": "root"},
+            "deep1": {"duration": 5.0, "resolved_by": "deep"},
+        }
+
+        self._run(["a", "b", "c", "deep"], jobs=1, timings=timings)
+
+        starts = [n for k, n in self.recorder.events if k == "start"]
+        self.assertEqual(starts, ["deep", "a", "deep1", "b", "c"])
+
+    def test_bfs_order_without_history(self):
+        for n in ("a", "b", "c"):
+            self._pkg(n)
+
+        all_pkgs = self._run(["a", "b", "c"], jobs=1)
+
+        starts = [n for k, n in self.recorder.events if k == "start"]
+        self.assertEqual(starts, ["a", "b", "c"])
+        self.assertEqual(list(all_pkgs.keys()), ["root", "a", "b", "c"])
+
+    def test_durations_recorded_for_fetched(self):
+        self._pkg("a", delay=0.05)
+
+        self._run(["a"])
+
+        self.assertGreaterEqual(self.updater.durations["a"], 0.05)
+
+    def test_failure_cancels_running_and_queued(self):
+        # 'bad' fails while 'slow' runs a long subprocess and 'queued'
+        # waits for a slot: the subprocess is terminated, 'queued' never
+        # starts, and the run fails without waiting out 'slow'
+        self._pkg("bad", delay=0.2, error="bad url")
+        self._pkg("slow", cmd=["sleep", "30"])
+        self._pkg("queued")
+
+        t_start = time.monotonic()
+        with self.assertRaises(SrcLoaderError) as cm:
+            self._run(["bad", "slow", "queued"], jobs=2)
+
+        self.assertLess(time.monotonic() - t_start, 10)
+        self.assertIn("bad url", str(cm.exception))
+        self.assertNotIn(("start", "queued"), self.recorder.events)
+
+    def test_partial_package_dirs_removed(self):
+        self._pkg("bad", error="bad url")
+        self._pkg("slow", cmd=["sleep", "30"])
+
+        with self.assertRaises(SrcLoaderError):
+            self._run(["slow", "bad"], jobs=2)
+
+        self.assertFalse(os.path.exists(os.path.join(self._dir, "bad")))
+        self.assertFalse(os.path.exists(os.path.join(self._dir, "slow")))
+
+    def test_failures_aggregated(self):
+        self._pkg("bad1", error="first error")
+        self._pkg("bad2", error="second error")
+
+        with self.assertRaises(SrcLoaderError) as cm:
+            self._run(["bad1", "bad2"], jobs=2)
+
+        self.assertIn("first error", str(cm.exception))
+        self.assertIn("second error", str(cm.exception))
+
+    def test_root_project_not_loaded_as_dep(self):
+        self._pkg("a", deps=["root"])
+        self._pkg("root")
+
+        all_pkgs = self._run(["a"])
+
+        self.assertIsNone(all_pkgs["root"])
+        self.assertNotIn(("start", "root"), self.recorder.events)
+
+
+if __name__ == "__main__":
+    unittest.main()
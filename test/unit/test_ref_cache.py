@@ -0,0 +1,137 @@
+"""
+Tests for the persistent ref-resolution cache (ref_cache.RefCache) and
+its use by git packages: conditional GitHub lookups and --ref-ttl.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from ivpm.cache import Cache
+from ivpm.pkg_types.package_git import PackageGit
+from ivpm.project_ops_info import ProjectUpdateInfo
+from ivpm.ref_cache import RefCache, parse_duration
+
+URL = "https://github.com/org/lib.git"
+SHA1 = "1" * 40
+SHA2 = "2" * 40
+
+
+class _Response:
+    def __init__(self, status_code, sha=None, etag=None):
+        self.status_code = status_code
+        self.headers = {"ETag": etag} if etag else {}
+        self._sha = sha
+
+    def json(self):
+        return {"sha": self._sha}
+
+
+class TestParseDuration(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(parse_duration("90"), 90)
+        self.assertEqual(parse_duration("90s"), 90)
+        self.assertEqual(parse_duration("10m"), 600)
+        self.assertEqual(parse_duration("2h"), 7200)
+        self.assertEqual(parse_duration("1d"), 86400)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_duration("ten minutes")
+
+
+class TestRefCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-refcache-")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def test_put_get(self):
+        rc = RefCache(self._dir)
+        self.assertIsNone(rc.get(URL, "main"))
+        rc.put(URL, "main", SHA1, '"e1"')
+        entry = rc.get(URL, "main")
+        self.assertEqual(entry["commit"], SHA1)
+        self.assertEqual(entry["etag"], '"e1"')
+        self.assertIsNone(rc.get(URL, "dev"))
+
+    def test_ttl(self):
+        rc = RefCache(self._dir, ttl=60)
+        rc.put(URL, "main", SHA1)
+        entry = rc.get(URL, "main")
+        self.assertTrue(rc.is_fresh(entry))
+        entry["checked"] = time.time() - 120
+        self.assertFalse(rc.is_fresh(entry))
+        self.assertFalse(RefCache(self._dir).is_fresh(rc.get(URL, "main")))
+
+    def test_disabled_without_cache_dir(self):
+        self.assertIsNone(RefCache.open(None))
+        self.assertIsNotNone(RefCache.open(Cache(self._dir)))
+
+    def test_not_listed_as_package(self):
+        RefCache(self._dir).put(URL, "main", SHA1)
+        info = Cache(self._dir).get_cache_info()
+        self.assertEqual(info["packages"], [])
+
+
+class TestGitRefResolution(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp(prefix="ivpm-refcache-")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _resolve(self, responses, ttl=0.0, cache=True):
+        """Resolve 'main' in a fresh run; return (commit, request headers)."""
+        info = ProjectUpdateInfo(None, os.path.join(self._dir, "packages"))
+        info.ref_cache = RefCache(self._dir, ttl)
+        pkg = PackageGit("lib", url=URL, branch="main", cache=cache)
+        calls = []
+
+        def get(url, headers=None, **kw):
+            calls.append(dict(headers or {}))
+            return responses.pop(0)
+        with mock.patch.object(info.http, "get", get):
+            commit = pkg._resolve_ref("main", info)
+        return commit, calls
+
+    def test_etag_revalidation(self):
+        commit, calls = self._resolve([_Response(200, SHA1, '"e1"')])
+        self.assertEqual(commit, SHA1)
+        self.assertNotIn("If-None-Match", calls[0])
+
+        commit, calls = self._resolve([_Response(304)])
+        self.assertEqual(commit, SHA1)
+        self.assertEqual(calls[0]["If-None-Match"], '"e1"')
+
+    def test_changed_ref_updates_cache(self):
+        self._resolve([_Response(200, SHA1, '"e1"')])
+        commit, _ = self._resolve([_Response(200, SHA2, '"e2"')])
+        self.assertEqual(commit, SHA2)
+        self.assertEqual(RefCache(self._dir).get(URL, "main")["etag"], '"e2"')
+
+    def test_ttl_skips_network(self):
+        self._resolve([_Response(200, SHA1, '"e1"')])
+        commit, calls = self._resolve([], ttl=600)
+        self.assertEqual(commit, SHA1)
+        self.assertEqual(calls, [])
+
+    def test_only_cached_packages(self):
+        """Editable packages (cache unset or false) always ask the remote."""
+        self._resolve([_Response(200, SHA1, '"e1"')])
+        for cache in (None, False):
+            commit, calls = self._resolve(
+                [_Response(200, SHA2, '"e2"')], ttl=600, cache=cache)
+            self.assertEqual(commit, SHA2)
+            self.assertNotIn("If-None-Match", calls[0])
+        self.assertEqual(RefCache(self._dir).get(URL, "main")["commit"], SHA1)
+
+
+if __name__ == "__main__":
+    unittest.main()
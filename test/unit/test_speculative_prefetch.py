@@ -0,0 +1,166 @@
+"""
+Tests for speculative prefetch of locked packages: transitive git deps
+recorded in package-lock.json are fetched while their parents load, then
+adopted or discarded against the freshly resolved graph.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+from unittest import mock
+
+from ivpm.package_updater import PackageUpdater
+
+from .test_base import TestBase
+
+
+def _deps_yaml(name, deps):
+    body = "".join(
+        "        - name: %s\n"
+        "          url: file://%s\n"
+        "          src: git\n"
+        "%s" % (d, url, "          branch: %s\n" % branch if branch else "")
+        for d, url, branch in deps) or "        []\n"
+    return (
+        "package:\n"
+        "  name: %s\n"
+        "  dep-sets:\n"
+        "    - name: default\n"
+        "      deps:\n%s"
+        "    - name: default-dev\n"
+        "      deps:\n%s" % (name, body, body))
+
+
+class TestSpeculativePrefetch(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.src_dir = os.path.join(self.testdir, "src")
+        self.deps_dir = os.path.join(self.testdir, "packages")
+        # top -> mid -> leaf
+        self._mk_repo("leaf", [])
+        self._mk_repo("mid", [("leaf", None)])
+        self._mk_repo("top", [("mid", None)])
+        self.mkFile("ivpm.yaml", (
+            "package:\n"
+            "    name: spec\n"
+            "    dep-sets:\n"
+            "        - name: default-dev\n"
+            "          deps:\n"
+            "            - name: top\n"
+            "              url: file://%s\n"
+            "              src: git\n" % self._url("top")))
+
+    def _git(self, cwd, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test"]
+            + list(args), cwd=cwd).decode().strip()
+
+    def _url(self, name):
+        return os.path.join(self.src_dir, name)
+
+    def _write_yaml(self, name, deps):
+        deps = [(d, self._url(d), b) for d, b in deps]
+        with open(os.path.join(self._url(name), "ivpm.yaml"), "w") as fp:
+            fp.write(_deps_yaml(name, deps))
+
+    def _mk_repo(self, name, deps):
+        path = self._url(name)
+        os.makedirs(path)
+        self._git(path, "init", "-q", "-b", "main")
+        self._write_yaml(name, deps)
+        self._git(path, "add", "-A")
+        self._git(path, "commit", "-q", "-m", "init")
+
+    def _commit(self, name, msg):
+        self._git(self._url(name), "commit", "-q", "-a", "-m", msg)
+
+    def _update(self, **kw):
+        """Run an update; return the PackageUpdater it used."""
+        updaters = []
+
+        class _Capture(PackageUpdater):
+            def __init__(self, *a, **kw):
+                super().__init__(*a, **kw)
+                updaters.append(self)
+
+        with mock.patch("ivpm.project_ops.PackageUpdater", _Capture):
+            self.ivpm_update(skip_venv=True,
+                             args=argparse.Namespace(anonymous=True, **kw))
+        return updaters[0]
+
+    def _clear_packages(self):
+        for name in ("top", "mid", "leaf"):
+            path = os.path.join(self.deps_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def _lock(self):
+        with open(os.path.join(self.deps_dir, "package-lock.json")) as fp:
+            return json.load(fp)["packages"]
+
+    def test_no_prefetch_without_lock(self):
+        updater = self._update()
+        self.assertEqual(updater.prefetched, set())
+        self.assertEqual(self._lock()["leaf"]["resolved_by"], "mid")
+
+    def test_cold_workspace_prefetches_locked_deps(self):
+        self._update()
+        self._clear_packages()
+
+        updater = self._update()
+
+        self.assertEqual(updater.prefetched, {"mid", "leaf"})
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.deps_dir, "leaf", "ivpm.yaml")))
+        lock = self._lock()
+        self.assertEqual(lock["mid"]["resolved_by"], "top")
+        self.assertEqual(lock["leaf"]["resolved_by"], "mid")
+        self.assertEqual(
+            lock["leaf"]["commit_resolved"],
+            self._git(self._url("leaf"), "rev-parse", "HEAD"))
+
+    def test_changed_spec_is_discarded(self):
+        self._update()
+        self._clear_packages()
+
+        # top now asks for a different branch of mid
+        self._git(self._url("mid"), "checkout", "-q", "-b", "other")
+        with open(os.path.join(self._url("mid"), "marker"), "w") as fp:
+            fp.write("other")
+        self._git(self._url("mid"), "add", "marker")
+        self._commit("mid", "other")
+        self._git(self._url("mid"), "checkout", "-q", "main")
+        self._write_yaml("top", [("mid", "other")])
+        self._commit("top", "use mid/other")
+
+        updater = self._update()
+
+        self.assertNotIn("mid", updater.prefetched)
+        self.assertIn("leaf", updater.prefetched)
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.deps_dir, "mid", "marker")))
+        self.assertEqual(self._lock()["mid"]["branch"], "other")
+
+    def test_unneeded_prefetch_removed(self):
+        self._update()
+        self._clear_packages()
+
+        # top no longer depends on mid
+        self._write_yaml("top", [])
+        self._commit("top", "drop mid")
+
+        updater = self._update()
+
+        self.assertEqual(updater.prefetched, set())
+        self.assertFalse(os.path.lexists(os.path.join(self.deps_dir, "mid")))
+        self.assertFalse(os.path.lexists(os.path.join(self.deps_dir, "leaf")))
+        self.assertNotIn("mid", self._lock())
+
+    def test_existing_packages_not_prefetched(self):
+        self._update()
+
+        updater = self._update(verify=True)
+
+        self.assertEqual(updater.prefetched, set())
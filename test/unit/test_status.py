@@ -115,6 +115,90 @@ class TestStatus(TestBase):
         r = next(x for x in results if x.name == "branchpkg")
         self.assertEqual(r.branch, "feature-x")
 
+    def test_upstream_and_tag(self):
+        """Ahead/behind counts and the tag at HEAD are reported."""
+        packages_dir = self._make_project({})
+        origin = os.path.join(self.testdir, "origin")
+        _make_git_repo(origin, name="origin")
+        pkg_path = os.path.join(packages_dir, "uppkg")
+        _git(["clone", origin, pkg_path], self.testdir)
+        _git(["-c", "user.email=test@ivpm", "-c", "user.name=IVPM Test",
+              "commit", "--allow-empty", "-m", "local"], pkg_path)
+        _git(["tag", "v1.0"], pkg_path)
+        # The commit is abbreviated as git would
+        _git(["config", "core.abbrev", "10"], pkg_path)
+        with open(os.path.join(pkg_path, "new.txt"), "w") as f:
+            f.write("new\n")
+        _write_lock(packages_dir, {
+            "uppkg": {"src": "git", "resolved_by": "root", "dep_set": None,
+                      "url": "file://%s" % origin, "branch": "main",
+                      "reproducible": True}
+        })
+
+        import argparse
+        from ivpm.project_ops import ProjectOps
+        results = ProjectOps(self.testdir).status(args=argparse.Namespace(jobs=2))
+
+        r = next(x for x in results if x.name == "uppkg")
+        self.assertEqual((r.branch, r.tag), ("main", "v1.0"))
+        self.assertEqual(r.commit, subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=pkg_path, text=True).strip())
+        self.assertEqual(len(r.commit), 10)
+        self.assertEqual((r.ahead, r.behind), (1, 0))
+        self.assertEqual(r.untracked, ["?? new.txt"])
+        self.assertFalse(r.is_dirty)
+
+    def test_tag_chosen_like_describe(self):
+        """Of several tags at HEAD, the one 'git describe --tags' names is
+        reported: annotated over lightweight, then the newest."""
+        packages_dir = self._make_project({})
+        pkg_path = os.path.join(packages_dir, "tagpkg")
+        _make_git_repo(pkg_path, name="tagpkg")
+        _git(["tag", "a-light"], pkg_path)
+        for name, date in (("v0.9", "2020-01-01T00:00:00"),
+                           ("v1.0", "2022-01-01T00:00:00"),
+                           ("w-old", "2019-01-01T00:00:00")):
+            subprocess.check_call(
+                ["git", "tag", "-a", "-m", name, name], cwd=pkg_path,
+                env=dict(os.environ, GIT_COMMITTER_DATE=date),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _write_lock(packages_dir, {
+            "tagpkg": {"src": "git", "resolved_by": "root", "dep_set": None,
+                       "url": "file://%s" % pkg_path, "branch": "main",
+                       "reproducible": True}
+        })
+
+        from ivpm.project_ops import ProjectOps
+        results = ProjectOps(self.testdir).status()
+
+        r = next(x for x in results if x.name == "tagpkg")
+        self.assertEqual(r.tag, "v1.0")
+        self.assertEqual(r.tag, subprocess.check_output(
+            ["git", "describe", "--tags", "--exact-match"], cwd=pkg_path,
+            text=True).strip())
+
+    def test_porcelain_v2_parse(self):
+        """git status --porcelain=v2 output maps onto the v1 line format."""
+        from ivpm.pkg_types.package_git import _parse_status_v2
+        oid = "0123456789abcdef0123456789abcdef01234567"
+        st = _parse_status_v2("\n".join([
+            "# branch.oid " + oid,
+            "# branch.head (detached)",
+            "1 .M N... 100644 100644 100644 %s %s a file.txt" % (oid, oid),
+            "2 R. N... 100644 100644 100644 %s %s R100 new.txt\told.txt" % (oid, oid),
+            "? junk.log",
+        ]))
+        self.assertEqual(st["commit"], oid)
+        self.assertIsNone(st["branch"])
+        self.assertIsNone(st["ahead"])
+        self.assertEqual(st["modified"], [" M a file.txt", "R  old.txt -> new.txt"])
+        self.assertEqual(st["untracked"], ["?? junk.log"])
+
+        st = _parse_status_v2("# branch.oid (initial)\n# branch.head main\n"
+                              "# branch.upstream origin/main\n# branch.ab +0 -3\n")
+        self.assertEqual((st["commit"], st["branch"]), ("", "main"))
+        self.assertEqual((st["ahead"], st["behind"]), (0, 3))
+
     def test_non_git_pkg(self):
         """A dir-type package produces vcs='none' and does not crash."""
         packages_dir = self._make_project({})
@@ -0,0 +1,190 @@
+"""
+Tests for SubprocessRunner.run_async: output capture and streaming,
+timeouts, and termination of the child process on cancellation.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from ivpm.project_ops_info import ProjectUpdateInfo, UpdateCancelled
+from ivpm.subprocess_runner import SubprocessRunner, run_sync
+from ivpm.update_event import UpdateEventDispatcher, UpdateEventListener, UpdateEventType
+
+
+def _py(code):
+    return [sys.executable, "-c", code]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # Reaped by asyncio, so a zombie is not possible here
+    return True
+
+
+class TestRunAsync(unittest.TestCase):
+
+    def test_capture_and_stream(self):
+        lines = []
+        rc, out, err = asyncio.run(SubprocessRunner.run_async(
+            _py("import sys; print('a'); print('b'); print('e', file=sys.stderr)"),
+            on_output=lambda stream, line: lines.append((stream, line))))
+        self.assertEqual(rc, 0)
+        self.assertEqual(out, "a\nb\n")
+        self.assertEqual(err, "e\n")
+        self.assertEqual(
+            [l for l in lines if l[0] == "stdout"],
+            [("stdout", "a"), ("stdout", "b")])
+        self.assertIn(("stderr", "e"), lines)
+
+    def test_check_raises(self):
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            asyncio.run(SubprocessRunner.run_async(
+                _py("import sys; sys.exit(3)"), check=True))
+        self.assertEqual(cm.exception.returncode, 3)
+
+    def test_cwd(self):
+        d = os.path.realpath(os.path.dirname(__file__))
+        _, out, _ = asyncio.run(SubprocessRunner.run_async(
+            _py("import os; print(os.getcwd())"), cwd=d))
+        self.assertEqual(os.path.realpath(out.strip()), d)
+
+    def test_timeout_terminates(self):
+        t = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            asyncio.run(SubprocessRunner.run_async(
+                _py("import time; time.sleep(30)"), timeout=0.3))
+        self.assertLess(time.monotonic() - t, 10)
+
+    def test_cancel_terminates(self):
+        pids = []
+
+        async def run():
+            task = asyncio.ensure_future(SubprocessRunner.run_async(
+                _py("import os, time; print(os.getpid(), flush=True); time.sleep(30)"),
+                on_output=lambda s, l: pids.append(int(l))))
+            while not pids:
+                await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        self.assertEqual(len(pids), 1)
+        self.assertFalse(_alive(pids[0]))
+
+
+class TestRunSync(unittest.TestCase):
+
+    def test_inside_running_loop(self):
+        async def caller():
+            # A synchronous API used from async code
+            return run_sync(SubprocessRunner.run_async(_py("print('x')")))
+
+        self.assertEqual(asyncio.run(caller())[1], "x\n")
+
+
+class _Events(UpdateEventListener):
+
+    def __init__(self):
+        self.lines = []
+
+    def on_event(self, event):
+        if event.event_type == UpdateEventType.PACKAGE_OUTPUT:
+            self.lines.append((event.package_name, event.output))
+
+
+class TestUpdateSubprocess(unittest.TestCase):
+    """ProjectUpdateInfo.run_subprocess, as used by package fetches."""
+
+    def setUp(self):
+        self.events = _Events()
+        dispatcher = UpdateEventDispatcher()
+        dispatcher.add_listener(self.events)
+        self.info = ProjectUpdateInfo(None, "deps", event_dispatcher=dispatcher)
+
+    def test_output_to_events(self):
+        self.info._tls.package_name = "pkg"
+        r = self.info.run_subprocess(
+            _py("import sys; print('out'); print('err', file=sys.stderr)"),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.assertEqual(r.returncode, 0)
+        self.assertIsNone(r.stdout)
+        self.assertEqual(sorted(self.events.lines), [("pkg", "err"), ("pkg", "out")])
+
+        r = self.info.run_subprocess(_py("print('x')"), stdout=subprocess.PIPE)
+        self.assertEqual(r.stdout, "x\n")
+
+    def test_on_update_loop(self):
+        async def update():
+            self.info.loop = asyncio.get_running_loop()
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.info.run_subprocess, _py("print('x')"), None, subprocess.PIPE)
+
+        self.assertEqual(asyncio.run(update()).stdout, "x\n")
+
+    def test_cancel_terminates(self):
+        pids = []
+
+        async def update():
+            loop = asyncio.get_running_loop()
+            self.info.loop = loop
+            self.info._tls.package_name = "pkg"
+            fetch = loop.run_in_executor(None, self.info.run_subprocess, _py(
+                "import os, time; print(os.getpid(), flush=True); time.sleep(30)"),
+                None, subprocess.DEVNULL)
+            while not self.events.lines:
+                await asyncio.sleep(0.05)
+            pids.append(int(self.events.lines[0][1]))
+            threading.Thread(target=self.info.cancel).start()
+            with self.assertRaises(UpdateCancelled):
+                await fetch
+
+        t = time.monotonic()
+        asyncio.run(update())
+        self.assertLess(time.monotonic() - t, 10)
+        self.assertFalse(_alive(pids[0]))
+        with self.assertRaises(UpdateCancelled):
+            self.info.run_subprocess(_py("pass"))
+
+    def test_cancel_terminates_ls_remote(self):
+        """Resolving a ref lists the remote on the update's runner, so
+        cancelling the update stops a hanging ls-remote."""
+        with tempfile.TemporaryDirectory() as d:
+            pid_file = os.path.join(d, "pid")
+            git = os.path.join(d, "git")
+            with open(git, "w") as fp:
+                fp.write("#!/bin/sh\necho $$ > %s\nexec sleep 30\n" % pid_file)
+            os.chmod(git, 0o755)
+
+            async def update():
+                loop = asyncio.get_running_loop()
+                self.info.loop = loop
+                resolve = loop.run_in_executor(
+                    None, self.info.ref_resolver.resolve,
+                    "https://example.com/org/repo.git", "main")
+                while not os.path.isfile(pid_file) or os.path.getsize(pid_file) == 0:
+                    await asyncio.sleep(0.05)
+                threading.Thread(target=self.info.cancel).start()
+                with self.assertRaises(UpdateCancelled):
+                    await resolve
+
+            path = d + os.pathsep + os.environ.get("PATH", "")
+            with mock.patch.dict(os.environ, {"PATH": path}):
+                t = time.monotonic()
+                asyncio.run(update())
+            self.assertLess(time.monotonic() - t, 10)
+            with open(pid_file) as fp:
+                self.assertFalse(_alive(int(fp.read())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -191,6 +191,47 @@ class TestSyncOps(SyncTestBase):
         self.assertNotEqual(r.old_commit, r.new_commit)
         self.assertGreater(r.commits_behind or 0, 0)
 
+    def test_fetch_only_when_upstream_moved(self):
+        """Packages whose upstream branch has not moved are not fetched."""
+        from unittest import mock
+        from ivpm.subprocess_runner import SubprocessRunner
+
+        still = self._make_upstream("pkg_still")
+        moved = self._make_upstream("pkg_moved")
+        self._clone_pkg(still, "pkg_still")
+        self._clone_pkg(moved, "pkg_moved")
+        self._add_upstream_commit(moved)
+        self._setup_project({
+            "pkg_still": {"src": "git", "branch": self._branch_name(still)},
+            "pkg_moved": {"src": "git", "branch": self._branch_name(moved)},
+        })
+
+        fetched = []
+        run_async = SubprocessRunner.run_async
+
+        async def record(cmd, cwd=None, **kwargs):
+            if cmd[:2] == ["git", "fetch"]:
+                fetched.append(os.path.basename(cwd))
+            return await run_async(cmd, cwd=cwd, **kwargs)
+
+        with mock.patch.object(SubprocessRunner, "run_async", side_effect=record):
+            results = self._sync()
+        self.assertEqual(self._result(results, "pkg_still").outcome, SyncOutcome.UP_TO_DATE)
+        self.assertEqual(self._result(results, "pkg_moved").outcome, SyncOutcome.SYNCED)
+        self.assertEqual(fetched, ["pkg_moved"])
+
+    def test_merges_already_fetched_commits(self):
+        """Commits fetched earlier but not merged are still synced."""
+        upstream = self._make_upstream("pkg_fetched")
+        pkg_dir = self._clone_pkg(upstream, "pkg_fetched")
+        self._add_upstream_commit(upstream)
+        _git("fetch", "origin", cwd=pkg_dir)
+        self._setup_project({"pkg_fetched": {"src": "git", "branch": self._branch_name(upstream)}})
+
+        r = self._result(self._sync(), "pkg_fetched")
+        self.assertEqual(r.outcome, SyncOutcome.SYNCED)
+        self.assertEqual(r.commits_behind, 1)
+
     def test_synced_updates_lock_file(self):
         """After SYNCED, lock file commit_resolved should be updated."""
         upstream = self._make_upstream("pkg_lockupdate")
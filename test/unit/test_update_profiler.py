@@ -0,0 +1,119 @@
+"""
+Tests for the --profile-out update profiler.
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+
+from ivpm.project_ops_info import ProjectUpdateInfo
+from ivpm.update_event import UpdateEventDispatcher
+from ivpm.update_profiler import UpdateProfiler
+
+from .test_base import TestBase
+
+
+class TestUpdateProfiler(TestBase):
+
+    def _spans(self, trace):
+        return [e for e in trace["traceEvents"] if e["ph"] == "X"]
+
+    def test_phases_nest_in_worker_lanes(self):
+        dispatcher = UpdateEventDispatcher()
+        profiler = UpdateProfiler()
+        dispatcher.add_listener(profiler)
+        info = ProjectUpdateInfo(None, self.testdir, event_dispatcher=dispatcher)
+
+        # Both workers are alive at once, so their thread ids differ
+        both_started = threading.Barrier(2)
+
+        def load(name):
+            info.package_start(name, "git", "file:///" + name)
+            both_started.wait()
+            with info.phase("resolve", stage="net"):
+                pass
+            with info.phase("clone", stage="net"):
+                pass
+            info.package_complete(name)
+
+        threads = [
+            threading.Thread(target=load, args=("p%d" % i,), name="worker-%d" % i)
+            for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        trace = profiler.trace()
+        spans = self._spans(trace)
+        pkgs = {e["name"]: e for e in spans if e["cat"] == "package"}
+        self.assertEqual(set(pkgs.keys()), {"p0", "p1"})
+        self.assertNotEqual(pkgs["p0"]["tid"], pkgs["p1"]["tid"])
+
+        for e in spans:
+            if e["cat"] != "phase":
+                continue
+            parent = pkgs[e["args"]["package"]]
+            self.assertEqual(e["tid"], parent["tid"])
+            self.assertGreaterEqual(e["ts"], parent["ts"])
+            self.assertLessEqual(e["ts"] + e["dur"], parent["ts"] + parent["dur"])
+        self.assertEqual(4, sum(1 for e in spans if e["cat"] == "phase"))
+
+        lanes = {e["args"]["name"] for e in trace["traceEvents"]
+                 if e["name"] == "thread_name"}
+        self.assertEqual(lanes, {"worker-0", "worker-1"})
+
+    def test_failed_package_closes_open_phases(self):
+        dispatcher = UpdateEventDispatcher()
+        profiler = UpdateProfiler()
+        dispatcher.add_listener(profiler)
+        info = ProjectUpdateInfo(None, self.testdir, event_dispatcher=dispatcher)
+
+        info.package_start("bad")
+        try:
+            with info.phase("download"):
+                info.package_error("bad", "boom")
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+        spans = self._spans(profiler.trace())
+        pkg = [e for e in spans if e["cat"] == "package"]
+        self.assertEqual(1, len(pkg))
+        self.assertEqual(pkg[0]["args"]["error"], "boom")
+        self.assertEqual(1, sum(1 for e in spans if e["name"] == "download"))
+
+    def test_update_writes_profile(self):
+        src = os.path.join(self.testdir, "src", "leaf")
+        os.makedirs(src)
+        for cmd in (["init", "-q"], ["add", "-A"],
+                    ["-c", "user.email=t@example.com", "-c", "user.name=T",
+                     "commit", "-q", "--allow-empty", "-m", "init"]):
+            subprocess.check_call(["git"] + cmd, cwd=src)
+
+        self.mkFile("ivpm.yaml", """
+package:
+    name: prof
+    dep-sets:
+        - name: default-dev
+          deps:
+            - name: leaf
+              url: file://%s
+              src: git
+""" % src)
+
+        out = os.path.join(self.testdir, "profile.json")
+        self.ivpm_update(skip_venv=True, args=argparse.Namespace(
+            anonymous=True, profile_out=out))
+
+        with open(out) as fp:
+            trace = json.load(fp)
+        spans = self._spans(trace)
+        leaf = [e for e in spans if e["cat"] == "package" and e["name"] == "leaf"]
+        self.assertEqual(1, len(leaf))
+        phases = {e["name"] for e in spans
+                  if e["cat"] == "phase" and e.get("args", {}).get("package") == "leaf"}
+        self.assertIn("clone", phases)
+        self.assertIn("leaf-handlers", phases)
+        self.assertIn("root-handlers", {e["name"] for e in spans})
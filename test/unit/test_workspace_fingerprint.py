@@ -0,0 +1,107 @@
+"""
+Tests for the no-op ``ivpm update`` fast path driven by the workspace
+fingerprint stored in ivpm.json.
+"""
+import argparse
+import os
+import shutil
+from unittest import mock
+
+from .test_base import TestBase
+
+
+class TestWorkspaceFingerprint(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.mkFile("deps.yaml", """
+package:
+    dep-sets:
+        - name: default-dev
+          deps:
+            - name: leaf_proj1
+              url: file://${DATA_DIR}/leaf_proj1
+              src: dir
+""")
+        self.mkFile("ivpm.yaml", """
+package:
+    name: fp
+    include: [deps.yaml]
+""")
+
+    def _update(self, **kw):
+        args = argparse.Namespace(anonymous=True, **kw)
+        self.ivpm_update(skip_venv=True, args=args)
+
+    def _is_noop(self, **kw):
+        """Run an update; return True if it took the fast path."""
+        with mock.patch("ivpm.project_ops.PackageUpdater",
+                        side_effect=AssertionError("slow path")) as m:
+            try:
+                self._update(**kw)
+            except AssertionError:
+                pass
+            return not m.called
+
+    def test_second_update_is_noop(self):
+        self._update()
+        self.assertTrue(self._is_noop())
+
+    def test_yaml_change(self):
+        self._update()
+        with open(os.path.join(self.testdir, "ivpm.yaml"), "a") as fp:
+            fp.write("\n# edited\n")
+        self.assertFalse(self._is_noop())
+
+    def test_include_change(self):
+        self._update()
+        with open(os.path.join(self.testdir, "deps.yaml"), "a") as fp:
+            fp.write("\n# edited\n")
+        self.assertFalse(self._is_noop())
+
+    def test_removed_package_is_restored(self):
+        self._update()
+        pkg = os.path.join(self.testdir, "packages", "leaf_proj1")
+        if os.path.islink(pkg):
+            os.unlink(pkg)
+        else:
+            shutil.rmtree(pkg)
+        self.assertFalse(self._is_noop())
+
+        self._update()
+        self.assertTrue(os.path.exists(pkg))
+        self.assertTrue(self._is_noop())
+
+    def test_lock_change(self):
+        self._update()
+        with open(os.path.join(self.testdir, "packages", "package-lock.json"), "a") as fp:
+            fp.write("\n")
+        self.assertFalse(self._is_noop())
+
+    def test_args_change(self):
+        self._update()
+        self.assertFalse(self._is_noop(definitions=["X=1"]))
+
+    def test_verify_forces_slow_path(self):
+        self._update()
+        self.assertFalse(self._is_noop(verify=True))
+        # Ignored options don't defeat the fast path
+        self.assertTrue(self._is_noop(jobs=3))
+
+    def test_custom_deps_dir(self):
+        self.mkFile("ivpm.yaml", """
+package:
+    name: fp
+    deps-dir: deps
+    include: [deps.yaml]
+""")
+        self._update()
+        self.assertTrue(os.path.isfile(os.path.join(self.testdir, "deps", "ivpm.json")))
+        # Found without parsing ivpm.yaml
+        with mock.patch("ivpm.proj_info.ProjInfo.mkFromProj") as parse:
+            self.assertTrue(self._is_noop())
+        self.assertFalse(parse.called)
+
+        # Changes are looked for there too
+        os.unlink(os.path.join(self.testdir, "deps", "leaf_proj1"))
+        self.assertFalse(self._is_noop())